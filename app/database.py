@@ -1,27 +1,128 @@
-from sqlalchemy import create_engine
+import os
+import time
+from typing import Any, Callable
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from starlette.concurrency import run_in_threadpool
+from app.services.metrics import DB_QUERY_DURATION
 
-DATABASE_URL = "sqlite:///./beta_flow.db"
+# Use an async driver (sqlite+aiosqlite://, postgresql+asyncpg://) to get an async engine
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./beta_flow.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
-)
+def _engine_options(url: str, is_async: bool) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if parsed.database in (None, "", ":memory:"):
+            # An in-memory database only exists on its one connection
+            options["poolclass"] = StaticPool
+            return options
+    else:
+        options = {}
+    options.update(
+        poolclass=AsyncAdaptedQueuePool if is_async else QueuePool,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_pre_ping=True
+    )
+    return options
+
+USE_ASYNC_DB = make_url(DATABASE_URL).get_dialect().is_async
+
+if USE_ASYNC_DB:
+    async_engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL, True))
+    # Sync facade of the async engine, for event listeners
+    engine = async_engine.sync_engine
+    SessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL, False))
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _is_file_sqlite(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+# "production" enables WAL and tuned pragmas for file-backed SQLite; "default" leaves SQLite's defaults
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+
+SQLITE_PRAGMAS = {
+    # Readers no longer block on writers, and commits only append to the WAL
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative cache_size is in KiB
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY"
+}
+
+def apply_sqlite_profile(sqlite_engine):
+    """Set the production pragmas on every new connection of a file-backed SQLite engine"""
+    @event.listens_for(sqlite_engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+if SQLITE_PROFILE == "production" and _is_file_sqlite(DATABASE_URL):
+    apply_sqlite_profile(engine)
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+@event.listens_for(engine, "after_cursor_execute")
+def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    DB_QUERY_DURATION.observe(time.perf_counter() - context._query_started, operation=operation)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def init_db():
-    from app.models.workflow import Workflow, WorkflowStep
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+async def run_db(db, fn: Callable, *args, **kwargs) -> Any:
+    """Run sync ORM code `fn(session, *args)` without blocking the event loop.
+
+    Async sessions run it on their greenlet bridge; plain sessions run it in a worker thread.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+async def close_db(db):
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        db.close()
 
-def get_db():
+async def init_db():
+    """Create missing tables and apply pending migrations; existing data is kept"""
+    from app.migrations import migrate
+    if async_engine is not None:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(migrate)
+    else:
+        def migrate_sync():
+            with engine.begin() as conn:
+                migrate(conn)
+        await run_in_threadpool(migrate_sync)
+
+async def dispose_engine():
+    """Close pooled connections; async drivers keep a thread per connection alive until then"""
+    if async_engine is not None:
+        await async_engine.dispose()
+    else:
+        engine.dispose()
+
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await close_db(db)
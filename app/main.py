@@ -1,8 +1,9 @@
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import llm, workflow
-from app.database import engine, Base
+from app.routes import llm, metrics, workflow
+from app.database import init_db, dispose_engine
+from app.services.llm_service import get_llm_service
 
 # Configure logging
 logging.basicConfig(
@@ -11,9 +12,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="Beta Flow API",
     description="API for executing tasks using LLMs and managing workflows",
@@ -32,6 +30,19 @@ app.add_middleware(
 # Include routers
 app.include_router(llm.router, prefix="/api/v1")
 app.include_router(workflow.router, prefix="/api/v1")
+app.include_router(metrics.router)
+
+@app.on_event("startup")
+async def startup():
+    await init_db()
+    await workflow.run_service.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await workflow.run_service.stop()
+    workflow.workflow_service.actions.shutdown()
+    await get_llm_service().close()
+    await dispose_engine()
 
 @app.get("/health-check")
 async def health_check():
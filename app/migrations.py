@@ -0,0 +1,86 @@
+"""Non-destructive schema migrations.
+
+`Base.metadata.create_all` creates tables that do not exist yet, but never changes existing
+ones. Each migration below brings an older database up to date in place. Migrations must be
+idempotent because a fresh database already gets the current schema from `create_all`.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN "{column}" {ddl}'))
+
+def _create_index(conn: Connection, name: str, table: str, columns: List[str]):
+    existing = {index["name"] for index in inspect(conn).get_indexes(table)}
+    if name not in existing:
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({quoted})"))
+
+def _step_dependencies_and_versions(conn: Connection):
+    _add_column(conn, "workflows", "version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(conn, "workflow_steps", "depends_on", "JSON")
+    _add_column(conn, "workflow_steps", "policy", "JSON")
+
+def _step_lookup_indexes(conn: Connection):
+    _create_index(conn, "ix_workflow_steps_workflow_id_order", "workflow_steps", ["workflow_id", "order"])
+    _create_index(conn, "ix_step_runs_run_id_order", "step_runs", ["run_id", "order"])
+
+def _run_traces(conn: Connection):
+    _add_column(conn, "workflow_runs", "traced", "BOOLEAN DEFAULT FALSE")
+    _add_column(conn, "workflow_runs", "trace", "JSON")
+
+def _result_handles(conn: Connection):
+    _add_column(conn, "step_runs", "result_handle", "VARCHAR")
+    _add_column(conn, "step_runs", "result_size", "INTEGER")
+
+def _run_reuse(conn: Connection):
+    _add_column(conn, "workflow_runs", "reuse", "BOOLEAN DEFAULT FALSE")
+    _add_column(conn, "step_runs", "reused", "BOOLEAN DEFAULT FALSE")
+
+def _run_ownership(conn: Connection):
+    _add_column(conn, "workflow_runs", "owner", "VARCHAR")
+    _add_column(conn, "workflow_runs", "heartbeat_at", "TIMESTAMP")
+
+def _deadlines_and_cancellation(conn: Connection):
+    _add_column(conn, "workflows", "policy", "JSON")
+    _add_column(conn, "workflow_runs", "cancel_requested", "BOOLEAN DEFAULT FALSE")
+    _add_column(conn, "step_runs", "cancelled", "BOOLEAN DEFAULT FALSE")
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "step dependencies, step policies and workflow versions", _step_dependencies_and_versions),
+    (2, "composite indexes for loading steps in order", _step_lookup_indexes),
+    (3, "execution traces stored with runs", _run_traces),
+    (4, "large step results stored by handle", _result_handles),
+    (5, "runs that reuse checkpointed step results", _run_reuse),
+    (6, "run owners and heartbeats", _run_ownership),
+    (7, "workflow policies and run cancellation", _deadlines_and_cancellation),
+]
+
+def migrate(conn: Connection):
+    """Create missing tables, then apply every migration newer than the recorded schema version"""
+    from app.database import Base
+    from app.models.workflow import Workflow, WorkflowStep, WorkflowRun, StepRun, ResultBlob, StepCheckpoint
+
+    Base.metadata.create_all(bind=conn)
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP)"
+    ))
+    current = conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar() or 0
+
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        apply(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+            {"v": version, "d": description, "t": datetime.utcnow()}
+        )
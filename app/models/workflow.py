@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Boolean, Index
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 from app.database import Base
 
@@ -9,10 +9,16 @@ class Workflow(Base):
     id = Column(Integer, primary_key=True, index=True)
     workflow_name = Column(String, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    steps = relationship("WorkflowStep", back_populates="workflow")
+    version = Column(Integer, default=1, nullable=False)
+    # Run-level timeout and fail-fast settings
+    policy = Column(JSON, nullable=True)
+    steps = relationship("WorkflowStep", back_populates="workflow", order_by="WorkflowStep.order")
 
 class WorkflowStep(Base):
     __tablename__ = "workflow_steps"
+    __table_args__ = (
+        Index("ix_workflow_steps_workflow_id_order", "workflow_id", "order"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     workflow_id = Column(Integer, ForeignKey("workflows.id"))
@@ -21,5 +27,70 @@ class WorkflowStep(Base):
     parameters = Column(JSON)
     condition = Column(JSON)
     group = Column(String, nullable=True)
+    depends_on = Column(JSON, nullable=True)
+    policy = Column(JSON, nullable=True)
     order = Column(Integer)
     workflow = relationship("Workflow", back_populates="steps")
+
+class WorkflowRun(Base):
+    __tablename__ = "workflow_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    workflow_id = Column(Integer, ForeignKey("workflows.id"), index=True)
+    workflow_version = Column(Integer, nullable=True)
+    status = Column(String, default="queued", index=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Worker executing the run; a run whose heartbeat stops is requeued for another worker
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    # Set by the cancel endpoint; the owner notices on its next heartbeat
+    cancel_requested = Column(Boolean, default=False)
+    traced = Column(Boolean, default=False)
+    # Reuse checkpointed step results whose inputs have not changed
+    reuse = Column(Boolean, default=False)
+    # Chrome trace JSON, only loaded by the trace endpoint
+    trace = deferred(Column(JSON, nullable=True))
+    steps = relationship("StepRun", back_populates="run", order_by="StepRun.order")
+
+class StepRun(Base):
+    __tablename__ = "step_runs"
+    __table_args__ = (
+        Index("ix_step_runs_run_id_order", "run_id", "order"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("workflow_runs.id"))
+    step_name = Column(String)
+    order = Column(Integer)
+    result = Column(JSON, nullable=True)
+    # Set instead of `result` when the payload is kept in result_blobs
+    result_handle = Column(String, nullable=True)
+    result_size = Column(Integer, nullable=True)
+    reused = Column(Boolean, default=False)
+    skipped = Column(Boolean, default=False)
+    cancelled = Column(Boolean, default=False)
+    error = Column(Text, nullable=True)
+    run = relationship("WorkflowRun", back_populates="steps")
+
+class ResultBlob(Base):
+    """A large step result, stored once under its content hash"""
+    __tablename__ = "result_blobs"
+
+    handle = Column(String, primary_key=True)
+    value = Column(JSON)
+    size = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class StepCheckpoint(Base):
+    """The latest successful result of a step, keyed by a hash of everything that went into it"""
+    __tablename__ = "step_checkpoints"
+
+    workflow_id = Column(Integer, ForeignKey("workflows.id"), primary_key=True)
+    step_name = Column(String, primary_key=True)
+    input_hash = Column(String)
+    output_hash = Column(String)
+    result = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -1,20 +1,53 @@
 import logging
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import Dict, Optional
-from app.services.llm_service import LLMService
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Optional
+from app.services.llm_service import get_llm_service
+from app.services.streaming import EventSink, stream_events
+from app.services.template_engine import compile_template
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-llm_service = LLMService()
+llm_service = get_llm_service()
 
-class LLMRequest(BaseModel):
-    prompt: str = Field(..., description="The input prompt for the LLM")
+MAX_BATCH_ITEMS = 10000
+
+class LLMOptions(BaseModel):
     model: str = Field(default="gpt-4-turbo", description="The LLM model to use")
     parameters: Optional[Dict] = Field(
         default={"temperature": 0.7, "max_tokens": 1000},
         description="Additional parameters for the LLM"
     )
+    cache: bool = Field(default=True, description="Set to false to bypass the response cache")
+    cache_ttl: Optional[float] = Field(default=None, description="Cache lifetime in seconds for this response")
+    latency_slo: Optional[float] = Field(
+        default=None, gt=0, description="Seconds a call should take; used when `model` names a route"
+    )
+
+class LLMRequest(LLMOptions):
+    prompt: str = Field(..., description="The input prompt for the LLM")
+
+class LLMBatchRequest(LLMOptions):
+    prompts: Optional[List[str]] = Field(default=None, max_length=MAX_BATCH_ITEMS)
+    template: Optional[str] = Field(default=None, description="Prompt with {{name}} slots, filled from each of `inputs`")
+    inputs: Optional[List[Dict[str, str]]] = Field(default=None, max_length=MAX_BATCH_ITEMS)
+    concurrency: Optional[int] = Field(default=None, ge=1, description="Upper bound on calls in flight for this batch")
+
+    @model_validator(mode="after")
+    def check_source(self):
+        if self.prompts is not None:
+            if self.template is not None or self.inputs is not None:
+                raise ValueError("Provide either prompts, or template and inputs, not both")
+        elif self.template is None or self.inputs is None:
+            raise ValueError("Provide either prompts, or template and inputs")
+        return self
+
+    def render_prompts(self) -> List[str]:
+        if self.prompts is not None:
+            return self.prompts
+        template = compile_template(self.template)
+        return [template.render(values) for values in self.inputs]
 
 @router.post("/execute-llm")
 async def execute_llm(request: LLMRequest):
@@ -23,7 +56,10 @@ async def execute_llm(request: LLMRequest):
         result = await llm_service.execute(
             prompt=request.prompt,
             model=request.model,
-            parameters=request.parameters
+            parameters=request.parameters,
+            use_cache=request.cache,
+            cache_ttl=request.cache_ttl,
+            latency_slo=request.latency_slo
         )
         logger.info("LLM request completed successfully")
         return {"result": result}
@@ -33,3 +69,86 @@ async def execute_llm(request: LLMRequest):
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/execute-llm/stream")
+async def execute_llm_stream(request: LLMRequest):
+    """Stream the completion as `token` events followed by a `completed` event"""
+    logger.info(f"Received streaming LLM request with model: {request.model}")
+
+    async def run(sink: EventSink):
+        tokens = []
+        async for token in llm_service.stream(
+            prompt=request.prompt,
+            model=request.model,
+            parameters=request.parameters,
+            use_cache=request.cache,
+            cache_ttl=request.cache_ttl,
+            latency_slo=request.latency_slo
+        ):
+            tokens.append(token)
+            await sink("token", {"token": token})
+        return {"result": "".join(tokens)}
+
+    return StreamingResponse(
+        stream_events(run, "completed"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/execute-llm/batch")
+async def execute_llm_batch(request: LLMBatchRequest):
+    """Run many prompts with bounded concurrency; results come back in prompt order"""
+    prompts = request.render_prompts()
+    logger.info(f"Received LLM batch of {len(prompts)} prompts with model: {request.model}")
+    results = await llm_service.execute_batch(
+        prompts,
+        request.model,
+        parameters=request.parameters,
+        use_cache=request.cache,
+        cache_ttl=request.cache_ttl,
+        concurrency=request.concurrency,
+        latency_slo=request.latency_slo
+    )
+    return {"results": results}
+
+@router.post("/execute-llm/batch/stream")
+async def execute_llm_batch_stream(request: LLMBatchRequest):
+    """Stream a `result` event per prompt as it completes, then a `completed` event"""
+    prompts = request.render_prompts()
+    logger.info(f"Received streaming LLM batch of {len(prompts)} prompts with model: {request.model}")
+
+    async def run(sink: EventSink):
+        errors = 0
+        async for item in llm_service.iter_batch(
+            prompts,
+            request.model,
+            parameters=request.parameters,
+            use_cache=request.cache,
+            cache_ttl=request.cache_ttl,
+            concurrency=request.concurrency,
+            latency_slo=request.latency_slo
+        ):
+            errors += "error" in item
+            await sink("result", item)
+        return {"count": len(prompts), "errors": errors}
+
+    return StreamingResponse(
+        stream_events(run, "completed"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/llm-models/stats")
+async def llm_model_stats():
+    """Recent latency per model and the state of each routing policy"""
+    return llm_service.latency_stats()
+
+@router.get("/llm-cache/stats")
+async def llm_cache_stats():
+    return llm_service.cache_stats()
+
+@router.delete("/llm-cache")
+async def clear_llm_cache():
+    if llm_service.cache is not None:
+        llm_service.cache.clear()
+    return {"status": "cleared"}
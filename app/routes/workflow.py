@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas.workflow import WorkflowCreate, WorkflowResponse, WorkflowExecutionResult
+from app.database import get_db, run_db
+from app.schemas.workflow import (
+    WorkflowCreate, WorkflowResponse, WorkflowExecutionResult, WorkflowRunResponse,
+    WorkflowSummary, WorkflowFields, WorkflowBulkCreate
+)
+from app.services.checkpoints import CheckpointsDisabled
 from app.services.workflow_service import WorkflowService
-from typing import List
+from app.services.run_service import RunService, RunQueueFull
+from app.services.streaming import stream_events
+from typing import List, Optional, Union
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 workflow_service = WorkflowService()
+run_service = RunService(workflow_service)
 
 @router.post("/workflows", response_model=WorkflowResponse)
 async def create_workflow(workflow: WorkflowCreate, db: Session = Depends(get_db)):
@@ -19,6 +28,15 @@ async def create_workflow(workflow: WorkflowCreate, db: Session = Depends(get_db
         logger.error(f"Error creating workflow: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/workflows/bulk", response_model=List[WorkflowResponse])
+async def create_workflows(request: WorkflowBulkCreate, db: Session = Depends(get_db)):
+    try:
+        logger.info(f"Importing {len(request.workflows)} workflows")
+        return await workflow_service.create_workflows(db, request.workflows)
+    except Exception as e:
+        logger.error(f"Error importing workflows: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.put("/workflows/{workflow_id}", response_model=WorkflowResponse)
 async def update_workflow(workflow_id: int, workflow: WorkflowCreate, db: Session = Depends(get_db)):
     try:
@@ -31,29 +49,169 @@ async def update_workflow(workflow_id: int, workflow: WorkflowCreate, db: Sessio
         logger.error(f"Error updating workflow: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/workflows", response_model=List[WorkflowResponse])
-def list_workflows(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/workflows", response_model=Union[List[WorkflowResponse], List[WorkflowSummary]])
+async def list_workflows(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[int] = Query(default=None, description="Return workflows after this id (from X-Next-Cursor)"),
+    fields: WorkflowFields = WorkflowFields.FULL,
+    db: Session = Depends(get_db)
+):
     try:
-        return workflow_service.get_workflows(db, skip, limit)
+        workflows = await run_db(
+            db, workflow_service.get_workflows, skip, limit,
+            after_id=cursor, summary=fields == WorkflowFields.SUMMARY
+        )
+        if len(workflows) == limit:
+            response.headers["X-Next-Cursor"] = str(workflows[-1].id)
+        return workflows
     except Exception as e:
         logger.error(f"Error listing workflows: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/actions")
+async def list_actions():
+    """Registered step actions and where each one runs (loop, thread or process)"""
+    return workflow_service.actions.describe()
+
 @router.get("/workflows/{workflow_id}", response_model=WorkflowResponse)
-def get_workflow(workflow_id: int, db: Session = Depends(get_db)):
-    workflow = workflow_service.get_workflow(db, workflow_id)
+async def get_workflow(workflow_id: int, db: Session = Depends(get_db)):
+    workflow = await run_db(db, workflow_service.get_workflow, workflow_id)
     if workflow is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
     return workflow
 
+async def _cancel_on_disconnect(request: Request, cancel: asyncio.Event):
+    """Set `cancel` once the client goes away, so nobody pays for steps whose results nobody will read"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            cancel.set()
+            return
+
 @router.post("/workflows/{workflow_id}/execute", response_model=WorkflowExecutionResult)
-async def execute_workflow(workflow_id: int, db: Session = Depends(get_db)):
+async def execute_workflow(
+    workflow_id: int,
+    request: Request,
+    trace: bool = Query(default=False, description="Include a Chrome trace of the execution"),
+    reuse: bool = Query(default=False, description="Reuse checkpointed results of steps whose inputs are unchanged"),
+    db: Session = Depends(get_db)
+):
+    cancel = asyncio.Event()
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, cancel))
     try:
         logger.info(f"Executing workflow: {workflow_id}")
-        return await workflow_service.execute_workflow(db, workflow_id)
+        execution = await workflow_service.execute_workflow(
+            db, workflow_id, trace=trace, reuse=reuse, cancel=cancel
+        )
+        if execution["stopped"] == "cancelled":
+            logger.info(f"Client disconnected, stopped workflow {workflow_id}")
+        return execution
+    except CheckpointsDisabled as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         logger.error(f"Error executing workflow: {str(e)}")
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Unexpected error executing workflow: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        watcher.cancel()
+
+@router.post("/workflows/{workflow_id}/execute/stream")
+async def stream_workflow_execution(
+    workflow_id: int, tokens: bool = False, reuse: bool = False, db: Session = Depends(get_db)
+):
+    """Stream step_started/skipped/completed/error events (and LLM tokens when `tokens` is set)"""
+    if reuse:
+        try:
+            workflow_service.checkpoint_store.require()
+        except CheckpointsDisabled as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    # Also warms the plan cache, so the execution itself only checks the version
+    if await run_db(db, workflow_service.get_plan, workflow_id) is None:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+
+    logger.info(f"Streaming execution of workflow: {workflow_id}")
+    return StreamingResponse(
+        stream_events(
+            lambda sink: workflow_service.execute_workflow(
+                db, workflow_id, on_event=sink, stream_tokens=tokens, reuse=reuse
+            ),
+            "workflow_completed"
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/workflows/{workflow_id}/runs", response_model=WorkflowRunResponse, status_code=202)
+async def submit_workflow_run(
+    workflow_id: int,
+    trace: bool = Query(default=False, description="Record a trace, served by /runs/{run_id}/trace"),
+    reuse: bool = Query(default=False, description="Reuse checkpointed results of steps whose inputs are unchanged"),
+    db: Session = Depends(get_db)
+):
+    try:
+        logger.info(f"Queueing run for workflow: {workflow_id}")
+        return await run_service.submit(db, workflow_id, trace=trace, reuse=reuse)
+    except ValueError as e:
+        logger.error(f"Error queueing workflow run: {str(e)}")
+        raise HTTPException(status_code=404, detail=str(e))
+    except CheckpointsDisabled as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RunQueueFull as e:
+        logger.warning(f"Rejected workflow run: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/workflows/{workflow_id}/runs", response_model=List[WorkflowRunResponse])
+async def list_workflow_runs(workflow_id: int, limit: int = 20, db: Session = Depends(get_db)):
+    return await run_db(db, run_service.get_runs, workflow_id, limit)
+
+@router.get("/runs/{run_id}", response_model=WorkflowRunResponse)
+async def get_run(run_id: int, db: Session = Depends(get_db)):
+    run = await run_db(db, run_service.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+@router.post("/runs/{run_id}/resume", response_model=WorkflowRunResponse, status_code=202)
+async def resume_run(run_id: int, db: Session = Depends(get_db)):
+    """Queue a new run that recomputes only failed steps and steps whose inputs changed"""
+    try:
+        logger.info(f"Resuming run: {run_id}")
+        return await run_service.resume(db, run_id)
+    except ValueError as e:
+        logger.error(f"Error resuming workflow run: {str(e)}")
+        raise HTTPException(status_code=404, detail=str(e))
+    except CheckpointsDisabled as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RunQueueFull as e:
+        logger.warning(f"Rejected workflow run: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.post("/runs/{run_id}/cancel", response_model=WorkflowRunResponse, status_code=202)
+async def cancel_run(run_id: int, db: Session = Depends(get_db)):
+    """Cancel a queued or running run; in-flight steps, including their LLM calls, are stopped"""
+    try:
+        logger.info(f"Cancelling run: {run_id}")
+        return await run_service.cancel(db, run_id)
+    except ValueError as e:
+        logger.error(f"Error cancelling workflow run: {str(e)}")
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/runs/{run_id}/trace")
+async def get_run_trace(run_id: int, db: Session = Depends(get_db)):
+    """Chrome trace event JSON for a run submitted with `trace=true`; open it in Perfetto or chrome://tracing"""
+    trace = await run_db(db, run_service.get_trace, run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+@router.get("/results/{handle}")
+async def get_result(handle: str, db: Session = Depends(get_db)):
+    """The full value of a step result that was returned by handle"""
+    blob = await run_db(db, workflow_service.result_store.get, handle)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return {"handle": blob.handle, "size": blob.size, "value": blob.value}
@@ -1,18 +1,99 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, List, Dict, Optional, Union
 from datetime import datetime
 from enum import Enum
+import re
 
 class ConditionType(str, Enum):
     EQUALS = "equals"
     NOT_EQUALS = "not_equals"
     CONTAINS = "contains"
+    REGEX = "regex"
+    GT = "gt"
+    GTE = "gte"
+    LT = "lt"
+    LTE = "lte"
+    AND = "and"
+    OR = "or"
 
 class Condition(BaseModel):
     type: ConditionType
-    step_name: str
-    key: str = "result"
-    value: str
+    step_name: Optional[str] = None
+    key: str = Field(default="result", description="Path into the step's result record, e.g. result.score or result.items[0]")
+    value: Optional[Union[bool, int, float, str]] = None
+    conditions: Optional[List["Condition"]] = Field(default=None, description="Sub-conditions of and/or")
+
+    @model_validator(mode="after")
+    def check_operands(self):
+        if self.type in (ConditionType.AND, ConditionType.OR):
+            if not self.conditions:
+                raise ValueError(f"Condition {self.type.value} needs at least one sub-condition")
+            return self
+        if self.step_name is None or self.value is None:
+            raise ValueError(f"Condition {self.type.value} needs step_name and value")
+        if self.type == ConditionType.REGEX:
+            try:
+                re.compile(str(self.value))
+            except re.error as e:
+                raise ValueError(f"Invalid regex {self.value!r}: {e}")
+        elif self.type in (ConditionType.GT, ConditionType.GTE, ConditionType.LT, ConditionType.LTE):
+            if isinstance(self.value, bool):
+                raise ValueError(f"Condition {self.type.value} needs a numeric value")
+            try:
+                float(self.value)
+            except ValueError:
+                raise ValueError(f"Condition {self.type.value} needs a numeric value")
+        return self
+
+class RetryPolicy(BaseModel):
+    max_attempts: int = Field(default=3, ge=1, description="Total attempts, including the first")
+    initial_backoff: float = Field(default=0.5, ge=0, description="Seconds before the first retry")
+    max_backoff: float = Field(default=10.0, ge=0)
+    multiplier: float = Field(default=2.0, ge=1)
+    jitter: float = Field(default=0.5, ge=0, le=1, description="Fraction of each backoff that is randomized")
+    deadline: Optional[float] = Field(default=None, gt=0, description="Total seconds allowed across all attempts")
+
+class HedgePolicy(BaseModel):
+    delay: Optional[float] = Field(
+        default=None, gt=0, description="Seconds before a duplicate request; defaults to the model's observed latency quantile"
+    )
+    quantile: float = Field(default=0.95, gt=0, lt=1)
+    min_samples: int = Field(default=20, ge=1, description="Latency samples needed before the quantile is trusted")
+    max_hedges: int = Field(default=1, ge=1)
+
+class StepPolicy(BaseModel):
+    retry: Optional[RetryPolicy] = None
+    hedge: Optional[HedgePolicy] = None
+    timeout: Optional[float] = Field(
+        default=None, gt=0, description="Seconds the step may take, across retries and hedges, before it is cancelled"
+    )
+
+class WorkflowPolicy(BaseModel):
+    timeout: Optional[float] = Field(
+        default=None, gt=0, description="Seconds the whole run may take; unfinished steps are then cancelled"
+    )
+    fail_fast: Union[bool, List[str]] = Field(
+        default=False,
+        description="Cancel unfinished steps once a step fails: true for the whole run, or a list of step groups"
+    )
+
+class MapSplit(str, Enum):
+    AUTO = "auto"
+    JSON = "json"
+    LINES = "lines"
+
+class MapChildStep(BaseModel):
+    action: str
+    parameters: Dict = Field(default_factory=dict, description="Use {{item}} and {{index}} for the current item")
+    policy: Optional[StepPolicy] = None
+
+class MapParameters(BaseModel):
+    """Parameters of a `map` step: run `step` once per item of `items`"""
+    items: Union[str, List[Any]] = Field(..., description="Usually a {{Step}} reference to a JSON array or lines")
+    split: MapSplit = MapSplit.AUTO
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    on_error: str = Field(default="fail", pattern="^(fail|skip)$", description="skip records null for failed items")
+    step: MapChildStep
 
 class WorkflowStepBase(BaseModel):
     step_name: str
@@ -20,9 +101,24 @@ class WorkflowStepBase(BaseModel):
     parameters: Dict = Field(default_factory=dict)
     condition: Optional[Condition] = None
     group: Optional[str] = None
+    depends_on: Optional[List[str]] = None
+    policy: Optional[StepPolicy] = None
+
+LLM_OUTPUT_FORMATS = ("text", "json")
+
+def _positive_or_none(value) -> bool:
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0)
 
 class WorkflowStepCreate(WorkflowStepBase):
-    pass
+    @model_validator(mode="after")
+    def check_parameters(self):
+        if self.action == "map":
+            MapParameters(**self.parameters)
+        elif self.action == "llm-call" and self.parameters.get("output", "text") not in LLM_OUTPUT_FORMATS:
+            raise ValueError(f"llm-call output must be one of {', '.join(LLM_OUTPUT_FORMATS)}")
+        elif self.action == "llm-call" and not _positive_or_none(self.parameters.get("latency_slo")):
+            raise ValueError("llm-call latency_slo must be a positive number of seconds")
+        return self
 
 class WorkflowStepResponse(WorkflowStepBase):
     id: int
@@ -37,23 +133,108 @@ class WorkflowBase(BaseModel):
 
 class WorkflowCreate(WorkflowBase):
     steps: List[WorkflowStepCreate]
+    policy: Optional[WorkflowPolicy] = None
+
+    @model_validator(mode="after")
+    def check_dependencies(self):
+        if self.policy and isinstance(self.policy.fail_fast, list):
+            groups = {step.group for step in self.steps}
+            unknown = [group for group in self.policy.fail_fast if group not in groups]
+            if unknown:
+                raise ValueError(f"fail_fast names groups with no steps: {', '.join(unknown)}")
+        seen = set()
+        for step in self.steps:
+            if step.step_name in seen:
+                raise ValueError(f"Step name '{step.step_name}' is used more than once")
+            for name in step.depends_on or []:
+                if name not in seen:
+                    raise ValueError(
+                        f"Step '{step.step_name}' depends on '{name}', which is not an earlier step"
+                    )
+            seen.add(step.step_name)
+        return self
+
+class WorkflowBulkCreate(BaseModel):
+    workflows: List[WorkflowCreate] = Field(..., min_length=1)
 
 class WorkflowResponse(BaseModel):
     id: int
     workflow_name: str
+    version: int
     created_at: datetime
+    policy: Optional[WorkflowPolicy] = None
     steps: List[WorkflowStepResponse]
 
     class Config:
         from_attributes = True
 
+class WorkflowSummary(BaseModel):
+    id: int
+    workflow_name: str
+    version: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class WorkflowFields(str, Enum):
+    FULL = "full"
+    SUMMARY = "summary"
+
 class StepResult(BaseModel):
     step_name: str
-    result: str
+    result: Any = Field(default=None, description="Text, or a JSON object or list; null when stored by handle")
+    result_handle: Optional[str] = Field(default=None, description="Fetch a large result from /results/{handle}")
+    result_size: Optional[int] = None
+    reused: bool = Field(default=False, description="The result came from a checkpoint with the same inputs")
     skipped: bool = False
+    cancelled: bool = Field(default=False, description="The step was stopped by a timeout, cancellation or fail-fast")
     error: Optional[str] = None
 
 class WorkflowExecutionResult(BaseModel):
     workflow_id: int
     workflow_name: str
     results: List[StepResult]
+    stopped: Optional[str] = Field(
+        default=None, description="Why the run ended early: timeout, cancelled or fail_fast"
+    )
+    trace: Optional[Dict] = Field(default=None, description="Chrome trace event JSON, when requested")
+
+class RunStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class StepRunResponse(BaseModel):
+    step_name: str
+    order: int
+    result: Any = None
+    result_handle: Optional[str] = None
+    result_size: Optional[int] = None
+    reused: bool = False
+    skipped: bool = False
+    cancelled: bool = False
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class WorkflowRunResponse(BaseModel):
+    id: int
+    workflow_id: int
+    workflow_version: Optional[int] = None
+    status: RunStatus
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    traced: bool = False
+    reuse: bool = False
+    owner: Optional[str] = Field(default=None, description="Worker process executing the run")
+    cancel_requested: bool = False
+    steps: List[StepRunResponse] = Field(default_factory=list)
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,115 @@
+"""Registry of step actions and the executors they run on.
+
+An action handler takes the step's rendered parameters and returns its result. Each action
+declares where it runs:
+
+- `loop`: awaited on the event loop; for async handlers that mostly wait on I/O
+- `thread`: a plain function run in a thread pool; for blocking calls and light CPU work
+- `process`: a plain, picklable top-level function run in a process pool; for CPU-heavy work
+  that would otherwise hold the GIL and stall every concurrent request
+
+Plugins are registered through the `beta_flow.actions` entry point group. The entry point
+name is the action name and it points at a handler, optionally decorated with `@action(mode=...)`:
+
+    [project.entry-points."beta_flow.actions"]
+    summarize-table = "my_package.actions:summarize_table"
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from importlib.metadata import entry_points
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "beta_flow.actions"
+
+class ExecutionMode(str, Enum):
+    LOOP = "loop"
+    THREAD = "thread"
+    PROCESS = "process"
+
+class Action(NamedTuple):
+    name: str
+    handler: Callable
+    mode: ExecutionMode
+
+def action(mode: str = ExecutionMode.LOOP.value) -> Callable[[Callable], Callable]:
+    """Declare where a plugin handler runs: `@action(mode="process")`"""
+    def decorate(handler: Callable) -> Callable:
+        handler.execution_mode = ExecutionMode(mode)
+        return handler
+    return decorate
+
+class ActionRegistry:
+    """Maps action names to handlers and dispatches each call to the handler's executor"""
+
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None):
+        self.thread_workers = thread_workers or int(os.getenv("ACTION_THREAD_WORKERS", "8"))
+        self.process_workers = process_workers or int(os.getenv("ACTION_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+        # Forking a process that runs an event loop and threads is unsafe, so workers are spawned
+        self.process_start_method = os.getenv("ACTION_PROCESS_START_METHOD", "spawn")
+        self._actions: Dict[str, Action] = {}
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+    def register(self, name: str, handler: Callable, mode: Optional[str] = None):
+        mode = ExecutionMode(mode or getattr(handler, "execution_mode", ExecutionMode.LOOP))
+        if mode == ExecutionMode.LOOP and not asyncio.iscoroutinefunction(handler):
+            raise ValueError(f"Action {name} runs on the event loop, so its handler must be async")
+        if mode != ExecutionMode.LOOP and asyncio.iscoroutinefunction(handler):
+            raise ValueError(f"Action {name} runs in a {mode.value} pool, so its handler must not be async")
+        if name in self._actions:
+            logger.warning(f"Replacing handler for action {name}")
+        self._actions[name] = Action(name, handler, mode)
+
+    def load_entry_points(self, group: str = ENTRY_POINT_GROUP):
+        """Register every installed plugin; a plugin that fails to load is logged and skipped"""
+        for entry_point in entry_points(group=group):
+            try:
+                self.register(entry_point.name, entry_point.load())
+                logger.info(f"Loaded action {entry_point.name} from {entry_point.value}")
+            except Exception as e:
+                logger.error(f"Failed to load action {entry_point.name} from {entry_point.value}: {str(e)}")
+
+    def names(self) -> List[str]:
+        return sorted(self._actions)
+
+    def describe(self) -> List[Dict]:
+        return [{"name": a.name, "mode": a.mode.value} for _, a in sorted(self._actions.items())]
+
+    def get(self, name: str) -> Optional[Callable[[Dict], Awaitable[Any]]]:
+        """An async callable that runs the action on its executor, or None for unknown actions"""
+        registered = self._actions.get(name)
+        if registered is None:
+            return None
+        if registered.mode == ExecutionMode.LOOP:
+            return registered.handler
+        return functools.partial(self._run_in_pool, registered)
+
+    async def _run_in_pool(self, registered: Action, parameters: Dict) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(registered.mode), registered.handler, parameters)
+
+    def _executor(self, mode: ExecutionMode) -> Executor:
+        if mode == ExecutionMode.THREAD:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="action")
+            return self._thread_pool
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                self.process_workers, mp_context=multiprocessing.get_context(self.process_start_method)
+            )
+        return self._process_pool
+
+    def shutdown(self):
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
@@ -0,0 +1,72 @@
+"""Actions that ship with the app besides `llm-call` and `map`.
+
+Handlers here run in worker pools, so they are plain top-level functions that only take and
+return JSON values. Keep this module's imports light: process pool workers import it.
+"""
+import json
+from typing import Any, Dict, List
+from app.services.actions import action
+from app.services.conditions import MISSING, parse_path, resolve_path
+
+WHITESPACE = (" ", "\n", "\t")
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            raise ValueError("json-select input is not valid JSON")
+    return value
+
+@action(mode="thread")
+def json_select(parameters: Dict) -> Any:
+    """Select `path` from `input`, then keep only `fields` of each selected object"""
+    value = _decode(parameters.get("input"))
+    path = parameters.get("path")
+    if path:
+        value = resolve_path(value, parse_path(path))
+        if value is MISSING:
+            raise ValueError(f"Path {path} not found in json-select input")
+    fields = parameters.get("fields")
+    if fields:
+        project = lambda item: {field: item.get(field) for field in fields} if isinstance(item, dict) else item
+        value = [project(item) for item in value] if isinstance(value, list) else project(value)
+    return value
+
+@action(mode="process")
+def text_chunk(parameters: Dict) -> List[str]:
+    """Split `input` into chunks of at most `size` characters, breaking at whitespace, with `overlap`"""
+    text = str(parameters.get("input", ""))
+    size = int(parameters.get("size", 2000))
+    overlap = int(parameters.get("overlap", 200))
+    if size <= 0 or not 0 <= overlap < size:
+        raise ValueError("text-chunk needs size > 0 and 0 <= overlap < size")
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Prefer the last whitespace in the second half of the chunk
+            window = text[start:end]
+            boundary = max(window.rfind(separator) for separator in WHITESPACE)
+            if boundary > size // 2:
+                end = start + boundary
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        next_start = end - overlap
+        if overlap:
+            # Start the overlap at a word boundary
+            breaks = [i for i in (text.find(separator, next_start, end) for separator in WHITESPACE) if i >= 0]
+            if breaks:
+                next_start = min(breaks) + 1
+        start = max(next_start, start + 1)
+    return chunks
+
+BUILTIN_ACTIONS = {
+    "json-select": json_select,
+    "text-chunk": text_chunk
+}
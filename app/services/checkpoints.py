@@ -0,0 +1,103 @@
+import contextvars
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.workflow import StepCheckpoint
+from app.services.conditions import MISSING
+from app.services.result_store import content_hash
+
+logger = logging.getLogger(__name__)
+
+class RunCheckpoints:
+    """Checkpoint state of one workflow execution.
+
+    A step's input hash covers its action, its rendered parameters and the output hashes of
+    the steps it depends on, so it changes whenever anything the step reads changes. With
+    `reuse`, a step whose input hash matches its saved checkpoint returns the saved result.
+    """
+
+    def __init__(self, workflow_id: int, saved: Dict[str, Tuple[str, str, Any]], reuse: bool):
+        self.workflow_id = workflow_id
+        self.saved = saved
+        self.reuse = reuse
+        self.output_hashes: Dict[str, str] = {}
+        self.pending: Dict[str, Tuple[str, str, Any]] = {}
+        self.reused = 0
+
+    def input_hash(self, action: str, parameters: Dict, dependencies: Dict[str, Dict]) -> str:
+        upstream = {}
+        for name, record in dependencies.items():
+            if name in self.output_hashes:
+                upstream[name] = self.output_hashes[name]
+            else:
+                upstream[name] = "skipped" if record.get("skipped") else "error"
+        return content_hash({"action": action, "parameters": parameters, "upstream": upstream})
+
+    def lookup(self, step_name: str, input_hash: str) -> Any:
+        """The saved result for these inputs, or MISSING"""
+        saved = self.saved.get(step_name)
+        if not self.reuse or saved is None or saved[0] != input_hash:
+            return MISSING
+        self.output_hashes[step_name] = saved[1]
+        self.reused += 1
+        return saved[2]
+
+    def record(self, step_name: str, input_hash: str, result: Any):
+        output_hash = content_hash(result)
+        self.output_hashes[step_name] = output_hash
+        self.pending[step_name] = (input_hash, output_hash, result)
+
+class CheckpointsDisabled(Exception):
+    pass
+
+current_checkpoints: contextvars.ContextVar[Optional[RunCheckpoints]] = contextvars.ContextVar(
+    "current_checkpoints", default=None
+)
+
+class CheckpointStore:
+    """Persists the latest successful result of every step, one row per workflow step"""
+
+    def __init__(self):
+        self.enabled = os.getenv("WORKFLOW_CHECKPOINTS", "false").lower() == "true"
+
+    def require(self):
+        """Reject reuse while checkpointing is off, rather than silently recomputing every step"""
+        if not self.enabled:
+            raise CheckpointsDisabled("Checkpointing is disabled; set WORKFLOW_CHECKPOINTS=true to reuse step results")
+
+    def load(self, db: Session, workflow_id: int) -> Dict[str, Tuple[str, str, Any]]:
+        rows = db.query(StepCheckpoint).filter(StepCheckpoint.workflow_id == workflow_id).all()
+        return {row.step_name: (row.input_hash, row.output_hash, row.result) for row in rows}
+
+    def save(self, db: Session, checkpoints: RunCheckpoints):
+        """Write the checkpoints of newly computed steps in one transaction"""
+        if not checkpoints.pending:
+            return
+        existing = {
+            row.step_name: row
+            for row in db.query(StepCheckpoint)
+            .filter(
+                StepCheckpoint.workflow_id == checkpoints.workflow_id,
+                StepCheckpoint.step_name.in_(list(checkpoints.pending))
+            )
+        }
+        now = datetime.utcnow()
+        for step_name, (input_hash, output_hash, result) in checkpoints.pending.items():
+            row = existing.get(step_name)
+            if row is None:
+                row = StepCheckpoint(workflow_id=checkpoints.workflow_id, step_name=step_name)
+                db.add(row)
+            row.input_hash = input_hash
+            row.output_hash = output_hash
+            row.result = result
+            row.updated_at = now
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another run of the same workflow saved these steps first; its results are as good
+            db.rollback()
+            return
+        logger.info(f"Saved {len(checkpoints.pending)} step checkpoints for workflow {checkpoints.workflow_id}")
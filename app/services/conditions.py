@@ -0,0 +1,146 @@
+import json
+import operator
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+
+MISSING = object()
+PATH_SEGMENT_PATTERN = re.compile(r"[^.\[\]]+")
+NUMERIC_OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le
+}
+
+def parse_path(key: str) -> List[str]:
+    """Split a JSON path such as `result.items[0].name` (optionally prefixed with `$.`) into segments"""
+    if key.startswith("$"):
+        key = key[1:]
+    return PATH_SEGMENT_PATTERN.findall(key)
+
+def resolve_path(record: Dict, path: List[str]) -> Any:
+    """Walk `path` through a step result record, decoding JSON strings on the way; MISSING if absent"""
+    value: Any = record
+    for segment in path:
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return MISSING
+        if isinstance(value, dict):
+            value = value.get(segment, MISSING)
+        elif isinstance(value, list) and segment.isdigit() and int(segment) < len(value):
+            value = value[int(segment)]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _equals(actual: Any, expected: Any) -> bool:
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        return _number(actual) == expected
+    return actual == expected
+
+def _contains(actual: Any, expected: Any) -> bool:
+    try:
+        return expected in actual
+    except TypeError:
+        return False
+
+class Predicate(ABC):
+    """A compiled condition; `steps` are the step names it reads"""
+    __slots__ = ("steps",)
+
+    @abstractmethod
+    def evaluate(self, results: Dict[str, Dict]) -> bool:
+        pass
+
+class Comparison(Predicate):
+    __slots__ = ("step_name", "path", "test")
+
+    def __init__(self, step_name: str, path: List[str], test: Callable[[Any], bool]):
+        self.steps = [step_name]
+        self.step_name = step_name
+        self.path = path
+        self.test = test
+
+    def evaluate(self, results: Dict[str, Dict]) -> bool:
+        record = results.get(self.step_name)
+        if not record:
+            return False
+        value = resolve_path(record, self.path)
+        return value is not MISSING and self.test(value)
+
+class AllOf(Predicate):
+    __slots__ = ("predicates",)
+
+    def __init__(self, predicates: List[Predicate]):
+        self.predicates = predicates
+        self.steps = _merge_steps(predicates)
+
+    def evaluate(self, results: Dict[str, Dict]) -> bool:
+        return all(predicate.evaluate(results) for predicate in self.predicates)
+
+class AnyOf(Predicate):
+    __slots__ = ("predicates",)
+
+    def __init__(self, predicates: List[Predicate]):
+        self.predicates = predicates
+        self.steps = _merge_steps(predicates)
+
+    def evaluate(self, results: Dict[str, Dict]) -> bool:
+        return any(predicate.evaluate(results) for predicate in self.predicates)
+
+def _merge_steps(predicates: List[Predicate]) -> List[str]:
+    steps: List[str] = []
+    for predicate in predicates:
+        for name in predicate.steps:
+            if name not in steps:
+                steps.append(name)
+    return steps
+
+def _comparison_test(condition_type: str, expected: Any) -> Callable[[Any], bool]:
+    if condition_type == "equals":
+        return lambda value: _equals(value, expected)
+    if condition_type == "not_equals":
+        return lambda value: not _equals(value, expected)
+    if condition_type == "contains":
+        return lambda value: _contains(value, expected)
+    if condition_type == "regex":
+        pattern = re.compile(str(expected))
+        return lambda value: isinstance(value, str) and pattern.search(value) is not None
+    if condition_type in NUMERIC_OPERATORS:
+        compare = NUMERIC_OPERATORS[condition_type]
+        bound = _number(expected)
+        if bound is None:
+            raise ValueError(f"Condition {condition_type} needs a numeric value, got {expected!r}")
+
+        def test(value: Any) -> bool:
+            number = _number(value)
+            return number is not None and compare(number, bound)
+        return test
+    raise ValueError(f"Unsupported condition type: {condition_type}")
+
+def compile_condition(condition: Optional[Dict]) -> Optional[Predicate]:
+    """Compile a stored condition (a dict shaped like schemas.Condition) into a predicate"""
+    if not condition:
+        return None
+    condition_type = condition["type"]
+    if condition_type in ("and", "or"):
+        predicates = [compile_condition(child) for child in condition.get("conditions") or []]
+        return AllOf(predicates) if condition_type == "and" else AnyOf(predicates)
+    return Comparison(
+        condition["step_name"],
+        parse_path(condition.get("key") or "result"),
+        _comparison_test(condition_type, condition.get("value"))
+    )
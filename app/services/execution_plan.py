@@ -0,0 +1,69 @@
+"""Execution plans: everything about a workflow version that stays the same from run to run.
+
+A plan holds the steps in order, with dependencies resolved and templates, conditions and
+policies parsed. Plans are immutable and cached per workflow. Before a cached plan is used,
+the workflow's stored version is checked, so edits made by any process are picked up.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+from app.schemas.workflow import StepPolicy, WorkflowPolicy
+from app.services.conditions import Predicate
+from app.services.metrics import WORKFLOW_PLAN_CACHE_LOOKUPS
+from app.services.template_engine import CompiledParameters
+
+class PlannedStep(NamedTuple):
+    step_name: str
+    action: str
+    group: Optional[str]
+    parameters: CompiledParameters
+    condition: Optional[Predicate]
+    policy: Optional[StepPolicy]
+    dependencies: Tuple[str, ...]
+    # Dependencies whose skipping skips this step
+    prune_on: Tuple[str, ...]
+
+class ExecutionPlan(NamedTuple):
+    workflow_id: int
+    version: int
+    # SQLite can reuse ids, so the creation time tells a recreated workflow apart
+    created_at: Optional[datetime]
+    workflow_name: str
+    policy: WorkflowPolicy
+    steps: Tuple[PlannedStep, ...]
+
+class PlanCache:
+    """LRU of the latest execution plan of each workflow"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("WORKFLOW_PLAN_CACHE_SIZE", "256"))
+        self._plans: "OrderedDict[int, ExecutionPlan]" = OrderedDict()
+        # Sync database sessions build plans on threadpool threads
+        self._lock = threading.Lock()
+
+    def get(self, workflow_id: int, version: int, created_at: Optional[datetime]) -> Optional[ExecutionPlan]:
+        """The cached plan, if it was built from this version of the workflow"""
+        with self._lock:
+            plan = self._plans.get(workflow_id)
+            if plan is None or plan.version != version or plan.created_at != created_at:
+                WORKFLOW_PLAN_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._plans.move_to_end(workflow_id)
+        WORKFLOW_PLAN_CACHE_LOOKUPS.inc(result="hit")
+        return plan
+
+    def put(self, plan: ExecutionPlan):
+        with self._lock:
+            self._plans[plan.workflow_id] = plan
+            self._plans.move_to_end(plan.workflow_id)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+
+    def invalidate(self, workflow_id: int):
+        with self._lock:
+            self._plans.pop(workflow_id, None)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._plans), "max_entries": self.max_entries}
@@ -0,0 +1,37 @@
+import math
+from collections import deque
+from typing import Deque, Dict, Optional
+
+class LatencyTracker:
+    """Rolling window of recent call latencies per key (usually the model name)"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, key: str, seconds: float):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def count(self, key: str) -> int:
+        return len(self._samples.get(key, ()))
+
+    def quantile(self, key: str, q: float, min_samples: int = 1) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            key: {
+                "count": len(samples),
+                "p50": self.quantile(key, 0.5),
+                "p95": self.quantile(key, 0.95)
+            }
+            for key, samples in sorted(self._samples.items())
+        }
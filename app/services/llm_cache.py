@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.services.metrics import LLM_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Parameters that do not change what the model generates
+NON_DETERMINISTIC_KEYS = {"user", "stream", "timeout"}
+
+class LLMCache:
+    """Two-tier response cache: an in-memory LRU in front of an optional SQLite file"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 86400,
+        path: Optional[str] = None,
+        max_persistent_entries: int = 10000
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_persistent_entries = max_persistent_entries
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)"
+            )
+            self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMCache"]:
+        if os.getenv("LLM_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+            path=os.getenv("LLM_CACHE_PATH") or None,
+            max_persistent_entries=int(os.getenv("LLM_CACHE_MAX_PERSISTENT_ENTRIES", "10000"))
+        )
+
+    @staticmethod
+    def make_key(model: str, prompt: str, parameters: Optional[Dict]) -> str:
+        deterministic = {
+            key: value for key, value in (parameters or {}).items()
+            if key not in NON_DETERMINISTIC_KEYS
+        }
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "parameters": deterministic},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                LLM_CACHE_LOOKUPS.inc(result="memory")
+                return value
+            del self._memory[key]
+
+        if self._conn is not None:
+            row = await asyncio.to_thread(self._persistent_get, key, now)
+            if row is not None:
+                expires_at, value = row
+                self._remember(key, value, expires_at)
+                self.persistent_hits += 1
+                LLM_CACHE_LOOKUPS.inc(result="persistent")
+                return value
+
+        self.misses += 1
+        LLM_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember(key, value, expires_at)
+        if self._conn is not None:
+            await asyncio.to_thread(self._persistent_set, key, value, expires_at)
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _persistent_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, value FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def _persistent_set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            # Evict least recently used entries beyond the size cap
+            cursor = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_persistent_entries,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+            self._conn.commit()
+
+    def clear(self):
+        self._memory.clear()
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+    def stats(self) -> Dict:
+        hits = self.memory_hits + self.persistent_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": True,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "persistent": self._conn is not None
+        }
@@ -1,33 +1,379 @@
-import openai
+import asyncio
+import httpx
+import json
 import os
 import logging
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+from app.services.latency import LatencyTracker
+from app.services.llm_cache import LLMCache
+from app.services.metrics import LLM_DURATION, LLM_REQUESTS, LLM_TOKENS
+from app.services.model_router import ModelRouter
+from app.services.rate_limiter import AdmissionController, estimate_tokens
+from app.services.resilience import iter_bounded
+from app.services.shared_state import SharedState, get_shared_state, worker_id
+from app.services.tokens import count_tokens
+from app.services.tracing import record_llm_call
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "gpt-4-turbo"
+DEFAULT_PARAMETERS = {"temperature": 0.7, "max_tokens": 1000}
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class TransientLLMError(ValueError):
+    """Provider failure that is worth retrying: timeouts, connection errors, 429 and 5xx responses"""
+
+class _Flight:
+    """One upstream call shared by every identical request made while it is in flight"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
 class LLMService:
-    def __init__(self):
+    def __init__(
+        self,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cache: Optional[LLMCache] = None,
+        admission: Optional[AdmissionController] = None,
+        shared_state: Optional[SharedState] = None,
+        router: Optional[ModelRouter] = None
+    ):
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             logger.warning("OPENAI_API_KEY not found in environment variables")
 
-    async def execute(self, prompt: str, model: str = "gpt-4-turbo", parameters: dict = None) -> str:
-        if not self.api_key:
-            raise ValueError("OpenAI API key not configured")
+        self.base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+        )
+        self.timeout = httpx.Timeout(
+            float(os.getenv("LLM_READ_TIMEOUT", "120")),
+            connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+            pool=float(os.getenv("LLM_POOL_TIMEOUT", "30"))
+        )
+        self._transport = transport
+        self.cache = cache if cache is not None else LLMCache.from_env()
+        self.admission = admission if admission is not None else AdmissionController.from_env()
+        self.latency = LatencyTracker(window=int(os.getenv("LLM_LATENCY_WINDOW", "200")))
+        # Route names given as the model are resolved to a concrete model per call
+        self.router = router if router is not None else ModelRouter.from_env(self.latency)
+        self.coalesce = os.getenv("LLM_COALESCE", "true").lower() in ("1", "true", "yes")
+        self.batch_concurrency = int(os.getenv("LLM_BATCH_CONCURRENCY", "16"))
+        self._flights: Dict[str, _Flight] = {}
+        # Identical calls from other workers wait for this one through the shared state
+        self.shared_state = shared_state if shared_state is not None else get_shared_state()
+        self.shared_lease = float(os.getenv("LLM_SHARED_LEASE", "120"))
+        self.shared_result_ttl = float(os.getenv("LLM_SHARED_RESULT_TTL", "5"))
+        self.shared_poll_interval = float(os.getenv("LLM_SHARED_POLL_INTERVAL", "0.05"))
+        self.worker_id = worker_id()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
 
-        openai.api_key = self.api_key
-        
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client, creating it on first use in the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # Pooled connections are bound to the loop that opened them
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self._transport
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    def latency_stats(self) -> Dict:
+        return {
+            "models": self.latency.stats(),
+            "routes": self.router.stats()
+        }
+
+    def cache_stats(self) -> Dict:
+        if self.cache is None:
+            return {"enabled": False}
+        return self.cache.stats()
+
+    async def execute(
+        self,
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        parameters: dict = None,
+        use_cache: bool = True,
+        cache_ttl: Optional[float] = None,
+        coalesce: bool = True,
+        latency_slo: Optional[float] = None
+    ) -> str:
         if parameters is None:
-            parameters = {"temperature": 0.7, "max_tokens": 1000}
+            parameters = dict(DEFAULT_PARAMETERS)
+        model = self.router.resolve(model, prompt, latency_slo)
+        if not (use_cache and coalesce and self.coalesce):
+            return await self._execute(prompt, model, parameters, use_cache, cache_ttl)
+
+        # Identical requests share one in-flight call; `use_cache=False` opts out of both
+        key = LLMCache.make_key(model, prompt, parameters)
+        flight = self._flights.get(key)
+        if flight is None or flight.task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._execute(prompt, model, parameters, use_cache, cache_ttl, key))
+            flight = self._flights[key] = _Flight(task)
+            task.add_done_callback(lambda _: self._land(key, flight))
+        else:
+            LLM_REQUESTS.inc(model=model, status="coalesced")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _land(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Retrieve the outcome so an error nobody waited for is not reported as unhandled
+            flight.task.exception()
+
+    async def _execute(
+        self,
+        prompt: str,
+        model: str,
+        parameters: dict,
+        use_cache: bool,
+        cache_ttl: Optional[float],
+        flight_key: Optional[str] = None
+    ) -> str:
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = LLMCache.make_key(model, prompt, parameters)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"LLM cache hit for model: {model}")
+                LLM_REQUESTS.inc(model=model, status="cached")
+                return cached
+
+        lease_token = None
+        if flight_key is not None and self.shared_state.shared:
+            token = f"{self.worker_id}:{uuid.uuid4().hex}"
+            shared_result = await self._join_shared_flight(flight_key, token, model)
+            if shared_result is not None:
+                return shared_result
+            lease_token = token
+
+        try:
+            async with self.admission.admit(model, estimate_tokens(prompt, parameters)):
+                result = await self._complete(prompt, model, parameters)
+            if lease_token is not None:
+                # Only waiters that saw this lease know the key; it outlives the lease just long
+                # enough for them to pick it up
+                await self._shared_call(
+                    self.shared_state.set, f"llm:result:{flight_key}:{lease_token}", result, self.shared_result_ttl
+                )
+        finally:
+            if lease_token is not None:
+                await self._shared_call(
+                    self.shared_state.delete, f"llm:flight:{flight_key}", only_if_value=lease_token
+                )
+        if cache_key is not None:
+            await self.cache.set(cache_key, result, cache_ttl)
+        return result
+
+    async def _shared_call(self, operation, *args, **kwargs):
+        try:
+            return await operation(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"Shared state unavailable, continuing without it: {str(e)}")
+            return None
+
+    async def _join_shared_flight(self, key: str, token: str, model: str) -> Optional[str]:
+        """The result of an identical call another worker has in flight, or None once `token` holds the lease"""
+        lease_key = f"llm:flight:{key}"
+        deadline = time.monotonic() + self.shared_lease
+        holder = None
+        while True:
+            current = await self._shared_call(self.shared_state.get, lease_key)
+            if current is None:
+                if holder is not None:
+                    # The flight this worker joined has landed; its result is kept under its lease token
+                    result = await self._shared_call(self.shared_state.get, f"llm:result:{key}:{holder}")
+                    if result is not None:
+                        LLM_REQUESTS.inc(model=model, status="coalesced")
+                        return result
+                claimed = await self._shared_call(
+                    self.shared_state.set, lease_key, token, self.shared_lease, only_if_absent=True
+                )
+                if claimed is None or claimed:
+                    # Backend unreachable, or this worker now owns the call
+                    return None
+            elif time.monotonic() > deadline:
+                # The owner went away without finishing
+                return None
+            else:
+                holder = current
+            await asyncio.sleep(self.shared_poll_interval)
+
+    async def iter_batch(
+        self,
+        prompts: List[str],
+        model: str = DEFAULT_MODEL,
+        parameters: dict = None,
+        use_cache: bool = True,
+        cache_ttl: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        latency_slo: Optional[float] = None
+    ) -> AsyncIterator[Dict]:
+        """Run many prompts on a bounded pool of workers, yielding {index, result|error} as each completes"""
+        concurrency = min(concurrency or self.batch_concurrency, self.batch_concurrency)
+
+        async def call(index: int, prompt: str) -> str:
+            return await self.execute(
+                prompt, model, parameters, use_cache=use_cache, cache_ttl=cache_ttl, latency_slo=latency_slo
+            )
+
+        outcomes = iter_bounded(prompts, call, concurrency)
+        try:
+            async for index, result, error in outcomes:
+                if error is not None:
+                    yield {"index": index, "error": str(error)}
+                else:
+                    yield {"index": index, "result": result}
+        finally:
+            await outcomes.aclose()
+
+    async def execute_batch(self, prompts: List[str], model: str = DEFAULT_MODEL, **kwargs) -> List[Dict]:
+        """Like iter_batch, but returns the items in prompt order"""
+        ordered: List[Optional[Dict]] = [None] * len(prompts)
+        async for item in self.iter_batch(prompts, model, **kwargs):
+            ordered[item["index"]] = item
+        return ordered
+
+    async def stream(
+        self,
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        parameters: dict = None,
+        use_cache: bool = True,
+        cache_ttl: Optional[float] = None,
+        latency_slo: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Yield response tokens as the provider produces them; cache hits arrive as one chunk"""
+        if parameters is None:
+            parameters = dict(DEFAULT_PARAMETERS)
+        model = self.router.resolve(model, prompt, latency_slo)
+
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = LLMCache.make_key(model, prompt, parameters)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"LLM cache hit for model: {model}")
+                LLM_REQUESTS.inc(model=model, status="cached")
+                yield cached
+                return
+
+        tokens = []
+        async with self.admission.admit(model, estimate_tokens(prompt, parameters)):
+            async for token in self._stream_completion(prompt, model, parameters):
+                tokens.append(token)
+                yield token
+        if cache_key is not None:
+            await self.cache.set(cache_key, "".join(tokens), cache_ttl)
+
+    def _request_body(self, prompt: str, model: str, parameters: dict) -> Dict:
+        return {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            **parameters
+        }
+
+    def _record_call(self, model: str, seconds: float, prompt: str, usage: Optional[Dict], completion: str):
+        """Record latency and token counts, estimating tokens when the provider reports no usage"""
+        self.latency.observe(model, seconds)
+        LLM_DURATION.observe(seconds, model=model)
+        LLM_REQUESTS.inc(model=model, status="ok")
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens") or count_tokens(prompt, model)
+        completion_tokens = usage.get("completion_tokens") or count_tokens(completion, model)
+        LLM_TOKENS.inc(prompt_tokens, model=model, direction="in")
+        LLM_TOKENS.inc(completion_tokens, model=model, direction="out")
+        record_llm_call(model, seconds, prompt_tokens, completion_tokens)
+
+    def _provider_error(self, e: Exception, model: str) -> ValueError:
+        logger.error(f"OpenAI API error: {str(e)}")
+        LLM_REQUESTS.inc(model=model, status="error")
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in TRANSIENT_STATUS_CODES:
+            return TransientLLMError(f"OpenAI API error: {str(e)}")
+        if isinstance(e, httpx.TransportError):
+            return TransientLLMError(f"OpenAI API error: {str(e)}")
+        return ValueError(f"OpenAI API error: {str(e)}")
+
+    async def _complete(self, prompt: str, model: str, parameters: dict) -> str:
+        if not self.api_key:
+            raise ValueError("OpenAI API key not configured")
 
         try:
             logger.info(f"Making OpenAI API request with model: {model}")
-            response = openai.ChatCompletion.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                **parameters
+            started = time.monotonic()
+            response = await self._get_client().post(
+                "/chat/completions", json=self._request_body(prompt, model, parameters)
             )
+            response.raise_for_status()
+            payload = response.json()
+            content = payload["choices"][0]["message"]["content"]
+            self._record_call(model, time.monotonic() - started, prompt, payload.get("usage"), content)
             logger.info("OpenAI API request completed successfully")
-            return response["choices"][0]["message"]["content"]
+            return content
         except Exception as e:
-            logger.error(f"OpenAI API error: {str(e)}")
-            raise ValueError(f"OpenAI API error: {str(e)}")
+            raise self._provider_error(e, model)
+
+    async def _stream_completion(self, prompt: str, model: str, parameters: dict) -> AsyncIterator[str]:
+        if not self.api_key:
+            raise ValueError("OpenAI API key not configured")
+
+        body = self._request_body(prompt, model, parameters)
+        body["stream"] = True
+        completion = []
+        try:
+            logger.info(f"Making streaming OpenAI API request with model: {model}")
+            started = time.monotonic()
+            async with self._get_client().stream("POST", "/chat/completions", json=body) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        completion.append(delta)
+                        yield delta
+            self._record_call(model, time.monotonic() - started, prompt, None, "".join(completion))
+            logger.info("Streaming OpenAI API request completed successfully")
+        except Exception as e:
+            raise self._provider_error(e, model)
+
+_llm_service: Optional[LLMService] = None
+
+def get_llm_service() -> LLMService:
+    """Process-wide LLMService so every caller shares one connection pool"""
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
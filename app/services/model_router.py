@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+from typing import Dict, List, NamedTuple, Optional
+from app.services.latency import LatencyTracker
+from app.services.metrics import LLM_ROUTE_DECISIONS
+from app.services.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+class RouteCandidate(NamedTuple):
+    model: str
+    max_prompt_tokens: Optional[int] = None
+
+class Route(NamedTuple):
+    """Candidates in order of preference, usually cheapest first"""
+    name: str
+    candidates: List[RouteCandidate]
+    latency_slo: Optional[float] = None
+    quantile: float = 0.95
+    min_samples: int = 20
+
+class RouteDecision(NamedTuple):
+    model: str
+    reason: str
+    prompt_tokens: int
+
+class ModelRouter:
+    """Picks a concrete model for calls that name a route instead of a model.
+
+    The first candidate whose prompt limit fits the prompt and whose observed latency quantile
+    is within the latency SLO wins. Models without enough samples count as healthy. When every
+    fitting candidate is over the SLO, the one with the lowest observed latency is used.
+    Prompt sizes are counted locally, so routing adds no provider round trip.
+    """
+
+    def __init__(self, routes: Dict[str, Route], latency: LatencyTracker):
+        self.routes = routes
+        self.latency = latency
+
+    @classmethod
+    def from_env(cls, latency: LatencyTracker) -> "ModelRouter":
+        return cls(cls.parse_routes(json.loads(os.getenv("LLM_ROUTES", "{}"))), latency)
+
+    @staticmethod
+    def parse_routes(config: Dict[str, Dict]) -> Dict[str, Route]:
+        routes = {}
+        for name, route in config.items():
+            candidates = [
+                RouteCandidate(candidate["model"], candidate.get("max_prompt_tokens"))
+                for candidate in route.get("candidates", [])
+            ]
+            if not candidates:
+                raise ValueError(f"Route {name} has no candidate models")
+            routes[name] = Route(
+                name,
+                candidates,
+                latency_slo=route.get("latency_slo"),
+                quantile=float(route.get("quantile", 0.95)),
+                min_samples=int(route.get("min_samples", 20))
+            )
+        return routes
+
+    def is_route(self, model: str) -> bool:
+        return model in self.routes
+
+    def resolve(self, model: str, prompt: str, latency_slo: Optional[float] = None) -> str:
+        """The model to call: `model` itself, or the choice of the route it names"""
+        if model not in self.routes:
+            return model
+        return self.choose(model, prompt, latency_slo).model
+
+    def choose(self, route_name: str, prompt: str, latency_slo: Optional[float] = None) -> RouteDecision:
+        route = self.routes[route_name]
+        slo = latency_slo if latency_slo is not None else route.latency_slo
+        tokens = count_tokens(prompt)
+
+        fitting = [
+            candidate for candidate in route.candidates
+            if candidate.max_prompt_tokens is None or tokens <= candidate.max_prompt_tokens
+        ]
+        if not fitting:
+            raise ValueError(f"Prompt of about {tokens} tokens is too long for every model in route {route_name}")
+
+        observed = {
+            candidate.model: self.latency.quantile(candidate.model, route.quantile, route.min_samples)
+            for candidate in fitting
+        }
+        healthy = [
+            candidate for candidate in fitting
+            if slo is None or observed[candidate.model] is None or observed[candidate.model] <= slo
+        ]
+        if healthy:
+            chosen = healthy[0]
+            if chosen is route.candidates[0]:
+                reason = "preferred"
+            elif chosen is fitting[0]:
+                reason = "prompt_size"
+            else:
+                reason = "latency"
+        else:
+            chosen = min(fitting, key=lambda candidate: observed[candidate.model])
+            reason = "degraded"
+
+        LLM_ROUTE_DECISIONS.inc(route=route_name, model=chosen.model, reason=reason)
+        if reason != "preferred":
+            logger.info(f"Route {route_name} chose {chosen.model} ({reason}, {tokens} prompt tokens)")
+        return RouteDecision(chosen.model, reason, tokens)
+
+    def stats(self) -> Dict:
+        return {
+            name: {
+                "latency_slo": route.latency_slo,
+                "quantile": route.quantile,
+                "candidates": [
+                    {
+                        "model": candidate.model,
+                        "max_prompt_tokens": candidate.max_prompt_tokens,
+                        "observed_latency": self.latency.quantile(candidate.model, route.quantile, route.min_samples),
+                        "samples": self.latency.count(candidate.model)
+                    }
+                    for candidate in route.candidates
+                ]
+            }
+            for name, route in self.routes.items()
+        }
@@ -0,0 +1,277 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Tuple
+from app.services.metrics import LLM_ADMISSION_WAIT
+from app.services.shared_state import SharedState, get_shared_state
+from app.services.tokens import count_tokens
+from app.services.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+# Identifies the workflow run (or other caller) an LLM call belongs to, for fair queueing
+admission_key: ContextVar[Optional[str]] = ContextVar("admission_key", default=None)
+
+_anonymous_keys = itertools.count()
+
+def estimate_tokens(prompt: str, parameters: Optional[Dict] = None) -> int:
+    """Prompt plus completion budget used for tokens-per-minute accounting"""
+    max_tokens = (parameters or {}).get("max_tokens") or 1000
+    return count_tokens(prompt) + int(max_tokens)
+
+class TokenBucket:
+    """Continuously refilling bucket; rate and capacity are per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken; 0 when it is available now"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+class ModelLimits:
+    def __init__(self, concurrency: int, rpm: float = 0, tpm: float = 0):
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+class _Waiter:
+    __slots__ = ("model", "tokens", "future")
+
+    def __init__(self, model: str, tokens: int, future: asyncio.Future):
+        self.model = model
+        self.tokens = tokens
+        self.future = future
+
+class AdmissionController:
+    """Process-wide gate in front of the LLM provider.
+
+    Calls are admitted when the global and per-model concurrency limits and the
+    request/token-per-minute buckets allow it. Waiting calls are queued per
+    admission key and served round-robin so one large workflow cannot starve others.
+
+    With a shared state backend, admitted calls also reserve their requests and tokens in
+    per-window counters shared by every worker, so the per-minute limits hold for the
+    whole deployment. Concurrency limits stay per process.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 50,
+        model_concurrency: int = 20,
+        rpm: float = 0,
+        tpm: float = 0,
+        model_limits: Optional[Dict[str, Dict]] = None,
+        shared: Optional[SharedState] = None,
+        shared_window: float = 60.0
+    ):
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._model_config = model_limits or {}
+        self.rpm = rpm
+        self.tpm = tpm
+        # Process-local state needs no second, shared reservation
+        self.shared = shared if shared is not None and shared.shared else None
+        self.shared_window = shared_window
+        self._models: Dict[str, ModelLimits] = {}
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._in_flight = 0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._wakeup_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.admitted = 0
+        self.total_wait = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "50")),
+            model_concurrency=int(os.getenv("LLM_MODEL_CONCURRENCY", "20")),
+            rpm=float(os.getenv("LLM_RPM", "0")),
+            tpm=float(os.getenv("LLM_TPM", "0")),
+            model_limits=json.loads(os.getenv("LLM_MODEL_LIMITS", "{}")),
+            shared=get_shared_state(),
+            shared_window=float(os.getenv("LLM_SHARED_RATE_WINDOW", "60"))
+        )
+
+    def _limits_for(self, model: str) -> ModelLimits:
+        limits = self._models.get(model)
+        if limits is None:
+            config = self._model_config.get(model, {})
+            limits = ModelLimits(
+                concurrency=int(config.get("concurrency", self.model_concurrency)),
+                rpm=float(config.get("rpm", 0)),
+                tpm=float(config.get("tpm", 0))
+            )
+            self._models[model] = limits
+        return limits
+
+    def _wait_time(self, waiter: _Waiter) -> Optional[float]:
+        """None if a concurrency slot is missing, otherwise seconds until the buckets allow it"""
+        limits = self._limits_for(waiter.model)
+        if self._in_flight >= self.max_concurrency or limits.in_flight >= limits.concurrency:
+            return None
+        wait = 0.0
+        for bucket, amount in (
+            (self.requests, 1), (self.tokens, waiter.tokens),
+            (limits.requests, 1), (limits.tokens, waiter.tokens)
+        ):
+            if bucket is not None:
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def _grant(self, waiter: _Waiter):
+        limits = self._limits_for(waiter.model)
+        for bucket, amount in (
+            (self.requests, 1), (self.tokens, waiter.tokens),
+            (limits.requests, 1), (limits.tokens, waiter.tokens)
+        ):
+            if bucket is not None:
+                bucket.consume(amount)
+        self._in_flight += 1
+        limits.in_flight += 1
+        self.admitted += 1
+        waiter.future.set_result(None)
+
+    def _dispatch(self):
+        """Admit queued calls round-robin across keys until limits are reached"""
+        retry_in: Optional[float] = None
+        progressed = True
+        while progressed and self._queues:
+            progressed = False
+            for key in list(self._queues):
+                queue = self._queues[key]
+                while queue and queue[0].future.done():
+                    queue.popleft()
+                if not queue:
+                    del self._queues[key]
+                    continue
+                wait = self._wait_time(queue[0])
+                if wait is None:
+                    continue
+                if wait > 0:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                self._grant(queue.popleft())
+                # Served keys go to the back of the line
+                if queue:
+                    self._queues.move_to_end(key)
+                else:
+                    del self._queues[key]
+                progressed = True
+                break
+
+        if retry_in is not None:
+            loop = asyncio.get_running_loop()
+            if self._wakeup is None or self._wakeup_loop is not loop:
+                self._wakeup = loop.call_later(retry_in, self._on_wakeup)
+                self._wakeup_loop = loop
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _shared_limits(self, model: str, tokens: int) -> List[Tuple[str, float, int]]:
+        """(counter name, limit per window, amount) for every per-minute limit this call counts against"""
+        config = self._model_config.get(model, {})
+        scale = self.shared_window / 60.0
+        limits = []
+        for name, per_minute, amount in (
+            ("requests", self.rpm, 1), ("tokens", self.tpm, tokens),
+            (f"{model}:requests", float(config.get("rpm", 0)), 1),
+            (f"{model}:tokens", float(config.get("tpm", 0)), tokens)
+        ):
+            if per_minute:
+                limits.append((name, per_minute * scale, amount))
+        return limits
+
+    async def _reserve_shared(self, model: str, tokens: int):
+        """Count the call in the deployment-wide windows, waiting for the next window while one is full"""
+        limits = self._shared_limits(model, tokens)
+        while limits:
+            window = int(time.time() // self.shared_window)
+            reserved = []
+            try:
+                for name, limit, amount in limits:
+                    key = f"llm:rate:{name}:{window}"
+                    count = await self.shared.incr(key, amount, ttl=self.shared_window * 2)
+                    reserved.append((key, amount))
+                    # An empty window always admits one call, even one larger than the limit
+                    if count > limit and count > amount:
+                        break
+                else:
+                    return
+                for key, amount in reserved:
+                    await self.shared.incr(key, -amount)
+            except Exception as e:
+                # Availability over strictness: a shared backend outage leaves only the local limits
+                logger.warning(f"Shared rate limit check failed, admitting on local limits: {str(e)}")
+                return
+            await asyncio.sleep((window + 1) * self.shared_window - time.time())
+
+    def _release(self, model: str):
+        self._in_flight -= 1
+        self._limits_for(model).in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, model: str, tokens: int, key: Optional[str] = None):
+        key = key or admission_key.get() or f"anonymous:{next(_anonymous_keys)}"
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(model, tokens, loop.create_future())
+        self._queues.setdefault(key, deque()).append(waiter)
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await waiter.future
+            if self.shared is not None:
+                await self._reserve_shared(model, tokens)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(model)
+            else:
+                self._dispatch()
+            raise
+        waited = time.monotonic() - queued_at
+        self.total_wait += waited
+        LLM_ADMISSION_WAIT.observe(waited, model=model)
+        record_span("admission_wait", "wait", waited, model=model)
+        try:
+            yield
+        finally:
+            self._release(model)
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self._in_flight,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "admitted": self.admitted,
+            "total_wait_seconds": self.total_wait,
+            "models": {
+                model: {"in_flight": limits.in_flight, "concurrency": limits.concurrency}
+                for model, limits in self._models.items()
+            }
+        }
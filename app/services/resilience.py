@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Call = Callable[[], Awaitable[Any]]
+
+def backoff_delay(attempt: int, initial: float, multiplier: float, maximum: float, jitter: float) -> float:
+    """Exponential backoff for the given retry attempt (1-based), reduced by up to `jitter` of itself"""
+    delay = min(maximum, initial * multiplier ** (attempt - 1))
+    return delay * (1 - jitter * random.random())
+
+async def call_with_retry(
+    call: Call,
+    is_transient: Callable[[Exception], bool],
+    max_attempts: int = 3,
+    initial_backoff: float = 0.5,
+    max_backoff: float = 10.0,
+    multiplier: float = 2.0,
+    jitter: float = 0.5,
+    deadline: Optional[float] = None,
+    on_retry: Optional[Callable[[int, Exception], None]] = None
+) -> Any:
+    """Run `call`, retrying transient failures with backoff until attempts or the total deadline run out"""
+    expires_at = time.monotonic() + deadline if deadline else None
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if expires_at is None:
+                return await call()
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            return await asyncio.wait_for(call(), remaining)
+        except asyncio.TimeoutError:
+            if expires_at is not None and time.monotonic() >= expires_at:
+                raise TimeoutError(f"Deadline of {deadline}s exceeded after {attempt} attempt(s)")
+            raise
+        except Exception as e:
+            if attempt >= max_attempts or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt, initial_backoff, multiplier, max_backoff, jitter)
+            if expires_at is not None and time.monotonic() + delay >= expires_at:
+                raise
+            logger.warning(f"Attempt {attempt} failed with transient error, retrying in {delay:.2f}s: {str(e)}")
+            if on_retry is not None:
+                on_retry(attempt, e)
+            await asyncio.sleep(delay)
+
+async def call_with_timeout(call: Call, timeout: float) -> Any:
+    """Run `call`, cancelling it (and any provider request it has in flight) after `timeout` seconds"""
+    try:
+        return await asyncio.wait_for(call(), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Timed out after {timeout}s")
+
+async def call_with_hedging(call: Call, delay: float, max_hedges: int = 1) -> Any:
+    """Run `call`; if it has not finished after `delay`, start a duplicate and take the first success"""
+    tasks: List[asyncio.Task] = [asyncio.create_task(call())]
+    last_error: Optional[BaseException] = None
+    try:
+        while True:
+            pending = [task for task in tasks if not task.done()]
+            if not pending:
+                raise last_error
+            can_hedge = len(tasks) <= max_hedges
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=delay if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                logger.info(f"No response after {delay:.2f}s, issuing hedged request {len(tasks)}")
+                tasks.append(asyncio.create_task(call()))
+                continue
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def iter_bounded(
+    items: Sequence[Any], call: Callable[[int, Any], Awaitable[Any]], concurrency: int
+) -> AsyncIterator[Tuple[int, Any, Optional[Exception]]]:
+    """Run `call(index, item)` for every item on at most `concurrency` workers.
+
+    Yields (index, result, error) as each call completes; closing the iterator early cancels
+    the calls still running.
+    """
+    outcomes: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker():
+        # Workers share one iterator, so each item is taken exactly once
+        for index, item in pending:
+            try:
+                outcomes.put_nowait((index, await call(index, item), None))
+            except Exception as e:
+                outcomes.put_nowait((index, None, e))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in range(len(items)):
+            yield await outcomes.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
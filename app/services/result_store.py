@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import run_db
+from app.models.workflow import ResultBlob
+
+def _serialize(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+def content_hash(value: Any) -> str:
+    """Stable hash of a JSON value; equal values hash equally whatever their key order"""
+    return "sha256:" + hashlib.sha256(_serialize(value).encode("utf-8")).hexdigest()
+
+def result_size(value: Any) -> int:
+    """Size in bytes of a step result as it would appear in a response"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(_serialize(value).encode("utf-8"))
+
+class ResultStore:
+    """Keeps step results above the inline limit in result_blobs, addressed by content hash.
+
+    Responses and run records then carry a short handle instead of the payload, and an
+    output produced again by another step or run is stored only once.
+    """
+
+    def __init__(self):
+        self.inline_limit = int(os.getenv("RESULT_INLINE_LIMIT", "65536"))
+
+    def oversized(self, value: Any) -> Optional[int]:
+        """Size of `value` in bytes if it is too large to return inline, else None"""
+        if self.inline_limit <= 0 or value is None or value == "":
+            return None
+        size = result_size(value)
+        return size if size > self.inline_limit else None
+
+    def put(self, db: Session, handle: str, value: Any, size: int):
+        if db.query(ResultBlob.handle).filter(ResultBlob.handle == handle).first() is not None:
+            return
+        db.add(ResultBlob(handle=handle, value=value, size=size))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Stored concurrently by another run with the same output
+            db.rollback()
+        except Exception:
+            # Leave the run's session usable for the steps and records that follow
+            db.rollback()
+            raise
+
+    def get(self, db: Session, handle: str) -> Optional[ResultBlob]:
+        return db.query(ResultBlob).filter(ResultBlob.handle == handle).first()
+
+class RunResults:
+    """Moves the large results of one execution to the result store as each step finishes.
+
+    The in-run results then hold only the handle, and a step reading a stored result loads
+    it back for as long as it runs.
+    """
+
+    def __init__(self, store: ResultStore, db):
+        self.store = store
+        self.db = db
+        # Steps run concurrently but share the run's session, which is not safe for concurrent use
+        self._lock = asyncio.Lock()
+        self.stored = 0
+
+    async def offload(self, record: Dict) -> Dict:
+        value = record.get("result")
+        size = self.store.oversized(value)
+        if size is None:
+            return record
+        handle = content_hash(value)
+        async with self._lock:
+            await run_db(self.db, self.store.put, handle, value, size)
+        self.stored += 1
+        return {**record, "result": None, "result_handle": handle, "result_size": size}
+
+    async def load(self, record: Dict) -> Dict:
+        handle = record.get("result_handle")
+        if handle is None:
+            return record
+        async with self._lock:
+            blob = await run_db(self.db, self.store.get, handle)
+        if blob is None:
+            raise ValueError(f"Stored result {handle} of step {record['step_name']} is missing")
+        return {**record, "result": blob.value}
+
+current_results: contextvars.ContextVar[Optional[RunResults]] = contextvars.ContextVar(
+    "current_results", default=None
+)
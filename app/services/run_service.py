@@ -0,0 +1,332 @@
+from sqlalchemy.orm import Session, selectinload
+from app.database import SessionLocal, close_db, run_db
+from app.models.workflow import Workflow, WorkflowRun, StepRun
+from app.services.metrics import RUN_QUEUE_WAIT
+from app.services.shared_state import worker_id
+from app.services.workflow_service import WorkflowService
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class RunQueueFull(Exception):
+    pass
+
+class RunService:
+    """Persists workflow runs and executes them on a bounded pool of background workers.
+
+    Queued runs live in the database; the in-memory queue only wakes workers up early.
+    Workers claim a run with a conditional status update, and also poll for queued runs,
+    so a process started with zero workers can accept runs for other processes to execute.
+    The claiming process owns the run and renews a heartbeat while executing it; a running
+    run whose heartbeat is older than WORKFLOW_RUN_LEASE is requeued, and a previous owner
+    that comes back late does not overwrite the new owner's results.
+
+    Cancelling a queued run takes effect at once. A running run is flagged, and its owner
+    stops it at its next heartbeat, or immediately when the owner is this process.
+    """
+
+    def __init__(
+        self,
+        workflow_service: WorkflowService,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        self.workflow_service = workflow_service
+        self.session_factory = session_factory
+        self.workers = int(os.getenv("WORKFLOW_WORKERS", "4"))
+        self.queue_size = int(os.getenv("WORKFLOW_RUN_QUEUE_SIZE", "1000"))
+        self.poll_interval = float(os.getenv("WORKFLOW_RUN_POLL_INTERVAL", "2"))
+        self.lease = float(os.getenv("WORKFLOW_RUN_LEASE", "60"))
+        # How often this process looks for runs whose owner stopped renewing its heartbeat
+        self.sweep_interval = self.lease / 2
+        self.worker_id = worker_id()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Cancel signals of the runs this process is executing
+        self._cancels: Dict[int, asyncio.Event] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        if self.workers:
+            self._tasks.append(asyncio.create_task(self._sweep()))
+        logger.info(f"Started {self.workers} workflow run workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self, db: Session, workflow_id: int, trace: bool = False, reuse: bool = False
+    ) -> WorkflowRun:
+        if reuse:
+            self.workflow_service.checkpoint_store.require()
+        notify = self._queue is not None and bool(self._tasks)
+        if notify and self._queue.full():
+            raise RunQueueFull("Run queue is full, try again later")
+
+        run = await run_db(db, self._create_run, workflow_id, trace, reuse)
+        if notify:
+            self._queue.put_nowait(run.id)
+        return run
+
+    async def resume(self, db: Session, run_id: int) -> WorkflowRun:
+        """Queue a new run of the same workflow that reuses every step whose inputs are unchanged"""
+        run = await run_db(db, self.get_run, run_id)
+        if run is None:
+            raise ValueError(f"Run {run_id} not found")
+        return await self.submit(db, run.workflow_id, trace=bool(run.traced), reuse=True)
+
+    async def cancel(self, db: Session, run_id: int) -> WorkflowRun:
+        """Cancel a queued or running run; finished runs are returned unchanged"""
+        run = await run_db(db, self._request_cancel, run_id)
+        if run_id in self._cancels:
+            self._cancels[run_id].set()
+        return run
+
+    def _request_cancel(self, db: Session, run_id: int) -> WorkflowRun:
+        dequeued = (
+            db.query(WorkflowRun)
+            .filter(WorkflowRun.id == run_id, WorkflowRun.status == "queued")
+            .update(
+                {"status": "cancelled", "cancel_requested": True, "finished_at": datetime.utcnow()},
+                synchronize_session=False
+            )
+        )
+        if not dequeued:
+            db.query(WorkflowRun).filter(WorkflowRun.id == run_id, WorkflowRun.status == "running").update(
+                {"cancel_requested": True}, synchronize_session=False
+            )
+        db.commit()
+        run = self.get_run(db, run_id)
+        if run is None:
+            raise ValueError(f"Run {run_id} not found")
+        return run
+
+    def _create_run(
+        self, db: Session, workflow_id: int, trace: bool = False, reuse: bool = False
+    ) -> WorkflowRun:
+        workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+        if not workflow:
+            raise ValueError(f"Workflow {workflow_id} not found")
+
+        run = WorkflowRun(
+            workflow_id=workflow_id,
+            workflow_version=workflow.version,
+            status="queued",
+            traced=trace,
+            reuse=reuse
+        )
+        db.add(run)
+        db.commit()
+        return self.get_run(db, run.id)
+
+    def get_run(self, db: Session, run_id: int) -> Optional[WorkflowRun]:
+        return (
+            db.query(WorkflowRun)
+            .options(selectinload(WorkflowRun.steps))
+            .execution_options(populate_existing=True)
+            .filter(WorkflowRun.id == run_id)
+            .first()
+        )
+
+    def get_runs(self, db: Session, workflow_id: int, limit: int = 20) -> List[WorkflowRun]:
+        return (
+            db.query(WorkflowRun)
+            .options(selectinload(WorkflowRun.steps))
+            .filter(WorkflowRun.workflow_id == workflow_id)
+            .order_by(WorkflowRun.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    def get_trace(self, db: Session, run_id: int) -> Optional[Dict]:
+        row = db.query(WorkflowRun.trace).filter(WorkflowRun.id == run_id).first()
+        return row.trace if row is not None else None
+
+    def _claim(self, db: Session, run_id: Optional[int]) -> Optional[int]:
+        """Atomically move a queued run (or the oldest one) to running; None if there is none to take"""
+        now = datetime.utcnow()
+        if run_id is None:
+            oldest = (
+                db.query(WorkflowRun.id)
+                .filter(WorkflowRun.status == "queued")
+                .order_by(WorkflowRun.id)
+                .first()
+            )
+            if oldest is None:
+                return None
+            run_id = oldest.id
+
+        claimed = (
+            db.query(WorkflowRun)
+            .filter(WorkflowRun.id == run_id, WorkflowRun.status == "queued")
+            .update(
+                {"status": "running", "started_at": now, "owner": self.worker_id, "heartbeat_at": now},
+                synchronize_session=False
+            )
+        )
+        db.commit()
+        return run_id if claimed == 1 else None
+
+    def _requeue_stale(self, db: Session):
+        """Return runs whose owner stopped renewing its heartbeat to the queue, unless they were cancelled"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease)
+        stale = db.query(WorkflowRun).filter(WorkflowRun.status == "running", WorkflowRun.heartbeat_at < cutoff)
+        # Only take the write lock when there is something to requeue
+        if stale.with_entities(WorkflowRun.id).first() is None:
+            return
+        stale.filter(WorkflowRun.cancel_requested.is_(True)).update(
+            {"status": "cancelled", "finished_at": datetime.utcnow()}, synchronize_session=False
+        )
+        requeued = stale.update({"status": "queued", "owner": None, "started_at": None}, synchronize_session=False)
+        db.commit()
+        if requeued:
+            logger.warning(f"Requeued {requeued} workflow runs whose worker stopped responding")
+
+    async def _sweep(self):
+        while True:
+            db = self.session_factory()
+            try:
+                await run_db(db, self._requeue_stale)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Sweep for stale workflow runs failed: {str(e)}")
+            finally:
+                await close_db(db)
+            await asyncio.sleep(self.sweep_interval)
+
+    def _heartbeat(self, db: Session, run_id: int) -> Tuple[bool, bool]:
+        """Renew this worker's lease on a run; returns whether it still owns it and whether it was cancelled"""
+        renewed = (
+            db.query(WorkflowRun)
+            .filter(WorkflowRun.id == run_id, WorkflowRun.owner == self.worker_id)
+            .update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+        )
+        cancel_requested = db.query(WorkflowRun.cancel_requested).filter(WorkflowRun.id == run_id).scalar()
+        db.commit()
+        return renewed == 1, bool(cancel_requested)
+
+    async def _keep_alive(self, run_id: int, cancel: asyncio.Event):
+        # Its own session: the run's session is busy executing the workflow
+        db = self.session_factory()
+        try:
+            while True:
+                # Often enough to notice cancellations requested through other processes
+                await asyncio.sleep(min(self.lease / 3, self.poll_interval))
+                try:
+                    owned, cancel_requested = await run_db(db, self._heartbeat, run_id)
+                    if cancel_requested:
+                        cancel.set()
+                    if not owned:
+                        logger.warning(f"Lost ownership of workflow run {run_id}")
+                        return
+                except Exception as e:
+                    logger.error(f"Heartbeat for workflow run {run_id} failed: {str(e)}")
+        finally:
+            await close_db(db)
+
+    def _owned_run(self, db: Session, run_id: int) -> Optional[WorkflowRun]:
+        run = db.query(WorkflowRun).filter(WorkflowRun.id == run_id).first()
+        if run.owner != self.worker_id:
+            logger.warning(f"Workflow run {run_id} was requeued and is now owned by {run.owner}; dropping results")
+            return None
+        return run
+
+    def _record_results(
+        self,
+        db: Session,
+        run_id: int,
+        results: List[Dict],
+        trace: Optional[Dict] = None,
+        stopped: Optional[str] = None
+    ):
+        run = self._owned_run(db, run_id)
+        if run is None:
+            return
+        for order, result in enumerate(results):
+            db.add(StepRun(
+                run_id=run.id,
+                step_name=result["step_name"],
+                order=order,
+                result=result.get("result"),
+                result_handle=result.get("result_handle"),
+                result_size=result.get("result_size"),
+                reused=result.get("reused", False),
+                skipped=result.get("skipped", False),
+                cancelled=result.get("cancelled", False),
+                error=result.get("error")
+            ))
+        if stopped == "cancelled":
+            run.status = "cancelled"
+        elif stopped == "timeout":
+            run.status = "failed"
+            run.error = "Run timed out; unfinished steps were cancelled"
+        elif stopped == "fail_fast":
+            failed = [r["step_name"] for r in results if r.get("error") and not r.get("cancelled")]
+            run.status = "failed"
+            run.error = f"Step {', '.join(failed)} failed; unfinished steps were cancelled"
+        else:
+            run.status = "completed"
+        run.trace = trace
+        run.finished_at = datetime.utcnow()
+        db.commit()
+
+    def _record_failure(self, db: Session, run_id: int, error: str):
+        db.rollback()
+        run = self._owned_run(db, run_id)
+        if run is None:
+            return
+        run.status = "failed"
+        run.error = error
+        run.finished_at = datetime.utcnow()
+        db.commit()
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                run_id = await asyncio.wait_for(self._queue.get(), self.poll_interval)
+            except asyncio.TimeoutError:
+                run_id = None
+
+            db = self.session_factory()
+            try:
+                run_id = await run_db(db, self._claim, run_id)
+                if run_id is not None:
+                    await self._process(db, run_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Workflow run worker {index} failed: {str(e)}")
+            finally:
+                await close_db(db)
+
+    async def _process(self, db: Session, run_id: int):
+        run = await run_db(db, self.get_run, run_id)
+        if run.created_at and run.started_at:
+            RUN_QUEUE_WAIT.observe((run.started_at - run.created_at).total_seconds())
+        logger.info(f"Executing workflow run {run_id} for workflow {run.workflow_id}")
+        cancel = self._cancels[run_id] = asyncio.Event()
+        if run.cancel_requested:
+            cancel.set()
+        keep_alive = asyncio.create_task(self._keep_alive(run_id, cancel))
+        try:
+            execution = await self.workflow_service.execute_workflow(
+                db, run.workflow_id, trace=bool(run.traced), reuse=bool(run.reuse), cancel=cancel
+            )
+            await run_db(
+                db, self._record_results, run_id, execution["results"], execution.get("trace"), execution["stopped"]
+            )
+        except Exception as e:
+            logger.error(f"Workflow run {run_id} failed: {str(e)}")
+            await run_db(db, self._record_failure, run_id, str(e))
+        finally:
+            del self._cancels[run_id]
+            keep_alive.cancel()
+            await asyncio.gather(keep_alive, return_exceptions=True)
@@ -0,0 +1,313 @@
+"""State shared by every worker process of a deployment.
+
+Limits and deduplication that live in process memory only hold within one worker. With
+several workers, the same bookkeeping goes through a shared backend selected by
+SHARED_STATE_URL:
+
+- `memory://` (default): process memory, for a single worker
+- `sqlite:///path/to/state.db`: a file shared by the workers of one host; SQLite's file
+  locking makes each operation atomic across processes
+- `redis://[:password@]host:port/db`: any server speaking the Redis protocol, shared across hosts
+"""
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Deletes a key only while it still holds the caller's value, so a lease that expired and was
+# taken over by another worker is not released by its previous holder
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+def worker_id() -> str:
+    """Identifies this worker process across the deployment"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class SharedState(ABC):
+    """Key-value operations that are atomic across every process using the same backend"""
+
+    shared = True
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, only_if_absent: bool = False) -> bool:
+        """Store `value`; with `only_if_absent`, only when the key is unset. True if it was stored"""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to a counter and return the new value; `ttl` applies when the counter is created"""
+
+    @abstractmethod
+    async def delete(self, key: str, only_if_value: Optional[str] = None) -> bool:
+        pass
+
+    async def close(self):
+        pass
+
+class MemoryState(SharedState):
+    """Process-local state; correct for a single worker only"""
+
+    shared = False
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._live(key)
+        return entry[0] if entry is not None else None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, only_if_absent: bool = False) -> bool:
+        if only_if_absent and self._live(key) is not None:
+            return False
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+        return True
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        entry = self._live(key)
+        if entry is None:
+            entry = ("0", time.time() + ttl if ttl else None)
+        value = int(entry[0]) + amount
+        self._data[key] = (str(value), entry[1])
+        return value
+
+    async def delete(self, key: str, only_if_value: Optional[str] = None) -> bool:
+        entry = self._live(key)
+        if entry is None or (only_if_value is not None and entry[0] != only_if_value):
+            return False
+        del self._data[key]
+        return True
+
+class SQLiteState(SharedState):
+    """State in a SQLite file; every write runs in its own `BEGIN IMMEDIATE` transaction"""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._writes = 0
+
+    def _transaction(self, operation, *args):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(time.time(), *args)
+                self._writes += 1
+                if self._writes % self.PURGE_EVERY == 0:
+                    self._conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (time.time(),))
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _read(self, now: float, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, now)
+        ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def _write(self, key: str, value: str, expires_at: Optional[float]):
+        self._conn.execute(
+            "INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, expires_at)
+        )
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._read(time.time(), key)
+        return entry[0] if entry is not None else None
+
+    def _set(self, now: float, key: str, value: str, ttl: Optional[float], only_if_absent: bool) -> bool:
+        if only_if_absent and self._read(now, key) is not None:
+            return False
+        self._write(key, value, now + ttl if ttl else None)
+        return True
+
+    def _incr(self, now: float, key: str, amount: int, ttl: Optional[float]) -> int:
+        entry = self._read(now, key)
+        if entry is None:
+            entry = ("0", now + ttl if ttl else None)
+        value = int(entry[0]) + amount
+        self._write(key, str(value), entry[1])
+        return value
+
+    def _delete(self, now: float, key: str, only_if_value: Optional[str]) -> bool:
+        entry = self._read(now, key)
+        if entry is None or (only_if_value is not None and entry[0] != only_if_value):
+            return False
+        self._conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+        return True
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, only_if_absent: bool = False) -> bool:
+        return await asyncio.to_thread(self._transaction, self._set, key, value, ttl, only_if_absent)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return await asyncio.to_thread(self._transaction, self._incr, key, amount, ttl)
+
+    async def delete(self, key: str, only_if_value: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self._transaction, self._delete, key, only_if_value)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+class RedisError(Exception):
+    pass
+
+class RedisState(SharedState):
+    """State on a Redis-compatible server, spoken to directly over RESP so no client library is needed"""
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, password: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisState":
+        parsed = urlparse(url)
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=unquote(parsed.password) if parsed.password else None
+        )
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", self.db)
+
+    async def _read_reply(self) -> Union[None, int, str, List]:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, body = line[:1], line[1:-2].decode()
+        if kind == b"+":
+            return body
+        if kind == b"-":
+            raise RedisError(body)
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            if int(body) < 0:
+                return None
+            data = await self._reader.readexactly(int(body) + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            if int(body) < 0:
+                return None
+            return [await self._read_reply() for _ in range(int(body))]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    async def _roundtrip(self, *args) -> Union[None, int, str, List]:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def command(self, *args) -> Union[None, int, str, List]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Streams are bound to the loop that opened them
+            self._reader = self._writer = None
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._roundtrip(*args)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    self._close_connection()
+                    if attempt:
+                        raise
+
+    def _close_connection(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.command("GET", key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, only_if_absent: bool = False) -> bool:
+        args = ["SET", key, value]
+        if ttl:
+            args += ["PX", max(1, int(ttl * 1000))]
+        if only_if_absent:
+            args.append("NX")
+        return await self.command(*args) == "OK"
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = await self.command("INCRBY", key, amount)
+        if ttl and value == amount:
+            await self.command("PEXPIRE", key, max(1, int(ttl * 1000)))
+        return value
+
+    async def delete(self, key: str, only_if_value: Optional[str] = None) -> bool:
+        if only_if_value is None:
+            return await self.command("DEL", key) > 0
+        return await self.command("EVAL", RELEASE_SCRIPT, 1, key, only_if_value) > 0
+
+    async def close(self):
+        self._close_connection()
+
+def create_shared_state(url: str) -> SharedState:
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return MemoryState()
+    if scheme == "sqlite":
+        return SQLiteState(url[len("sqlite:///"):])
+    if scheme == "redis":
+        return RedisState.from_url(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {scheme}")
+
+_shared_state: Optional[SharedState] = None
+
+def get_shared_state() -> SharedState:
+    """Process-wide shared state backend, created on first use so forked workers get their own"""
+    global _shared_state
+    if _shared_state is None:
+        _shared_state = create_shared_state(os.getenv("SHARED_STATE_URL", "memory://"))
+        logger.info(f"Using {type(_shared_state).__name__} for shared state")
+    return _shared_state
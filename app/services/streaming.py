@@ -0,0 +1,55 @@
+import asyncio
+import json
+import logging
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EventSink = Callable[[str, Dict], Awaitable[None]]
+
+# Set for the duration of a streaming execution; steps report progress through it
+event_sink: ContextVar[Optional[EventSink]] = ContextVar("event_sink", default=None)
+# Whether steps of the current execution should forward LLM tokens as they arrive
+token_streaming: ContextVar[bool] = ContextVar("token_streaming", default=False)
+# Set per step to the callback that forwards its tokens
+token_sink: ContextVar[Optional[Callable[[str], Awaitable[None]]]] = ContextVar("token_sink", default=None)
+
+async def emit(event: str, data: Dict):
+    sink = event_sink.get()
+    if sink is not None:
+        await sink(event, data)
+
+def format_sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_events(run: Callable[[EventSink], Awaitable[Dict]], final_event: str) -> AsyncIterator[str]:
+    """Run `run` in the background and yield the events it emits as server-sent events.
+
+    The value `run` returns is sent as `final_event`; an exception becomes an `error` event.
+    If the client goes away the generator is closed and the run is cancelled.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def sink(event: str, data: Dict):
+        await queue.put((event, data))
+
+    async def runner():
+        try:
+            await queue.put((final_event, await run(sink)))
+        except Exception as e:
+            logger.error(f"Error while streaming {final_event}: {str(e)}")
+            await queue.put(("error", {"detail": str(e)}))
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(runner())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield format_sse(*item)
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,112 @@
+import json
+import re
+from typing import Any, Dict, List, NamedTuple, Tuple, Union
+from app.services.conditions import MISSING, parse_path, resolve_path
+
+STEP_REFERENCE_PATTERN = re.compile(r"\{\{\s*(.+?)\s*\}\}")
+FIELD_SEPARATOR_PATTERN = re.compile(r"[.\[]")
+
+class StepReference(NamedTuple):
+    name: str
+    raw: str
+    # Sub-field selected with {{Step.field}} or {{Step.items[0]}}; empty for the whole result
+    path: Tuple[str, ...] = ()
+    expression: str = ""
+
+def parse_reference(expression: str, raw: str) -> StepReference:
+    separator = FIELD_SEPARATOR_PATTERN.search(expression)
+    if separator is None:
+        return StepReference(expression, raw, (), expression)
+    name = expression[:separator.start()].rstrip()
+    return StepReference(name, raw, tuple(parse_path(expression[separator.start():])), expression)
+
+def format_value(value: Any) -> str:
+    """Text inserted for a referenced value: strings as-is, anything else as JSON"""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+class CompiledTemplate:
+    """A string parameter parsed into literal segments and {{Step}} reference slots"""
+    __slots__ = ("segments", "references")
+
+    def __init__(self, segments: List[Union[str, StepReference]]):
+        self.segments = segments
+        self.references = []
+        for segment in segments:
+            if not isinstance(segment, StepReference):
+                continue
+            # A step whose name contains a dot is still matched by its full name
+            names = [segment.name, segment.expression] if segment.path else [segment.name]
+            for name in names:
+                if name not in self.references:
+                    self.references.append(name)
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """Fill every slot in one pass; references to unknown steps or missing fields are left as written"""
+        if not self.references:
+            return self.segments[0] if self.segments else ""
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, StepReference):
+                value = self._lookup(segment, values)
+                parts.append(segment.raw if value is MISSING or value is None else format_value(value))
+            else:
+                parts.append(segment)
+        return "".join(parts)
+
+    @staticmethod
+    def _lookup(reference: StepReference, values: Dict[str, Any]) -> Any:
+        if reference.expression in values:
+            return values[reference.expression]
+        if not reference.path or reference.name not in values:
+            return MISSING
+        return resolve_path(values[reference.name], list(reference.path))
+
+def compile_template(text: str) -> CompiledTemplate:
+    segments: List[Union[str, StepReference]] = []
+    position = 0
+    for match in STEP_REFERENCE_PATTERN.finditer(text):
+        if match.start() > position:
+            segments.append(text[position:match.start()])
+        segments.append(parse_reference(match.group(1), match.group(0)))
+        position = match.end()
+    if position < len(text):
+        segments.append(text[position:])
+    return CompiledTemplate(segments)
+
+class CompiledParameters:
+    """A step's parameters with every string value, including those in nested dicts and lists, compiled once"""
+    __slots__ = ("values", "references")
+
+    def __init__(self, parameters: Dict[str, Any]):
+        self.references: List[str] = []
+        self.values: Dict[str, Any] = {
+            key: self._compile(value) for key, value in (parameters or {}).items()
+        }
+
+    def _compile(self, value: Any) -> Any:
+        if isinstance(value, str):
+            value = compile_template(value)
+            for name in value.references:
+                if name not in self.references:
+                    self.references.append(name)
+            return value
+        if isinstance(value, dict):
+            return {key: self._compile(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._compile(item) for item in value]
+        return value
+
+    @classmethod
+    def _render(cls, value: Any, values: Dict[str, str]) -> Any:
+        if isinstance(value, CompiledTemplate):
+            return value.render(values)
+        if isinstance(value, dict):
+            return {key: cls._render(item, values) for key, item in value.items()}
+        if isinstance(value, list):
+            return [cls._render(item, values) for item in value]
+        return value
+
+    def render(self, values: Dict[str, str]) -> Dict[str, Any]:
+        return {key: self._render(value, values) for key, value in self.values.items()}
@@ -0,0 +1,36 @@
+"""Local token counting, so budgeting and routing never need a round trip to the provider.
+
+Uses tiktoken when it is installed; otherwise an approximation that splits text the way
+GPT tokenizers pre-tokenize it and charges long words one token per six characters.
+"""
+import math
+import re
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+PRE_TOKEN_PATTERN = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d{1,3}| ?(?:[^\s\w]|_)+|\s+")
+# Typical characters per token within one pre-token, for the approximation
+CHARS_PER_TOKEN = 6
+
+@lru_cache(maxsize=32)
+def _encoding(model: Optional[str]):
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoding(model).encode(text, disallowed_special=()))
+    count = 0
+    for piece in PRE_TOKEN_PATTERN.findall(text):
+        word = piece.lstrip(" ")
+        count += max(1, math.ceil(len(word) / CHARS_PER_TOKEN)) if word else 1
+    return count
@@ -0,0 +1,174 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# The trace of the workflow execution in progress, and the step a task is running
+current_trace: ContextVar[Optional["RunTrace"]] = ContextVar("current_trace", default=None)
+current_step: ContextVar[Optional[str]] = ContextVar("current_step", default=None)
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+class StepTrace:
+    __slots__ = ("name", "lane", "dependencies", "scheduled", "started", "finished", "status",
+                 "llm_seconds", "tokens_in", "tokens_out")
+
+    def __init__(self, name: str, lane: int, dependencies: List[str], scheduled: float):
+        self.name = name
+        self.lane = lane
+        self.dependencies = dependencies
+        self.scheduled = scheduled
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.status = "pending"
+        self.llm_seconds = 0.0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+class RunTrace:
+    """Spans recorded while one workflow executes, exportable in Chrome trace event format.
+
+    Each step gets its own lane (thread id), so parallel branches and the time steps spend
+    waiting on their dependencies show up side by side in chrome://tracing or Perfetto.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.utcnow()
+        self.origin = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.steps: Dict[str, StepTrace] = {}
+        self._spans: List[Dict[str, Any]] = []
+
+    def _lane(self) -> int:
+        step = self.steps.get(current_step.get() or "")
+        return step.lane if step is not None else 0
+
+    def add_span(self, name: str, category: str, start: float, end: float, **args: Any):
+        self._spans.append({
+            "name": name, "cat": category, "start": start, "end": end, "lane": self._lane(), "args": args
+        })
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, category, start, time.perf_counter(), **args)
+
+    def schedule_step(self, name: str, dependencies: List[str]):
+        self.steps[name] = StepTrace(name, len(self.steps) + 1, dependencies, time.perf_counter())
+
+    def start_step(self, name: str):
+        self.steps[name].started = time.perf_counter()
+
+    def finish_step(self, name: str, status: str):
+        step = self.steps[name]
+        step.finished = time.perf_counter()
+        step.status = status
+
+    def record_llm_call(self, model: str, seconds: float, tokens_in: int, tokens_out: int):
+        end = time.perf_counter()
+        self.add_span(f"llm:{model}", "llm", end - seconds, end, tokens_in=tokens_in, tokens_out=tokens_out)
+        step = self.steps.get(current_step.get() or "")
+        if step is not None:
+            step.llm_seconds += seconds
+            step.tokens_in += tokens_in
+            step.tokens_out += tokens_out
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def critical_path(self) -> List[str]:
+        """Steps on the longest dependency chain, found by walking back from the last step to finish"""
+        finished = [step for step in self.steps.values() if step.finished is not None]
+        if not finished:
+            return []
+        step = max(finished, key=lambda s: s.finished)
+        path = [step.name]
+        while True:
+            dependencies = [self.steps[name] for name in step.dependencies if name in self.steps]
+            if not dependencies:
+                break
+            step = max(dependencies, key=lambda s: s.finished or 0.0)
+            path.append(step.name)
+        return list(reversed(path))
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.finished or time.perf_counter()
+        return {
+            "workflow": self.name,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": _ms(end - self.origin),
+            "critical_path": self.critical_path(),
+            "steps": {
+                step.name: {
+                    "status": step.status,
+                    "dependencies": step.dependencies,
+                    "scheduled_ms": _ms(step.scheduled - self.origin),
+                    "started_ms": _ms((step.started or step.scheduled) - self.origin),
+                    "finished_ms": _ms((step.finished or end) - self.origin),
+                    "dependency_wait_ms": _ms((step.started or step.scheduled) - step.scheduled),
+                    "duration_ms": _ms((step.finished or end) - (step.started or step.scheduled)),
+                    "llm_ms": _ms(step.llm_seconds),
+                    "tokens_in": step.tokens_in,
+                    "tokens_out": step.tokens_out
+                }
+                for step in self.steps.values()
+            }
+        }
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Chrome trace event JSON (complete "X" events in microseconds) plus a summary"""
+        end = self.finished or time.perf_counter()
+
+        def event(name: str, category: str, start: float, stop: float, lane: int, args: Dict) -> Dict:
+            return {
+                "name": name, "cat": category, "ph": "X", "pid": 1, "tid": lane,
+                "ts": round((start - self.origin) * 1e6, 1),
+                "dur": round((stop - start) * 1e6, 1),
+                "args": args
+            }
+
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "workflow"}},
+            event(self.name, "workflow", self.origin, end, 0, {})
+        ]
+        for step in self.steps.values():
+            started = step.started or step.scheduled
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": step.lane, "args": {"name": step.name}})
+            if started > step.scheduled:
+                events.append(event("wait_dependencies", "wait", step.scheduled, started, step.lane,
+                                    {"dependencies": step.dependencies}))
+            events.append(event(step.name, "step", started, step.finished or end, step.lane, {
+                "status": step.status, "tokens_in": step.tokens_in, "tokens_out": step.tokens_out
+            }))
+        for span in self._spans:
+            events.append(event(span["name"], span["cat"], span["start"], span["end"], span["lane"], span["args"]))
+
+        return {"traceEvents": events, "displayTimeUnit": "ms", "summary": self.summary()}
+
+@contextmanager
+def trace_span(name: str, category: str, **args: Any) -> Iterator[None]:
+    """Record a span on the active trace; a no-op when the execution is not being traced"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, category, **args):
+        yield
+
+def record_span(name: str, category: str, seconds: float, **args: Any):
+    """Record a span that ends now and lasted `seconds` on the active trace, if any"""
+    trace = current_trace.get()
+    if trace is not None:
+        end = time.perf_counter()
+        trace.add_span(name, category, end - seconds, end, **args)
+
+def record_llm_call(model: str, seconds: float, tokens_in: int, tokens_out: int):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record_llm_call(model, seconds, tokens_in, tokens_out)
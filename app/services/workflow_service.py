@@ -1,182 +1,760 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session, selectinload
+from app.database import run_db
 from app.models.workflow import Workflow, WorkflowStep
-from app.schemas.workflow import WorkflowCreate
-from app.services.llm_service import LLMService
-from typing import List, Dict, Optional
+from app.schemas.workflow import WorkflowCreate, WorkflowPolicy, StepPolicy, MapParameters, MapSplit
+from app.services.actions import ActionRegistry
+from app.services.builtin_actions import BUILTIN_ACTIONS
+from app.services.checkpoints import CheckpointStore, RunCheckpoints, current_checkpoints
+from app.services.conditions import MISSING, Predicate, compile_condition
+from app.services.execution_plan import ExecutionPlan, PlanCache, PlannedStep
+from app.services.metrics import RUNS_IN_FLIGHT, STEP_DURATION, STEP_RETRIES
+from app.services.llm_service import DEFAULT_MODEL, LLMService, TransientLLMError, get_llm_service
+from app.services.rate_limiter import admission_key
+from app.services.resilience import call_with_hedging, call_with_retry, call_with_timeout, iter_bounded
+from app.services.result_store import ResultStore, RunResults, current_results
+from app.services.streaming import EventSink, emit, event_sink, token_sink, token_streaming
+from app.services.template_engine import CompiledParameters
+from app.services.tracing import RunTrace, current_step, current_trace, trace_span
+from typing import Any, Callable, List, Dict, Optional, Set, Tuple
+import functools
 import logging
 import asyncio
-from collections import defaultdict
-import re
+import json
+import os
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 class WorkflowService:
     def __init__(self):
-        self.llm_service = LLMService()
-        self.action_handlers = {
-            "llm-call": self._handle_llm_call
-        }
+        self.llm_service: LLMService = get_llm_service()
+        self.actions = ActionRegistry()
+        self.actions.register("llm-call", self._handle_llm_call)
+        self.actions.register("map", self._handle_map)
+        for name, handler in BUILTIN_ACTIONS.items():
+            self.actions.register(name, handler)
+        self.actions.load_entry_points()
+        self.result_store = ResultStore()
+        self.checkpoint_store = CheckpointStore()
+        # Applies to workflows whose policy sets no timeout of their own; 0 means no limit
+        self.run_timeout = float(os.getenv("WORKFLOW_RUN_TIMEOUT", "0")) or None
+        self.map_concurrency = int(os.getenv("WORKFLOW_MAP_CONCURRENCY", "50"))
+        self.map_max_items = int(os.getenv("WORKFLOW_MAP_MAX_ITEMS", "10000"))
+        self.plans = PlanCache()
 
-    def _replace_step_references(self, text: str, step_results: List[Dict]) -> str:
-        """Replace {{Step X}} references with actual results"""
-        for step in step_results:
-            pattern = f"{{{{\s*{step['step_name']}\s*}}}}"
-            text = re.sub(pattern, step.get('result', ''), text)
-        return text
+    def _step_references(self, parameters: Dict, condition: Optional[Dict]) -> List[str]:
+        """Step names a step reads, via {{Step}} templates or its condition"""
+        names = list(CompiledParameters(parameters).references)
+        if condition:
+            names.extend(compile_condition(condition).steps)
+        return names
 
-    async def create_workflow(self, db: Session, workflow_data: WorkflowCreate) -> Workflow:
-        workflow = Workflow(workflow_name=workflow_data.workflow_name)
-        db.add(workflow)
-        db.flush()
+    def get_plan(self, db: Session, workflow_id: int) -> Optional[ExecutionPlan]:
+        """The execution plan of the workflow's current version; only the version is read when it is cached"""
+        current = db.query(Workflow.version, Workflow.created_at).filter(Workflow.id == workflow_id).first()
+        if current is None:
+            return None
+        plan = self.plans.get(workflow_id, current.version or 0, current.created_at)
+        if plan is not None:
+            return plan
+
+        workflow = self.get_workflow(db, workflow_id, refresh=True)
+        if workflow is None:
+            return None
+        plan = self._build_plan(workflow)
+        self.plans.put(plan)
+        return plan
+
+    def _build_plan(self, workflow: Workflow) -> ExecutionPlan:
+        steps = sorted(workflow.steps, key=lambda x: x.order)
+        dependencies = [step.depends_on for step in steps]
+        if any(step_dependencies is None for step_dependencies in dependencies):
+            # Workflows saved before dependencies were recorded
+            dependencies = self._build_dependencies(steps)
 
-        for idx, step in enumerate(workflow_data.steps):
-            db_step = WorkflowStep(
-                workflow_id=workflow.id,
+        planned = []
+        for step, step_dependencies in zip(steps, dependencies):
+            parameters = CompiledParameters(step.parameters)
+            condition = compile_condition(step.condition)
+            planned.append(PlannedStep(
                 step_name=step.step_name,
                 action=step.action,
-                parameters=step.parameters,
-                condition=step.condition.dict() if step.condition else None,
                 group=step.group,
-                order=idx
-            )
-            db.add(db_step)
+                parameters=parameters,
+                condition=condition,
+                policy=StepPolicy(**step.policy) if step.policy else None,
+                dependencies=tuple(step_dependencies),
+                prune_on=tuple(self._prune_sources(parameters, condition, step_dependencies))
+            ))
+        return ExecutionPlan(
+            workflow_id=workflow.id,
+            version=workflow.version or 0,
+            created_at=workflow.created_at,
+            workflow_name=workflow.workflow_name,
+            policy=WorkflowPolicy(**(workflow.policy or {})),
+            steps=tuple(planned)
+        )
 
-        db.commit()
-        db.refresh(workflow)
-        return workflow
+    def _build_dependencies(self, steps: List) -> List[List[str]]:
+        """Derive each step's dependencies on earlier steps; later or unknown names are ignored"""
+        dependencies = []
+        earlier = set()
+        for step in steps:
+            condition = step.condition
+            if condition is not None and not isinstance(condition, dict):
+                condition = condition.model_dump()
+            referenced = (step.depends_on or []) + self._step_references(step.parameters, condition)
+            step_dependencies = []
+            for name in referenced:
+                if name in earlier and name not in step_dependencies:
+                    step_dependencies.append(name)
+            dependencies.append(step_dependencies)
+            earlier.add(step.step_name)
+        return dependencies
+
+    def _step_rows(self, workflow_id: int, workflow_data: WorkflowCreate) -> List[Dict]:
+        """Column values for every step of a workflow definition, ready for a bulk write"""
+        dependencies = self._build_dependencies(workflow_data.steps)
+        return [
+            {
+                "workflow_id": workflow_id,
+                "step_name": step.step_name,
+                "action": step.action,
+                "parameters": step.parameters,
+                "condition": step.condition.model_dump() if step.condition else None,
+                "group": step.group,
+                "depends_on": dependencies[idx],
+                "policy": step.policy.model_dump() if step.policy else None,
+                "order": idx
+            }
+            for idx, step in enumerate(workflow_data.steps)
+        ]
+
+    def _policy_row(self, workflow_data: WorkflowCreate) -> Optional[Dict]:
+        return workflow_data.policy.model_dump() if workflow_data.policy else None
+
+    def _insert_steps(self, db: Session, rows: List[Dict]):
+        if rows:
+            db.execute(insert(WorkflowStep), rows)
+
+    async def create_workflow(self, db: Session, workflow_data: WorkflowCreate) -> Workflow:
+        return await run_db(db, self._create_workflow, workflow_data)
+
+    async def create_workflows(self, db: Session, workflows_data: List[WorkflowCreate]) -> List[Workflow]:
+        """Create many workflows in one transaction, with a single bulk insert for all steps"""
+        return await run_db(db, self._create_workflows, workflows_data)
 
     async def update_workflow(self, db: Session, workflow_id: int, workflow_data: WorkflowCreate) -> Workflow:
+        return await run_db(db, self._update_workflow, workflow_id, workflow_data)
+
+    def _create_workflow(self, db: Session, workflow_data: WorkflowCreate) -> Workflow:
+        workflow = Workflow(workflow_name=workflow_data.workflow_name, policy=self._policy_row(workflow_data))
+        db.add(workflow)
+        db.flush()
+
+        self._insert_steps(db, self._step_rows(workflow.id, workflow_data))
+
+        db.commit()
+        return self.get_workflow(db, workflow.id, refresh=True)
+
+    def _create_workflows(self, db: Session, workflows_data: List[WorkflowCreate]) -> List[Workflow]:
+        try:
+            workflows = [
+                Workflow(workflow_name=data.workflow_name, policy=self._policy_row(data))
+                for data in workflows_data
+            ]
+            db.add_all(workflows)
+            db.flush()
+
+            rows = []
+            for workflow, data in zip(workflows, workflows_data):
+                rows.extend(self._step_rows(workflow.id, data))
+            self._insert_steps(db, rows)
+            ids = [workflow.id for workflow in workflows]
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        loaded = {
+            workflow.id: workflow
+            for workflow in db.query(Workflow)
+            .options(selectinload(Workflow.steps))
+            .execution_options(populate_existing=True)
+            .filter(Workflow.id.in_(ids))
+        }
+        return [loaded[workflow_id] for workflow_id in ids]
+
+    def _update_workflow(self, db: Session, workflow_id: int, workflow_data: WorkflowCreate) -> Workflow:
         # Get existing workflow
         workflow = self.get_workflow(db, workflow_id)
         if not workflow:
             raise ValueError(f"Workflow {workflow_id} not found")
 
-        # Update workflow name
-        workflow.workflow_name = workflow_data.workflow_name
-
-        # Delete existing steps
-        db.query(WorkflowStep).filter(WorkflowStep.workflow_id == workflow_id).delete()
+        # Match new steps to existing ones by name so only real changes are written
+        existing: Dict[str, List[WorkflowStep]] = {}
+        for step in workflow.steps:
+            existing.setdefault(step.step_name, []).append(step)
 
-        # Add new steps
-        for idx, step in enumerate(workflow_data.steps):
-            db_step = WorkflowStep(
-                workflow_id=workflow.id,
-                step_name=step.step_name,
-                action=step.action,
-                parameters=step.parameters,
-                condition=step.condition.dict() if step.condition else None,
-                group=step.group,
-                order=idx
-            )
-            db.add(db_step)
+        inserts, updates = [], []
+        for row in self._step_rows(workflow.id, workflow_data):
+            matches = existing.get(row["step_name"])
+            if not matches:
+                inserts.append(row)
+                continue
+            current = matches.pop(0)
+            changed = {
+                column: value for column, value in row.items()
+                if getattr(current, column) != value
+            }
+            if changed:
+                updates.append({"id": current.id, **changed})
+        deletes = [step.id for steps in existing.values() for step in steps]
 
-        db.commit()
-        db.refresh(workflow)
-        return workflow
+        policy = self._policy_row(workflow_data)
+        changed_name = workflow.workflow_name != workflow_data.workflow_name
+        changed_policy = workflow.policy != policy
+        if not (inserts or updates or deletes or changed_name or changed_policy):
+            return workflow
 
-    def get_workflow(self, db: Session, workflow_id: int) -> Optional[Workflow]:
-        return db.query(Workflow).filter(Workflow.id == workflow_id).first()
+        logger.info(
+            f"Updating workflow {workflow_id}: {len(inserts)} added, "
+            f"{len(updates)} changed, {len(deletes)} removed steps"
+        )
+        # Update workflow name and bump the version so cached templates are recompiled
+        workflow.workflow_name = workflow_data.workflow_name
+        workflow.policy = policy
+        workflow.version = (workflow.version or 0) + 1
 
-    def get_workflows(self, db: Session, skip: int = 0, limit: int = 100) -> List[Workflow]:
-        return db.query(Workflow).offset(skip).limit(limit).all()
+        if deletes:
+            db.query(WorkflowStep).filter(WorkflowStep.id.in_(deletes)).delete(synchronize_session=False)
+        if updates:
+            db.execute(update(WorkflowStep), updates)
+        self._insert_steps(db, inserts)
 
-    def _evaluate_condition(self, condition: Dict, step_results: List[Dict]) -> bool:
-        if not condition:
-            return True
+        db.commit()
+        # Other processes notice the new version when they next check it
+        self.plans.invalidate(workflow_id)
+        return self.get_workflow(db, workflow_id, refresh=True)
 
-        target_step = next(
-            (r for r in step_results if r.get('step_name') == condition["step_name"]),
-            None
+    def get_workflow(self, db: Session, workflow_id: int, refresh: bool = False) -> Optional[Workflow]:
+        """Load a workflow with its steps; `refresh` overwrites stale copies held by the session"""
+        return (
+            db.query(Workflow)
+            .options(selectinload(Workflow.steps))
+            .execution_options(populate_existing=refresh)
+            .filter(Workflow.id == workflow_id)
+            .first()
         )
-        if not target_step:
-            return False
 
-        value = target_step.get('result', '')
-        condition_type = condition["type"]
+    def get_workflows(
+        self,
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        after_id: Optional[int] = None,
+        summary: bool = False
+    ) -> List:
+        """List workflows by id; steps are loaded in one extra query, or not at all in summary mode.
+
+        `after_id` gives keyset pagination (ids increase with creation time); `skip` is kept
+        for existing callers but degrades as the table grows.
+        """
+        if summary:
+            query = db.query(Workflow.id, Workflow.workflow_name, Workflow.version, Workflow.created_at)
+        else:
+            query = db.query(Workflow).options(selectinload(Workflow.steps))
 
-        if condition_type == "equals":
-            return value == condition["value"]
-        elif condition_type == "not_equals":
-            return value != condition["value"]
-        elif condition_type == "contains":
-            return condition["value"] in value
-        return False
+        query = query.order_by(Workflow.id)
+        if after_id is not None:
+            query = query.filter(Workflow.id > after_id)
+        elif skip:
+            query = query.offset(skip)
+        return query.limit(limit).all()
 
-    async def _execute_step(self, step: WorkflowStep, step_results: List[Dict]) -> Dict:
+    async def _execute_step(self, step: PlannedStep, step_results: Dict[str, Dict]) -> Dict:
+        started = time.perf_counter()
+        status = "error"
         try:
-            if step.condition and not self._evaluate_condition(step.condition, step_results):
+            step_results = await self._load_results(step_results)
+            if step.condition and not step.condition.evaluate(step_results):
+                status = "skipped"
+                await emit("step_skipped", {"step_name": step.step_name})
                 return {
                     "step_name": step.step_name,
                     "result": "",
                     "skipped": True
                 }
 
-            handler = self.action_handlers.get(step.action)
+            handler = self.actions.get(step.action)
             if not handler:
                 raise ValueError(f"Unsupported action: {step.action}")
 
             # Process any references in the parameters
-            processed_params = {}
-            for key, value in step.parameters.items():
-                if isinstance(value, str):
-                    processed_params[key] = self._replace_step_references(value, step_results)
-                else:
-                    processed_params[key] = value
+            with trace_span("render_templates", "template"):
+                processed_params = step.parameters.render(
+                    {name: result.get('result', '') for name, result in step_results.items()}
+                )
 
-            result = await handler(processed_params)
-            return {
+            checkpoints = current_checkpoints.get()
+            if checkpoints is not None:
+                input_hash = checkpoints.input_hash(
+                    step.action, self._checkpoint_parameters(step.action, processed_params), step_results
+                )
+                saved = checkpoints.lookup(step.step_name, input_hash)
+                if saved is not MISSING:
+                    record = await self._store_result({
+                        "step_name": step.step_name,
+                        "result": saved,
+                        "skipped": False,
+                        "reused": True
+                    })
+                    status = "reused"
+                    await emit("step_completed", {"step_name": step.step_name, "result": saved, "reused": True})
+                    return record
+
+            await emit("step_started", {"step_name": step.step_name})
+            if token_streaming.get() and not (step.policy and (step.policy.retry or step.policy.hedge)):
+                # Tokens from retried or hedged attempts would interleave, so only plain steps stream
+                token_sink.set(self._step_token_sink(step.step_name))
+            result = await self._invoke_handler(handler, processed_params, step.policy, step.action)
+            record = await self._store_result({
                 "step_name": step.step_name,
                 "result": result,
                 "skipped": False
-            }
+            })
+            status = "completed"
+            if checkpoints is not None:
+                checkpoints.record(step.step_name, input_hash, result)
+            await emit("step_completed", {"step_name": step.step_name, "result": result})
+            return record
 
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
         except Exception as e:
             logger.error(f"Error executing step {step.step_name}: {str(e)}")
+            await emit("step_error", {"step_name": step.step_name, "error": str(e)})
             return {
                 "step_name": step.step_name,
                 "result": "",
                 "error": str(e)
             }
+        finally:
+            STEP_DURATION.observe(time.perf_counter() - started, action=step.action, status=status)
 
-    async def execute_workflow(self, db: Session, workflow_id: int) -> Dict:
-        workflow = self.get_workflow(db, workflow_id)
-        if not workflow:
+    async def _load_results(self, step_results: Dict[str, Dict]) -> Dict[str, Dict]:
+        """The dependency results with stored values loaded back for this step to read"""
+        run_results = current_results.get()
+        if run_results is None:
+            return step_results
+        loaded = dict(step_results)
+        for name, result in step_results.items():
+            if result.get("result_handle"):
+                with trace_span("load_result", "db"):
+                    loaded[name] = await run_results.load(result)
+        return loaded
+
+    async def _store_result(self, record: Dict) -> Dict:
+        """Move a large result to the result store, keeping only its handle in the run"""
+        run_results = current_results.get()
+        if run_results is None:
+            return record
+        with trace_span("store_result", "db"):
+            return await run_results.offload(record)
+
+    def _checkpoint_parameters(self, action: str, parameters: Dict) -> Dict:
+        """Parameters as they affect the output; llm-call steps without a model use the default"""
+        if action == "llm-call" and "model" not in parameters:
+            return {**parameters, "model": DEFAULT_MODEL}
+        return parameters
+
+    def _hedge_delay(self, parameters: Dict, policy: StepPolicy) -> Optional[float]:
+        hedge = policy.hedge
+        if hedge.delay is not None:
+            return hedge.delay
+        model = parameters.get("model", DEFAULT_MODEL)
+        return self.llm_service.latency.quantile(model, hedge.quantile, hedge.min_samples)
+
+    async def _invoke_handler(
+        self, handler: Callable, parameters: Dict, policy: Optional[StepPolicy], action: str = ""
+    ) -> Any:
+        """Call a step handler under the step's retry, hedging and timeout policy"""
+        if not policy:
+            return await handler(parameters)
+
+        delay = self._hedge_delay(parameters, policy) if policy.hedge else None
+        if delay is not None:
+            # A hedged attempt must reach the provider rather than join the call it duplicates
+            parameters = {**parameters, "coalesce": False}
+        call = lambda: handler(dict(parameters))
+
+        if delay is not None:
+            single_call = call
+            call = lambda: call_with_hedging(single_call, delay, policy.hedge.max_hedges)
+
+        if policy.retry:
+            attempt_call = call
+            call = lambda: call_with_retry(
+                attempt_call,
+                is_transient=lambda e: isinstance(e, TransientLLMError),
+                on_retry=lambda attempt, e: STEP_RETRIES.inc(action=action),
+                **policy.retry.model_dump()
+            )
+        if policy.timeout is not None:
+            return await call_with_timeout(call, policy.timeout)
+        return await call()
+
+    async def _run_step(self, step: PlannedStep, dependencies: List[asyncio.Task]) -> Dict:
+        """Wait for the steps this one depends on, then execute it against their results.
+
+        A step that consumes the output of a skipped step is skipped too, without evaluating
+        its condition or calling its handler, so a pruned branch never reaches the LLM.
+        """
+        step_results = {result["step_name"]: result for result in await asyncio.gather(*dependencies)}
+        run_trace = current_trace.get()
+        if run_trace is not None:
+            # Each step runs in its own task, so this only labels spans from this step
+            current_step.set(step.step_name)
+            run_trace.start_step(step.step_name)
+
+        skipped = next((name for name in step.prune_on if step_results[name].get("skipped")), None)
+        if skipped is not None:
+            await emit("step_skipped", {"step_name": step.step_name, "pruned_by": skipped})
+            result = {
+                "step_name": step.step_name,
+                "result": "",
+                "skipped": True
+            }
+        else:
+            result = await self._execute_step(step, step_results)
+
+        if run_trace is not None:
+            status = "error" if result.get("error") else "skipped" if result.get("skipped") else "completed"
+            run_trace.finish_step(step.step_name, status)
+        return result
+
+    def _prune_sources(
+        self, parameters: CompiledParameters, condition: Optional[Predicate], dependencies: List[str]
+    ) -> List[str]:
+        """Dependencies whose skipping skips this step; steps only read by the condition are left to it"""
+        if condition is None:
+            return dependencies
+        return [
+            name for name in dependencies
+            if name not in condition.steps or name in parameters.references
+        ]
+
+    def _step_token_sink(self, step_name: str) -> Callable:
+        async def forward(token: str):
+            await emit("token", {"step_name": step_name, "token": token})
+        return forward
+
+    async def execute_workflow(
+        self,
+        db: Session,
+        workflow_id: int,
+        on_event: Optional[EventSink] = None,
+        stream_tokens: bool = False,
+        trace: bool = False,
+        reuse: bool = False,
+        cancel: Optional[asyncio.Event] = None
+    ) -> Dict:
+        """Run a workflow; with `trace`, the result carries a Chrome trace of the execution.
+
+        With `reuse`, steps whose inputs are unchanged since their last successful execution
+        return the checkpointed result instead of running again. Setting `cancel` stops the
+        run: unfinished steps are cancelled and reported, and the result says why it `stopped`.
+        Cancelling the calling task instead cancels every step and re-raises.
+        """
+        if reuse:
+            self.checkpoint_store.require()
+        run_trace = RunTrace(f"workflow {workflow_id}") if trace else None
+        trace_token = current_trace.set(run_trace)
+        try:
+            return await self._execute_workflow(
+                db, workflow_id, on_event, stream_tokens, run_trace, reuse, cancel
+            )
+        finally:
+            current_trace.reset(trace_token)
+
+    async def _execute_workflow(
+        self,
+        db: Session,
+        workflow_id: int,
+        on_event: Optional[EventSink],
+        stream_tokens: bool,
+        run_trace: Optional[RunTrace],
+        reuse: bool,
+        cancel: Optional[asyncio.Event]
+    ) -> Dict:
+        with trace_span("load_plan", "db"):
+            plan = await run_db(db, self.get_plan, workflow_id)
+        if plan is None:
             raise ValueError(f"Workflow {workflow_id} not found")
+        steps = plan.steps
+
+        checkpoints = None
+        if self.checkpoint_store.enabled:
+            saved = {}
+            if reuse:
+                with trace_span("load_checkpoints", "db"):
+                    saved = await run_db(db, self.checkpoint_store.load, workflow_id)
+            checkpoints = RunCheckpoints(workflow_id, saved, reuse)
+
+        # Start every step at once; each one only waits on the steps it depends on.
+        # Steps inherit the run's admission key so LLM calls are queued fairly per run.
+        tasks: List[asyncio.Task] = []
+        latest_task: Dict[str, asyncio.Task] = {}
+        key_token = admission_key.set(f"workflow:{workflow_id}:{uuid.uuid4().hex}")
+        sink_token = event_sink.set(on_event)
+        streaming_token = token_streaming.set(bool(on_event and stream_tokens))
+        checkpoints_token = current_checkpoints.set(checkpoints)
+        run_results = RunResults(self.result_store, db)
+        results_token = current_results.set(run_results)
+        try:
+            for step in steps:
+                if run_trace is not None:
+                    run_trace.schedule_step(step.step_name, list(step.dependencies))
+                task = asyncio.create_task(self._run_step(step, [latest_task[name] for name in step.dependencies]))
+                tasks.append(task)
+                latest_task[step.step_name] = task
+        finally:
+            current_results.reset(results_token)
+            current_checkpoints.reset(checkpoints_token)
+            token_streaming.reset(streaming_token)
+            event_sink.reset(sink_token)
+            admission_key.reset(key_token)
+
+        RUNS_IN_FLIGHT.inc()
+        try:
+            stopped, cancelled = await self._await_steps(steps, tasks, plan.policy, cancel)
+        finally:
+            RUNS_IN_FLIGHT.dec()
 
-        steps = sorted(workflow.steps, key=lambda x: x.order)
         results: List[Dict] = []
-        grouped_steps = defaultdict(list)
+        for index, (step, task) in enumerate(zip(steps, tasks)):
+            if not task.cancelled():
+                results.append(task.result())
+                continue
+            reason = cancelled.get(index, "Cancelled")
+            results.append({"step_name": step.step_name, "result": "", "cancelled": True, "error": reason})
+            if run_trace is not None:
+                run_trace.finish_step(step.step_name, "cancelled")
+            await emit("step_cancelled", {"step_name": step.step_name, "error": reason})
+        if stopped is not None:
+            logger.warning(f"Workflow {workflow_id} stopped early ({stopped}); {len(cancelled)} steps cancelled")
 
-        # Organize steps by group
-        for step in steps:
-            if step.group:
-                grouped_steps[step.group].append(step)
-            else:
-                grouped_steps[f"sequential_{step.order}"].append(step)
-
-        # Execute steps group by group
-        for group_name, group_steps in grouped_steps.items():
-            if group_name.startswith("sequential_"):
-                # Execute sequential step
-                step = group_steps[0]
-                result = await self._execute_step(step, results)
-                results.append(result)
-            else:
-                # Execute parallel steps
-                parallel_tasks = [
-                    self._execute_step(step, results)
-                    for step in group_steps
-                ]
-                parallel_results = await asyncio.gather(*parallel_tasks)
-                results.extend(parallel_results)
-
-        return {
-            "workflow_id": workflow.id,
-            "workflow_name": workflow.workflow_name,
-            "results": results
+        if checkpoints is not None and checkpoints.pending:
+            try:
+                with trace_span("save_checkpoints", "db"):
+                    await run_db(db, self.checkpoint_store.save, checkpoints)
+            except Exception as e:
+                logger.error(f"Failed to save checkpoints for workflow {workflow_id}: {str(e)}")
+        if checkpoints is not None and checkpoints.reused:
+            logger.info(f"Reused {checkpoints.reused} checkpointed steps of workflow {workflow_id}")
+
+        if run_results.stored:
+            logger.info(f"Stored {run_results.stored} large step results of workflow {workflow_id} by handle")
+
+        execution = {
+            "workflow_id": workflow_id,
+            "workflow_name": plan.workflow_name,
+            "results": results,
+            "stopped": stopped
         }
+        if run_trace is not None:
+            run_trace.name = plan.workflow_name
+            run_trace.finish()
+            execution["trace"] = run_trace.to_chrome()
+        return execution
+
+    async def _await_steps(
+        self,
+        steps: Tuple[PlannedStep, ...],
+        tasks: List[asyncio.Task],
+        policy: WorkflowPolicy,
+        cancel: Optional[asyncio.Event]
+    ) -> Tuple[Optional[str], Dict[int, str]]:
+        """Wait for every step task, stopping early on the run timeout, `cancel` or a fail-fast failure.
+
+        Returns why the run stopped (None if it ran to the end) and the reason each step was
+        cancelled, by step index. A cancelled step also cancels the steps waiting on its result.
+        """
+        if not tasks:
+            return None, {}
+        # Steps are tracked by index: workflows stored before names had to be unique may repeat one
+        dependents: Dict[int, List[int]] = {}
+        latest: Dict[str, int] = {}
+        for index, step in enumerate(steps):
+            for name in step.dependencies:
+                dependents.setdefault(latest[name], []).append(index)
+            latest[step.step_name] = index
+
+        stopped: Optional[str] = None
+        cancelled: Dict[int, str] = {}
+        all_done = asyncio.Event()
+        unfinished = len(tasks)
+
+        def stop(indices: Set[int], reason: str):
+            for index in indices:
+                task = tasks[index]
+                if not task.done() and index not in cancelled:
+                    cancelled[index] = reason
+                    task.cancel()
+
+        def downstream(index: int) -> Set[int]:
+            found, frontier = set(), [index]
+            while frontier:
+                for dependent in dependents.get(frontier.pop(), []):
+                    if dependent not in found:
+                        found.add(dependent)
+                        frontier.append(dependent)
+            return found
+
+        def on_done(index: int, task: asyncio.Task):
+            nonlocal stopped, unfinished
+            unfinished -= 1
+            if not unfinished:
+                all_done.set()
+            if not policy.fail_fast or task.cancelled() or task.exception() or not task.result().get("error"):
+                return
+            group = steps[index].group
+            if policy.fail_fast is True:
+                scope = set(range(len(tasks)))
+            elif group in policy.fail_fast:
+                # The rest of the group, and everything downstream of the failure or the group
+                scope = {
+                    other for other, step in enumerate(steps)
+                    if step.group == group and not tasks[other].done()
+                }
+                for member in scope | {index}:
+                    scope |= downstream(member)
+            else:
+                return
+            if any(not tasks[member].done() for member in scope):
+                stopped = stopped or "fail_fast"
+                stop(scope, f"Cancelled: step {steps[index].step_name} failed")
 
-    async def _handle_llm_call(self, parameters: Dict) -> str:
+        for index, task in enumerate(tasks):
+            task.add_done_callback(functools.partial(on_done, index))
+
+        timeout = policy.timeout or self.run_timeout
+        waiters = [asyncio.ensure_future(all_done.wait())]
+        if cancel is not None:
+            waiters.append(asyncio.ensure_future(cancel.wait()))
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not all_done.is_set():
+                if cancel is not None and cancel.is_set():
+                    stopped = "cancelled"
+                    stop(set(range(len(tasks))), "Cancelled: run was cancelled")
+                else:
+                    stopped = "timeout"
+                    stop(set(range(len(tasks))), f"Cancelled: run timed out after {timeout}s")
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            # The caller went away (for example a disconnected client): release everything now
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return stopped, cancelled
+
+    def _parse_output(self, text: str, output: str) -> Any:
+        if output == "text":
+            return text
+        if output != "json":
+            raise ValueError(f"Unsupported output format: {output}")
+        body = text.strip()
+        if body.startswith("```"):
+            # Models often wrap JSON in a markdown code fence
+            body = body.split("\n", 1)[1] if "\n" in body else ""
+            body = body.rsplit("```", 1)[0]
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise ValueError("LLM output is not valid JSON")
+
+    async def _handle_llm_call(self, parameters: Dict) -> Any:
         prompt = parameters.pop("prompt")
-        model = parameters.pop("model", "gpt-4-turbo")
-        return await self.llm_service.execute(prompt, model, parameters)
\ No newline at end of file
+        model = parameters.pop("model", DEFAULT_MODEL)
+        # Cache controls are step options, not provider parameters
+        use_cache = parameters.pop("cache", True)
+        cache_ttl = parameters.pop("cache_ttl", None)
+        coalesce = parameters.pop("coalesce", True)
+        output = parameters.pop("output", "text")
+        # Seconds the step's call should take; routes skip models whose recent latency exceeds it
+        latency_slo = parameters.pop("latency_slo", None)
+
+        forward = token_sink.get()
+        if forward is None:
+            text = await self.llm_service.execute(
+                prompt, model, parameters, use_cache=bool(use_cache), cache_ttl=cache_ttl,
+                coalesce=bool(coalesce), latency_slo=latency_slo
+            )
+            return self._parse_output(text, output)
+
+        tokens = []
+        async for token in self.llm_service.stream(
+            prompt, model, parameters, use_cache=bool(use_cache), cache_ttl=cache_ttl, latency_slo=latency_slo
+        ):
+            tokens.append(token)
+            await forward(token)
+        return self._parse_output("".join(tokens), output)
+
+    def _map_items(self, items: Any, split: MapSplit) -> List[Any]:
+        if isinstance(items, list):
+            return items
+        if split != MapSplit.LINES:
+            try:
+                decoded = json.loads(items)
+            except ValueError:
+                decoded = None
+            if isinstance(decoded, list):
+                return decoded
+            if split == MapSplit.JSON:
+                raise ValueError("map items are not a JSON array")
+        return [line.strip() for line in items.splitlines() if line.strip()]
+
+    async def _handle_map(self, parameters: Dict) -> List[Any]:
+        """Run the child step once per item with bounded concurrency; the result is a list in item order"""
+        spec = MapParameters(**parameters)
+        handler = self.actions.get(spec.step.action)
+        if not handler:
+            raise ValueError(f"Unsupported action: {spec.step.action}")
+
+        items = self._map_items(spec.items, spec.split)
+        if len(items) > self.map_max_items:
+            raise ValueError(f"map got {len(items)} items, more than the limit of {self.map_max_items}")
+
+        child = CompiledParameters(spec.step.parameters)
+        policy = spec.step.policy
+        concurrency = min(spec.concurrency or self.map_concurrency, self.map_concurrency)
+        # Tokens from concurrent items would interleave on the step's stream
+        token_sink.set(None)
+
+        async def run_item(index: int, item: Any) -> Any:
+            return await self._invoke_handler(
+                handler, child.render({"item": item, "index": index}), policy, spec.step.action
+            )
+
+        results: List[Any] = [None] * len(items)
+        outcomes = iter_bounded(items, run_item, concurrency)
+        try:
+            async for index, result, error in outcomes:
+                if error is None:
+                    results[index] = result
+                elif spec.on_error == "fail":
+                    raise ValueError(f"Item {index} failed: {str(error)}")
+                else:
+                    logger.warning(f"Skipping failed map item {index}: {str(error)}")
+        finally:
+            # Stops the items still running once one has failed the step
+            await outcomes.aclose()
+        return results
@@ -0,0 +1,130 @@
+"""Local stand-in for the OpenAI chat completions API, for benchmarks and load tests.
+
+Latency follows a configurable distribution, a fraction of requests can fail with a
+provider error, and `stream: true` requests get SSE token chunks spread over the latency.
+
+    python -m benchmarks.mock_llm_server --port 8100 --latency-ms 200 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+@dataclass
+class MockLLMConfig:
+    latency_ms: float = 50.0
+    # fixed, uniform (latency_ms +/- jitter) or lognormal (median latency_ms, sigma jitter)
+    distribution: str = "lognormal"
+    jitter: float = 0.3
+    error_rate: float = 0.0
+    error_status: int = 503
+    completion_tokens: int = 32
+    seed: Optional[int] = 1234
+
+    def sample_latency(self, rng: random.Random) -> float:
+        base = self.latency_ms / 1000
+        if self.distribution == "fixed":
+            return base
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(base * (1 - self.jitter), base * (1 + self.jitter)))
+        return rng.lognormvariate(0, self.jitter) * base
+
+def create_app(config: MockLLMConfig) -> FastAPI:
+    app = FastAPI(title="Mock LLM")
+    rng = random.Random(config.seed)
+    app.state.requests = 0
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        latency = config.sample_latency(rng)
+        prompt = body["messages"][-1]["content"]
+        words = [f"tok{i}" for i in range(config.completion_tokens)]
+
+        if rng.random() < config.error_rate:
+            await asyncio.sleep(latency / 2)
+            return JSONResponse({"error": {"message": "mock provider error"}}, status_code=config.error_status)
+
+        if body.get("stream"):
+            async def chunks():
+                delay = latency / max(1, len(words))
+                for word in words:
+                    await asyncio.sleep(delay)
+                    chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency)
+        return {
+            "choices": [{"message": {"role": "assistant", "content": " ".join(words)}}],
+            "usage": {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(words)}
+        }
+
+    return app
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class MockLLMServer:
+    """Runs the mock on a background thread: `with MockLLMServer(config) as server: server.base_url`"""
+
+    def __init__(self, config: MockLLMConfig, port: Optional[int] = None):
+        self.config = config
+        self.port = port or _free_port()
+        self.app = create_app(config)
+        self._server = uvicorn.Server(uvicorn.Config(
+            self.app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False
+        ))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "MockLLMServer":
+        self._thread.start()
+        deadline = time.time() + 10
+        while not self._server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Mock LLM server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    config = MockLLMConfig(
+        latency_ms=args.latency_ms,
+        distribution=args.distribution,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        completion_tokens=args.completion_tokens
+    )
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Benchmark the API in-process against the mock LLM server.
+
+    python -m benchmarks.run                      # run everything, compare with baselines.json
+    python -m benchmarks.run --scenarios deep_chain --latency-ms 100
+    python -m benchmarks.run --save-baseline      # record the current numbers as the baseline
+
+Requests go through the real FastAPI app (routing, validation, DB, admission, LLM client)
+over an in-process ASGI transport, so an event-loop lag probe can run on the app's own loop.
+LLM calls travel over real HTTP to the mock server. Exits with status 1 when a scenario's
+p95 latency or throughput is worse than the baseline by more than the tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.mock_llm_server import MockLLMConfig, MockLLMServer
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+SCENARIOS = ["execute_llm", "execute_llm_stream", "wide_parallel", "deep_chain", "list_workflows"]
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+class LoopLagProbe:
+    """Measures how late a periodic timer fires on the running loop; blocking code shows up as lag"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> List[float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.samples
+
+async def measure(
+    operation: Callable[[int], Awaitable[bool]],
+    count: int,
+    concurrency: int
+) -> Dict:
+    """Run `operation(i)` `count` times with bounded concurrency; it returns False on failure"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await operation(i)
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    probe = LoopLagProbe()
+    probe.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    lag = await probe.stop()
+
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(lag, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lag, default=0.0) * 1000, 2)
+    }
+
+def llm_step(name: str, prompt: str) -> Dict:
+    return {"step_name": name, "action": "llm-call", "parameters": {"prompt": prompt, "cache": False}}
+
+async def create_workflow(client: httpx.AsyncClient, workflow: Dict) -> int:
+    response = await client.post("/api/v1/workflows", json=workflow)
+    response.raise_for_status()
+    return response.json()["id"]
+
+async def scenario_execute_llm(client: httpx.AsyncClient, args) -> Dict:
+    async def call(i: int) -> bool:
+        response = await client.post("/api/v1/execute-llm", json={"prompt": f"Question {i}", "cache": False})
+        return response.status_code == 200
+    return await measure(call, args.requests, args.concurrency)
+
+async def scenario_execute_llm_stream(client: httpx.AsyncClient, args) -> Dict:
+    async def call(i: int) -> bool:
+        body = {"prompt": f"Question {i}", "cache": False}
+        async with client.stream("POST", "/api/v1/execute-llm/stream", json=body) as response:
+            text = "".join([chunk async for chunk in response.aiter_text()])
+        return response.status_code == 200 and "event: completed" in text
+    return await measure(call, args.requests, args.concurrency)
+
+async def scenario_wide_parallel(client: httpx.AsyncClient, args) -> Dict:
+    workflow_id = await create_workflow(client, {
+        "workflow_name": "Benchmark wide parallel",
+        "steps": [llm_step(f"Branch {i}", f"Independent question {i}") for i in range(args.width)]
+    })
+
+    async def run(i: int) -> bool:
+        response = await client.post(f"/api/v1/workflows/{workflow_id}/execute")
+        return response.status_code == 200 and not any(r.get("error") for r in response.json()["results"])
+    return await measure(run, args.executions, args.concurrency)
+
+async def scenario_deep_chain(client: httpx.AsyncClient, args) -> Dict:
+    steps = [llm_step("Step 0", "Start")]
+    for i in range(1, args.depth):
+        steps.append(llm_step(f"Step {i}", f"Continue from {{{{Step {i - 1}}}}}"))
+    workflow_id = await create_workflow(client, {"workflow_name": "Benchmark deep chain", "steps": steps})
+
+    async def run(i: int) -> bool:
+        response = await client.post(f"/api/v1/workflows/{workflow_id}/execute")
+        return response.status_code == 200 and not any(r.get("error") for r in response.json()["results"])
+    return await measure(run, args.executions, args.concurrency)
+
+async def scenario_list_workflows(client: httpx.AsyncClient, args) -> Dict:
+    batch = 500
+    for start in range(0, args.workflows, batch):
+        workflows = [
+            {"workflow_name": f"Listed {i}", "steps": [llm_step("A", "a"), llm_step("B", "{{A}}")]}
+            for i in range(start, min(args.workflows, start + batch))
+        ]
+        response = await client.post("/api/v1/workflows/bulk", json={"workflows": workflows})
+        response.raise_for_status()
+
+    async def page_through(i: int) -> bool:
+        params = {"limit": 100}
+        if i % 2:
+            params["fields"] = "summary"
+        while True:
+            response = await client.get("/api/v1/workflows", params=params)
+            if response.status_code != 200:
+                return False
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return True
+            params["cursor"] = cursor
+    return await measure(page_through, args.listings, min(args.concurrency, 8))
+
+SCENARIO_FUNCTIONS = {
+    "execute_llm": scenario_execute_llm,
+    "execute_llm_stream": scenario_execute_llm_stream,
+    "wide_parallel": scenario_wide_parallel,
+    "deep_chain": scenario_deep_chain,
+    "list_workflows": scenario_list_workflows
+}
+
+async def run_scenarios(args) -> Dict[str, Dict]:
+    # Imported late: the app reads its configuration from the environment at import time
+    from app.database import dispose_engine, init_db
+    from app.main import app
+    from app.services.llm_service import get_llm_service
+
+    # Per-request INFO logs would dominate the measurements
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    await init_db()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+        for name in args.scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = await SCENARIO_FUNCTIONS[name](client, args)
+    await get_llm_service().close()
+    await dispose_engine()
+    return results
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if current["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {expected['p95_ms']}ms")
+        if current["throughput_rps"] < expected["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput_rps']}/s vs baseline {expected['throughput_rps']}/s"
+            )
+        if current["errors"] > expected["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {expected['errors']}")
+    return regressions
+
+def print_table(results: Dict[str, Dict]):
+    columns = ["requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "loop_lag_p99_ms", "loop_lag_max_ms"]
+    print(f"{'scenario':<20}" + "".join(f"{column:>17}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:<20}" + "".join(f"{result[column]:>17}" for column in columns))
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=500, help="Calls for the execute_llm scenarios")
+    parser.add_argument("--executions", type=int, default=20, help="Workflow executions per workflow scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--width", type=int, default=50, help="Steps in the wide parallel workflow")
+    parser.add_argument("--depth", type=int, default=20, help="Steps in the deep sequential chain")
+    parser.add_argument("--workflows", type=int, default=2000, help="Workflows created for list_workflows")
+    parser.add_argument("--listings", type=int, default=10, help="Full paginated listings")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--llm-url",
+        help="Use an already running mock (python -m benchmarks.mock_llm_server) instead of an in-process one"
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--output", help="Also write the results as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO logging")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    config = MockLLMConfig(
+        latency_ms=args.latency_ms,
+        distribution=args.distribution,
+        jitter=args.jitter,
+        error_rate=args.error_rate
+    )
+
+    server = contextlib.nullcontext() if args.llm_url else MockLLMServer(config)
+    with tempfile.TemporaryDirectory() as workdir, server:
+        os.environ.update({
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_BASE_URL": args.llm_url or server.base_url,
+            "DATABASE_URL": os.environ.get("BENCHMARK_DATABASE_URL", f"sqlite:///{workdir}/benchmark.db"),
+            # Match the HTTP pool size (LLM_MAX_CONNECTIONS): calls beyond it queue inside httpcore,
+            # whose pool does work proportional to its queue on every request
+            "LLM_MAX_CONCURRENCY": os.environ.get("LLM_MAX_CONCURRENCY", "100"),
+            "LLM_MODEL_CONCURRENCY": os.environ.get("LLM_MODEL_CONCURRENCY", "100")
+        })
+        os.environ.pop("LLM_CACHE_ENABLED", None)
+        results = asyncio.run(run_scenarios(args))
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline recorded; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""Gunicorn settings for running several uvicorn workers: `gunicorn app.main:app -c gunicorn.conf.py`
+
+Set SHARED_STATE_URL so rate limits and request deduplication span the workers.
+"""
+import asyncio
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# LLM calls and streamed responses can legitimately take minutes
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+def on_starting(server):
+    # Migrate once in the master, so workers starting together do not race on schema changes
+    from app.database import dispose_engine, init_db
+
+    async def migrate():
+        await init_db()
+        await dispose_engine()
+
+    asyncio.run(migrate())
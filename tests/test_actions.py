@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from importlib.metadata import EntryPoint
+import pytest
+from app.services import actions
+from app.services.actions import ENTRY_POINT_GROUP, ActionRegistry, action
+from app.services.builtin_actions import json_select, text_chunk
+
+@action(mode="thread")
+def shout(parameters):
+    return {"text": parameters["text"].upper(), "thread": threading.get_ident()}
+
+async def echo(parameters):
+    return parameters["text"]
+
+def test_handlers_must_match_their_mode():
+    registry = ActionRegistry()
+    with pytest.raises(ValueError):
+        registry.register("sync-on-loop", lambda parameters: None)
+    with pytest.raises(ValueError):
+        registry.register("async-in-pool", echo, mode="process")
+    with pytest.raises(ValueError):
+        registry.register("bad-mode", echo, mode="gpu")
+    assert registry.get("unknown") is None
+
+def test_actions_dispatch_to_their_executor():
+    registry = ActionRegistry(thread_workers=2, process_workers=1)
+    registry.register("echo", echo)
+    registry.register("shout", shout)
+    registry.register("chunk", text_chunk)
+
+    async def run():
+        return (
+            await registry.get("echo")({"text": "hi"}),
+            await registry.get("shout")({"text": "hi"}),
+            await registry.get("chunk")({"input": "one two three", "size": 8, "overlap": 0})
+        )
+
+    try:
+        echoed, shouted, chunks = asyncio.run(run())
+    finally:
+        registry.shutdown()
+    assert echoed == "hi"
+    assert shouted["text"] == "HI" and shouted["thread"] != threading.get_ident()
+    assert chunks == ["one two", "three"]
+    assert registry.describe() == [
+        {"name": "chunk", "mode": "process"}, {"name": "echo", "mode": "loop"}, {"name": "shout", "mode": "thread"}
+    ]
+
+def test_entry_point_plugins_are_loaded(monkeypatch):
+    plugins = [
+        EntryPoint(name="shout", value="tests.test_actions:shout", group=ENTRY_POINT_GROUP),
+        EntryPoint(name="broken", value="tests.missing_module:handler", group=ENTRY_POINT_GROUP)
+    ]
+    monkeypatch.setattr(actions, "entry_points", lambda group: plugins if group == ENTRY_POINT_GROUP else [])
+
+    registry = ActionRegistry()
+    registry.load_entry_points()
+    assert registry.names() == ["shout"]
+    assert registry.describe()[0]["mode"] == "thread"
+
+def test_builtin_json_select():
+    data = '{"orders": [{"id": 1, "total": 9.5, "notes": "x"}, {"id": 2, "total": 3, "notes": "y"}]}'
+    assert json_select({"input": data, "path": "orders", "fields": ["id", "total"]}) == [
+        {"id": 1, "total": 9.5}, {"id": 2, "total": 3}
+    ]
+    assert json_select({"input": {"a": {"b": 2}}, "path": "a.b"}) == 2
+    with pytest.raises(ValueError):
+        json_select({"input": data, "path": "missing"})
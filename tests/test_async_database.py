@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from unittest.mock import patch
+from app.main import app
+from app.database import Base, get_db
+
+TEST_DATABASE_URL = "sqlite+aiosqlite:///./test_async.db"
+
+engine = create_async_engine(TEST_DATABASE_URL)
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+async def reset_tables(create: bool):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        if create:
+            await conn.run_sync(Base.metadata.create_all)
+
+@pytest.fixture
+def client():
+    asyncio.run(reset_tables(create=True))
+
+    async def override_get_db():
+        db: AsyncSession = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        asyncio.run(reset_tables(create=False))
+        asyncio.run(engine.dispose())
+
+def test_workflow_lifecycle_on_async_session(client):
+    workflow_data = {
+        "workflow_name": "Async Workflow",
+        "steps": [
+            {"step_name": "Ask", "action": "llm-call", "parameters": {"prompt": "Hello"}},
+            {"step_name": "Answer", "action": "llm-call", "parameters": {"prompt": "Reply to {{Ask}}"}}
+        ]
+    }
+
+    created = client.post("/api/v1/workflows", json=workflow_data)
+    assert created.status_code == 200
+    workflow_id = created.json()["id"]
+    assert [s["depends_on"] for s in created.json()["steps"]] == [[], ["Ask"]]
+
+    workflow_data["steps"][1]["parameters"]["prompt"] = "Answer {{Ask}}"
+    updated = client.put(f"/api/v1/workflows/{workflow_id}", json=workflow_data)
+    assert updated.status_code == 200
+    assert updated.json()["version"] == 2
+    assert updated.json()["steps"][1]["parameters"]["prompt"] == "Answer {{Ask}}"
+
+    assert client.get(f"/api/v1/workflows/{workflow_id}").json()["workflow_name"] == "Async Workflow"
+    assert len(client.get("/api/v1/workflows").json()) == 1
+
+    with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = ["Hi", "Hi back"]
+        executed = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    assert executed.status_code == 200
+    assert [r["result"] for r in executed.json()["results"]] == ["Hi", "Hi back"]
+    assert mock_execute.call_args_list[1].args[0] == "Answer Hi"
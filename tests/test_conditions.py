@@ -0,0 +1,56 @@
+import pytest
+from pydantic import ValidationError
+from app.schemas.workflow import Condition
+from app.services.conditions import compile_condition
+
+def results(**records):
+    return {name: {"step_name": name, "result": value, "skipped": False} for name, value in records.items()}
+
+def test_legacy_conditions_compare_the_raw_result():
+    assert compile_condition({"type": "equals", "step_name": "A", "key": "result", "value": "yes"}).evaluate(results(A="yes"))
+    assert compile_condition({"type": "not_equals", "step_name": "A", "value": "yes"}).evaluate(results(A="no"))
+    assert compile_condition({"type": "contains", "step_name": "A", "value": "rain"}).evaluate(results(A="light rain"))
+
+def test_missing_step_is_false():
+    assert not compile_condition({"type": "not_equals", "step_name": "A", "value": "x"}).evaluate({})
+
+def test_regex_and_numeric_operators():
+    assert compile_condition({"type": "regex", "step_name": "A", "value": r"^\d+ items?$"}).evaluate(results(A="3 items"))
+    assert compile_condition({"type": "gt", "step_name": "A", "value": 0.5}).evaluate(results(A=" 0.75 "))
+    assert not compile_condition({"type": "lte", "step_name": "A", "value": "10"}).evaluate(results(A="eleven"))
+
+def test_json_path_into_structured_result():
+    records = results(A='{"score": 8, "tags": ["urgent", "billing"]}')
+    assert compile_condition({"type": "gte", "step_name": "A", "key": "result.score", "value": 8}).evaluate(records)
+    assert compile_condition({"type": "equals", "step_name": "A", "key": "$.result.tags[1]", "value": "billing"}).evaluate(records)
+    assert not compile_condition({"type": "equals", "step_name": "A", "key": "result.missing", "value": "x"}).evaluate(records)
+
+def test_and_or_composition_collects_steps():
+    predicate = compile_condition({
+        "type": "or",
+        "conditions": [
+            {"type": "equals", "step_name": "A", "value": "yes"},
+            {"type": "and", "conditions": [
+                {"type": "contains", "step_name": "B", "value": "ok"},
+                {"type": "lt", "step_name": "C", "value": 3}
+            ]}
+        ]
+    })
+    assert predicate.steps == ["A", "B", "C"]
+    assert predicate.evaluate(results(A="no", B="ok!", C="2"))
+    assert not predicate.evaluate(results(A="no", B="ok!", C="5"))
+
+def test_schema_rejects_invalid_conditions():
+    with pytest.raises(ValidationError):
+        Condition(type="regex", step_name="A", value="(unclosed")
+    with pytest.raises(ValidationError):
+        Condition(type="gt", step_name="A", value="many")
+    with pytest.raises(ValidationError):
+        Condition(type="and", conditions=[])
+    with pytest.raises(ValidationError):
+        Condition(type="equals", value="yes")
+
+def test_schema_keeps_the_value_type():
+    values = [Condition(type="equals", step_name="A", value=value).value for value in (1, 1.5, True, "1")]
+    assert values == [1, 1.5, True, "1"]
+    assert [type(value) for value in values] == [int, float, bool, str]
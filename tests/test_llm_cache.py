@@ -0,0 +1,89 @@
+import asyncio
+import httpx
+from app.services.llm_cache import LLMCache
+from app.services.llm_service import LLMService
+
+def make_service(monkeypatch, cache):
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(request)
+        content = f"answer {len(calls)}"
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    return LLMService(transport=httpx.MockTransport(handler), cache=cache), calls
+
+def test_repeated_prompt_is_served_from_cache(monkeypatch):
+    cache = LLMCache(max_entries=10, ttl=60)
+    service, calls = make_service(monkeypatch, cache)
+
+    async def run():
+        first = await service.execute("Hello", "gpt-4-turbo", {"temperature": 0})
+        second = await service.execute("Hello", "gpt-4-turbo", {"temperature": 0})
+        other = await service.execute("Hello", "gpt-4-turbo", {"temperature": 1})
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert first == second == "answer 1"
+    assert other == "answer 2"
+    assert len(calls) == 2
+    stats = service.cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+def test_bypass_skips_cache(monkeypatch):
+    service, calls = make_service(monkeypatch, LLMCache(max_entries=10, ttl=60))
+
+    async def run():
+        await service.execute("Hello")
+        return await service.execute("Hello", use_cache=False)
+
+    assert asyncio.run(run()) == "answer 2"
+    assert len(calls) == 2
+
+def test_expired_entries_are_refetched(monkeypatch):
+    service, calls = make_service(monkeypatch, LLMCache(max_entries=10, ttl=60))
+
+    async def run():
+        await service.execute("Hello", cache_ttl=0)
+        return await service.execute("Hello")
+
+    assert asyncio.run(run()) == "answer 2"
+
+def test_lru_eviction():
+    cache = LLMCache(max_entries=2, ttl=60)
+
+    async def run():
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        await cache.get("a")
+        await cache.set("c", "3")
+        return await cache.get("a"), await cache.get("b"), await cache.get("c")
+
+    assert asyncio.run(run()) == ("1", None, "3")
+    assert cache.evictions == 1
+
+def test_persistent_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def write():
+        await LLMCache(max_entries=10, ttl=60, path=path).set("key", "value")
+
+    async def read():
+        cache = LLMCache(max_entries=10, ttl=60, path=path)
+        return await cache.get("key"), cache.persistent_hits
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == ("value", 1)
+
+def test_persistent_tier_is_size_capped(tmp_path):
+    cache = LLMCache(max_entries=10, ttl=60, path=str(tmp_path / "cache.db"), max_persistent_entries=2)
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await cache.set(key, key)
+
+    asyncio.run(run())
+    count = cache._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    assert count == 2
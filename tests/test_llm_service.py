@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from app.services.llm_service import LLMService
+
+def make_service(monkeypatch, handler):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    return LLMService(transport=httpx.MockTransport(handler))
+
+def completion(content: str) -> dict:
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+def test_execute_posts_chat_completion(monkeypatch):
+    seen = {}
+
+    async def handler(request: httpx.Request):
+        seen["path"] = request.url.path
+        seen["auth"] = request.headers["Authorization"]
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json=completion("Hi there"))
+
+    service = make_service(monkeypatch, handler)
+    result = asyncio.run(service.execute("Hello", "gpt-4-turbo", {"temperature": 0}))
+
+    assert result == "Hi there"
+    assert seen["path"].endswith("/chat/completions")
+    assert seen["auth"] == "Bearer test-key"
+    assert seen["body"]["messages"] == [{"role": "user", "content": "Hello"}]
+    assert seen["body"]["temperature"] == 0
+
+def test_concurrent_calls_overlap(monkeypatch):
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json=completion("done"))
+
+    service = make_service(monkeypatch, handler)
+
+    async def run():
+        start = time.perf_counter()
+        results = await asyncio.gather(*[service.execute(f"p{i}") for i in range(5)])
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run())
+    assert results == ["done"] * 5
+    # Five 200ms calls must run concurrently rather than back to back
+    assert elapsed < 0.6
+
+def test_provider_error_raises_value_error(monkeypatch):
+    async def handler(request: httpx.Request):
+        return httpx.Response(500, json={"error": {"message": "boom"}})
+
+    service = make_service(monkeypatch, handler)
+    with pytest.raises(ValueError):
+        asyncio.run(service.execute("Hello"))
+
+def test_identical_in_flight_requests_are_coalesced(monkeypatch):
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(json.loads(request.content)["messages"][0]["content"])
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=completion("shared"))
+
+    service = make_service(monkeypatch, handler)
+
+    async def run():
+        same = [service.execute("Same prompt", "gpt-4-turbo", {"temperature": 0}) for _ in range(5)]
+        fresh = service.execute("Same prompt", "gpt-4-turbo", {"temperature": 0}, use_cache=False)
+        return await asyncio.gather(*same, fresh)
+
+    results = asyncio.run(run())
+    assert results == ["shared"] * 6
+    # Five coalesced callers share one call; the opted-out caller makes its own
+    assert len(calls) == 2
+    assert service._flights == {}
+
+def test_cancelled_follower_does_not_cancel_shared_call(monkeypatch):
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=completion("done"))
+
+    service = make_service(monkeypatch, handler)
+
+    async def run():
+        leader = asyncio.create_task(service.execute("p", "gpt-4-turbo", {}))
+        follower = asyncio.create_task(service.execute("p", "gpt-4-turbo", {}))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await leader
+
+    assert asyncio.run(run()) == "done"
+
+def test_batch_keeps_order_bounds_concurrency_and_reports_errors(monkeypatch):
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal in_flight, peak
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01 if prompt != "p0" else 0.05)
+        in_flight -= 1
+        if prompt == "p3":
+            return httpx.Response(400, json={"error": "bad"})
+        return httpx.Response(200, json=completion(prompt.upper()))
+
+    service = make_service(monkeypatch, handler)
+    prompts = [f"p{i}" for i in range(10)]
+    results = asyncio.run(service.execute_batch(prompts, "gpt-4-turbo", parameters={}, concurrency=3))
+
+    assert [item["index"] for item in results] == list(range(10))
+    assert results[0]["result"] == "P0"
+    assert "error" in results[3]
+    assert peak <= 3
@@ -0,0 +1,88 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.database import Base, get_db
+from app.routes.workflow import run_service
+from app.services.llm_service import LLMService
+from app.services.metrics import (
+    DB_QUERY_DURATION, LLM_DURATION, LLM_REQUESTS, LLM_TOKENS, MetricsRegistry
+)
+
+TEST_DATABASE_URL = "sqlite:///./test_metrics.db"
+
+engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def client():
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    original_factory = run_service.session_factory
+    run_service.session_factory = TestingSessionLocal
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        run_service.session_factory = original_factory
+        app.dependency_overrides.clear()
+        Base.metadata.drop_all(bind=engine)
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("step_seconds", "Step time", ["action"], buckets=[0.1, 1.0])
+    histogram.observe(0.05, action="llm-call")
+    histogram.observe(0.5, action="llm-call")
+    histogram.observe(5, action="llm-call")
+    registry.counter("calls_total", "Calls", ["status"]).inc(status='say "hi"')
+
+    text = registry.render()
+    assert "# TYPE step_seconds histogram" in text
+    assert 'step_seconds_bucket{action="llm-call",le="0.1"} 1' in text
+    assert 'step_seconds_bucket{action="llm-call",le="1"} 2' in text
+    assert 'step_seconds_bucket{action="llm-call",le="+Inf"} 3' in text
+    assert 'step_seconds_count{action="llm-call"} 3' in text
+    assert 'calls_total{status="say \\"hi\\""} 1' in text
+
+def test_registering_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter("a_total", "A") is registry.counter("a_total", "A")
+
+def test_llm_calls_record_latency_and_tokens(monkeypatch):
+    async def handler(request: httpx.Request):
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "Hi"}}],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 2}
+        })
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    service = LLMService(transport=httpx.MockTransport(handler))
+    calls = LLM_DURATION.count(model="metrics-model")
+    tokens_in = LLM_TOKENS.value(model="metrics-model", direction="in")
+
+    asyncio.run(service.execute("Hello", "metrics-model", {}, use_cache=False))
+
+    assert LLM_DURATION.count(model="metrics-model") == calls + 1
+    assert LLM_REQUESTS.value(model="metrics-model", status="ok") >= 1
+    assert LLM_TOKENS.value(model="metrics-model", direction="in") == tokens_in + 7
+
+def test_metrics_endpoint_exposes_registry(client):
+    client.get("/api/v1/workflows/424242")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE workflow_step_duration_seconds histogram" in response.text
+    assert "# TYPE workflow_runs_in_flight gauge" in response.text
+    assert DB_QUERY_DURATION.count(operation="SELECT") >= 1
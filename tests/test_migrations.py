@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from app.migrations import MIGRATIONS, migrate
+
+TEST_DATABASE_PATH = "./test_migrations.db"
+
+@pytest.fixture
+def legacy_db():
+    """A database file with the original schema, before versions, dependencies and policies"""
+    if os.path.exists(TEST_DATABASE_PATH):
+        os.remove(TEST_DATABASE_PATH)
+    conn = sqlite3.connect(TEST_DATABASE_PATH)
+    conn.executescript("""
+        CREATE TABLE workflows (
+            id INTEGER PRIMARY KEY, workflow_name VARCHAR, description TEXT,
+            parameters JSON, created_at DATETIME, updated_at DATETIME
+        );
+        CREATE TABLE workflow_steps (
+            id INTEGER PRIMARY KEY, workflow_id INTEGER REFERENCES workflows(id),
+            step_name VARCHAR, action VARCHAR, parameters JSON, condition JSON, "order" INTEGER
+        );
+        INSERT INTO workflows (id, workflow_name, description, parameters)
+            VALUES (1, 'Legacy', 'Created before migrations', '{}');
+        INSERT INTO workflow_steps (id, workflow_id, step_name, action, parameters, "order")
+            VALUES (1, 1, 'Step1', 'llm-call', '{"prompt": "hi"}', 0);
+    """)
+    conn.commit()
+    conn.close()
+    engine = create_engine(f"sqlite:///{TEST_DATABASE_PATH}")
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        os.remove(TEST_DATABASE_PATH)
+
+def test_migrate_upgrades_legacy_schema_in_place(legacy_db):
+    with legacy_db.begin() as conn:
+        migrate(conn)
+
+    inspector = inspect(legacy_db)
+    assert "version" in {c["name"] for c in inspector.get_columns("workflows")}
+    assert {"depends_on", "policy"} <= {c["name"] for c in inspector.get_columns("workflow_steps")}
+    assert "ix_workflow_steps_workflow_id_order" in {i["name"] for i in inspector.get_indexes("workflow_steps")}
+    assert "workflow_runs" in inspector.get_table_names()
+
+    with legacy_db.connect() as conn:
+        assert conn.execute(text("SELECT workflow_name, version FROM workflows")).all() == [("Legacy", 1)]
+        assert conn.execute(text("SELECT step_name FROM workflow_steps")).scalars().all() == ["Step1"]
+        applied = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+        assert applied == [version for version, _, _ in MIGRATIONS]
+
+def test_migrate_is_idempotent(legacy_db):
+    for _ in range(2):
+        with legacy_db.begin() as conn:
+            migrate(conn)
+
+    with legacy_db.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_migrations")).scalar() == len(MIGRATIONS)
+        assert conn.execute(text("SELECT COUNT(*) FROM workflows")).scalar() == 1
+
+def test_step_lookup_uses_composite_index(legacy_db):
+    with legacy_db.begin() as conn:
+        migrate(conn)
+        plan = conn.execute(text(
+            'EXPLAIN QUERY PLAN SELECT * FROM workflow_steps WHERE workflow_id = 1 ORDER BY "order"'
+        )).all()
+
+    assert any("ix_workflow_steps_workflow_id_order" in row[-1] for row in plan)
+
+def test_production_profile_enables_wal(tmp_path):
+    from app.database import apply_sqlite_profile
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    apply_sqlite_profile(engine)
+    try:
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    finally:
+        engine.dispose()
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.services.latency import LatencyTracker
+from app.services.llm_service import LLMService
+from app.services.model_router import ModelRouter
+from app.services import tokens
+from app.services.tokens import count_tokens
+
+ROUTES = {
+    "auto": {
+        "candidates": [
+            {"model": "small", "max_prompt_tokens": 50},
+            {"model": "medium", "max_prompt_tokens": 1000},
+            {"model": "large"}
+        ],
+        "latency_slo": 2,
+        "min_samples": 3
+    }
+}
+
+def make_router(**samples):
+    latency = LatencyTracker()
+    for model, seconds in samples.items():
+        for _ in range(5):
+            latency.observe(model, seconds)
+    return ModelRouter(ModelRouter.parse_routes(ROUTES), latency)
+
+def test_token_counts_are_local_and_word_aware(monkeypatch):
+    # The counts below are the approximation's; tiktoken, when installed, counts differently
+    monkeypatch.setattr(tokens, "tiktoken", None)
+    assert count_tokens("") == 0
+    assert count_tokens("The quick brown fox jumps over the lazy dog.") == 10
+    assert count_tokens(" ".join(["word"] * 100)) == 100
+    assert count_tokens("internationalization") == 4
+
+def test_unknown_names_pass_through():
+    assert make_router().resolve("gpt-4-turbo", "Hello") == "gpt-4-turbo"
+
+def test_routes_by_prompt_size():
+    router = make_router()
+    assert router.choose("auto", "short prompt") == ("small", "preferred", 2)
+    assert router.choose("auto", "word " * 200).model == "medium"
+    assert router.choose("auto", "word " * 2000).reason == "prompt_size"
+
+def test_routes_around_models_over_the_latency_slo():
+    router = make_router(small=3.0, medium=1.0)
+    assert router.choose("auto", "short prompt")[:2] == ("medium", "latency")
+    # A step with a looser SLO keeps the preferred model
+    assert router.resolve("auto", "short prompt", latency_slo=5) == "small"
+
+def test_falls_back_to_fastest_model_when_all_are_degraded():
+    router = make_router(small=4.0, medium=3.0, large=6.0)
+    assert router.choose("auto", "short prompt")[:2] == ("medium", "degraded")
+
+def test_prompt_too_long_for_every_candidate():
+    routes = ModelRouter.parse_routes({"tiny": {"candidates": [{"model": "small", "max_prompt_tokens": 5}]}})
+    with pytest.raises(ValueError):
+        ModelRouter(routes, LatencyTracker()).choose("tiny", "word " * 10)
+
+def test_service_calls_the_routed_model(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_ROUTES", json.dumps(ROUTES))
+    models = []
+
+    async def handler(request: httpx.Request):
+        models.append(json.loads(request.content)["model"])
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    service = LLMService(transport=httpx.MockTransport(handler))
+    for _ in range(3):
+        service.latency.observe("small", 10.0)
+
+    async def run():
+        await service.execute("Hello", "auto", {})
+        await service.execute("Hello", "auto", {}, latency_slo=20)
+
+    asyncio.run(run())
+    assert models == ["medium", "small"]
+    assert service.latency_stats()["routes"]["auto"]["candidates"][0]["observed_latency"] == 10.0
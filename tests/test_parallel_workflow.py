@@ -4,8 +4,10 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from unittest.mock import patch
 import asyncio
+import time
 from app.main import app
 from app.database import Base, get_db
+from app.models.workflow import Workflow, WorkflowStep
 
 TEST_DATABASE_URL = "sqlite:///./test_parallel.db"
 
@@ -124,3 +126,309 @@ def test_empty_parallel_group(client):
         results = execute_response.json()["results"]
         assert len(results) == 1
         assert results[0]["result"] == "Hello!"
+
+def test_steps_start_when_their_dependencies_finish(client):
+    workflow_data = {
+        "workflow_name": "DAG Test",
+        "steps": [
+            {
+                "step_name": "Fast",
+                "action": "llm-call",
+                "parameters": {"prompt": "fast", "model": "gpt-4-turbo"}
+            },
+            {
+                "step_name": "Slow",
+                "action": "llm-call",
+                "parameters": {"prompt": "slow", "model": "gpt-4-turbo"}
+            },
+            {
+                "step_name": "Follow Up",
+                "action": "llm-call",
+                "parameters": {"prompt": "Expand on {{Fast}}", "model": "gpt-4-turbo"}
+            },
+            {
+                "step_name": "Summary",
+                "action": "llm-call",
+                "parameters": {"prompt": "Combine {{Slow}} and {{Follow Up}}", "model": "gpt-4-turbo"}
+            }
+        ]
+    }
+    finished = []
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        await asyncio.sleep(0.3 if prompt == "slow" else 0.01)
+        finished.append(prompt)
+        return prompt.upper()
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        response = client.post("/api/v1/workflows", json=workflow_data)
+        assert response.status_code == 200
+        steps = response.json()["steps"]
+        assert [s["depends_on"] for s in steps] == [[], [], ["Fast"], ["Slow", "Follow Up"]]
+
+        execute_response = client.post(f"/api/v1/workflows/{response.json()['id']}/execute")
+        assert execute_response.status_code == 200
+
+    # "Follow Up" only needs "Fast", so it must not wait behind "Slow"
+    assert finished.index("Expand on FAST") < finished.index("slow")
+    results = execute_response.json()["results"]
+    assert [r["step_name"] for r in results] == ["Fast", "Slow", "Follow Up", "Summary"]
+    assert results[3]["result"] == "COMBINE SLOW AND EXPAND ON FAST"
+
+def test_depends_on_must_reference_earlier_step(client):
+    workflow_data = {
+        "workflow_name": "Bad Dependency",
+        "steps": [
+            {
+                "step_name": "First",
+                "action": "llm-call",
+                "parameters": {"prompt": "Hello"},
+                "depends_on": ["Second"]
+            },
+            {
+                "step_name": "Second",
+                "action": "llm-call",
+                "parameters": {"prompt": "World"}
+            }
+        ]
+    }
+
+    response = client.post("/api/v1/workflows", json=workflow_data)
+    assert response.status_code == 422
+
+def test_execution_trace_shows_critical_path(client):
+    workflow_data = {
+        "workflow_name": "Traced DAG",
+        "steps": [
+            {"step_name": "Fast", "action": "llm-call", "parameters": {"prompt": "fast"}},
+            {"step_name": "Slow", "action": "llm-call", "parameters": {"prompt": "slow"}},
+            {"step_name": "Summary", "action": "llm-call", "parameters": {"prompt": "Combine {{Fast}} and {{Slow}}"}}
+        ]
+    }
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        await asyncio.sleep(0.2 if prompt == "slow" else 0.01)
+        return prompt
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        untraced = client.post(f"/api/v1/workflows/{workflow_id}/execute").json()
+        response = client.post(f"/api/v1/workflows/{workflow_id}/execute?trace=true")
+
+    assert untraced["trace"] is None
+    assert response.status_code == 200
+    trace = response.json()["trace"]
+    summary = trace["summary"]
+    assert summary["workflow"] == "Traced DAG"
+    assert summary["critical_path"] == ["Slow", "Summary"]
+    assert summary["steps"]["Summary"]["dependency_wait_ms"] >= 150
+    assert summary["steps"]["Fast"]["status"] == "completed"
+
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    lanes = {event["name"]: event["tid"] for event in spans if event["cat"] == "step"}
+    assert len(set(lanes.values())) == 3
+    assert any(event["name"] == "wait_dependencies" and event["tid"] == lanes["Summary"] for event in spans)
+    assert any(event["name"] == "render_templates" and event["tid"] == lanes["Summary"] for event in spans)
+
+def test_map_step_fans_out_over_items(client):
+    workflow_data = {
+        "workflow_name": "Map Workflow",
+        "steps": [
+            {"step_name": "List", "action": "llm-call", "parameters": {"prompt": "List cities"}},
+            {
+                "step_name": "Describe",
+                "action": "map",
+                "parameters": {
+                    "items": "{{List}}",
+                    "concurrency": 4,
+                    "step": {
+                        "action": "llm-call",
+                        "parameters": {"prompt": "Describe {{item}} (#{{index}}) for {{List}}"}
+                    }
+                }
+            },
+            {"step_name": "Lines", "action": "map", "parameters": {
+                "items": "a\n\nb\n", "on_error": "skip",
+                "step": {"action": "llm-call", "parameters": {"prompt": "fail {{item}}"}}
+            }}
+        ]
+    }
+    in_flight = 0
+    peak = 0
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        nonlocal in_flight, peak
+        if prompt == "List cities":
+            return '["Oslo", "Lima", "Pune", "Kyiv", "Baku", "Doha"]'
+        if prompt == "fail b":
+            raise ValueError("provider refused")
+        if prompt.startswith("fail"):
+            return prompt.upper()
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return prompt.split(" (")[0].upper()
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute) as mock_execute:
+        response = client.post("/api/v1/workflows", json=workflow_data)
+        assert response.status_code == 200
+        assert response.json()["steps"][1]["depends_on"] == ["List"]
+
+        execute_response = client.post(f"/api/v1/workflows/{response.json()['id']}/execute")
+
+    results = execute_response.json()["results"]
+    assert results[1]["result"] == [
+        "DESCRIBE OSLO", "DESCRIBE LIMA", "DESCRIBE PUNE", "DESCRIBE KYIV", "DESCRIBE BAKU", "DESCRIBE DOHA"
+    ]
+    assert peak == 4
+    prompts = [call.args[0] for call in mock_execute.call_args_list]
+    assert f"Describe Oslo (#0) for {results[0]['result']}" in prompts
+    assert results[2]["result"] == ["FAIL A", None]
+
+def test_map_step_parameters_are_validated(client):
+    workflow_data = {
+        "workflow_name": "Bad Map",
+        "steps": [{"step_name": "Map", "action": "map", "parameters": {"items": "[]"}}]
+    }
+    assert client.post("/api/v1/workflows", json=workflow_data).status_code == 422
+
+def test_pool_actions_in_a_workflow(client):
+    workflow_data = {
+        "workflow_name": "Chunked Workflow",
+        "steps": [
+            {"step_name": "Document", "action": "llm-call", "parameters": {"prompt": "Write a report"}},
+            {"step_name": "Chunks", "action": "text-chunk", "parameters": {
+                "input": "{{Document}}", "size": 12, "overlap": 0
+            }},
+            {"step_name": "Summaries", "action": "map", "parameters": {
+                "items": "{{Chunks}}",
+                "step": {"action": "llm-call", "parameters": {"prompt": "Summarize: {{item}}", "output": "json"}}
+            }},
+            {"step_name": "Scores", "action": "json-select", "parameters": {
+                "input": "{{Summaries}}", "fields": ["score"]
+            }}
+        ]
+    }
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        if prompt == "Write a report":
+            return "first part second part"
+        return '{"score": %d, "text": "%s"}' % (len(prompt), prompt)
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        execute_response = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    results = {result["step_name"]: result for result in execute_response.json()["results"]}
+    assert results["Chunks"]["result"] == ["first part", "second part"]
+    assert results["Scores"]["result"] == [{"score": 21}, {"score": 22}]
+
+    modes = {entry["name"]: entry["mode"] for entry in client.get("/api/v1/actions").json()}
+    assert modes["llm-call"] == "loop" and modes["json-select"] == "thread" and modes["text-chunk"] == "process"
+
+def test_fail_fast_group_cancels_siblings_and_downstream(client):
+    workflow_data = {
+        "workflow_name": "Fail Fast",
+        "policy": {"fail_fast": ["lookups"]},
+        "steps": [
+            {"step_name": "Broken", "action": "llm-call", "parameters": {"prompt": "fail"}, "group": "lookups"},
+            {"step_name": "Slow", "action": "llm-call", "parameters": {"prompt": "slow"}, "group": "lookups"},
+            {"step_name": "Combine", "action": "llm-call", "parameters": {"prompt": "{{Slow}}"}},
+            {"step_name": "Independent", "action": "llm-call", "parameters": {"prompt": "ok"}}
+        ]
+    }
+    interrupted = []
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        if prompt == "fail":
+            await asyncio.sleep(0.05)
+            raise ValueError("provider refused")
+        if prompt == "slow":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                interrupted.append(prompt)
+                raise
+        return "done"
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        response = client.post("/api/v1/workflows", json=workflow_data)
+        assert response.json()["policy"]["fail_fast"] == ["lookups"]
+        execute_response = client.post(f"/api/v1/workflows/{response.json()['id']}/execute")
+
+    body = execute_response.json()
+    results = {result["step_name"]: result for result in body["results"]}
+    assert body["stopped"] == "fail_fast"
+    assert results["Broken"]["error"] == "provider refused"
+    assert results["Slow"]["cancelled"] and results["Combine"]["cancelled"]
+    assert results["Slow"]["error"] == "Cancelled: step Broken failed"
+    assert results["Independent"]["result"] == "done"
+    # The in-flight call was interrupted rather than left to finish
+    assert interrupted == ["slow"]
+
+    workflow_data["policy"]["fail_fast"] = ["missing"]
+    assert client.post("/api/v1/workflows", json=workflow_data).status_code == 422
+
+def test_step_and_run_timeouts(client):
+    workflow_data = {
+        "workflow_name": "Deadlines",
+        "policy": {"timeout": 0.3},
+        "steps": [
+            {"step_name": "Hung", "action": "llm-call", "parameters": {"prompt": "hang"}, "policy": {"timeout": 0.05}},
+            {"step_name": "Fast", "action": "llm-call", "parameters": {"prompt": "ok"}},
+            {"step_name": "Long", "action": "llm-call", "parameters": {"prompt": "long"}}
+        ]
+    }
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        if prompt != "ok":
+            await asyncio.sleep(5)
+        return "done"
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        execute_response = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    body = execute_response.json()
+    results = {result["step_name"]: result for result in body["results"]}
+    assert body["stopped"] == "timeout"
+    assert results["Hung"]["error"] == "Timed out after 0.05s" and not results["Hung"]["cancelled"]
+    assert results["Fast"]["result"] == "done"
+    assert results["Long"]["cancelled"] and results["Long"]["error"] == "Cancelled: run timed out after 0.3s"
+
+def test_empty_workflow_runs_to_the_end(client):
+    response = client.post("/api/v1/workflows", json={"workflow_name": "Empty", "steps": []})
+    execute_response = client.post(f"/api/v1/workflows/{response.json()['id']}/execute")
+
+    assert execute_response.status_code == 200
+    assert execute_response.json()["stopped"] is None
+    assert execute_response.json()["results"] == []
+
+def test_deadlines_hold_for_repeated_step_names(client, test_db):
+    steps = [
+        {"step_name": "A", "action": "llm-call", "parameters": {"prompt": "hang"}},
+        {"step_name": "A", "action": "llm-call", "parameters": {"prompt": "ok"}}
+    ]
+    invalid = client.post("/api/v1/workflows", json={"workflow_name": "Repeated", "steps": steps})
+    assert invalid.status_code == 422
+
+    # Workflows stored before names had to be unique still run
+    workflow = Workflow(workflow_name="Repeated", policy={"timeout": 0.3, "fail_fast": False})
+    workflow.steps = [WorkflowStep(order=order, **step) for order, step in enumerate(steps)]
+    test_db.add(workflow)
+    test_db.commit()
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        if prompt == "hang":
+            await asyncio.sleep(3)
+        return "done"
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        started = time.perf_counter()
+        execute_response = client.post(f"/api/v1/workflows/{workflow.id}/execute")
+        elapsed = time.perf_counter() - started
+
+    body = execute_response.json()
+    assert body["stopped"] == "timeout" and elapsed < 2
+    assert [(result["result"], result["cancelled"]) for result in body["results"]] == [("", True), ("done", False)]
@@ -0,0 +1,74 @@
+import asyncio
+from app.services.rate_limiter import AdmissionController, TokenBucket
+
+def test_global_and_per_model_concurrency_caps():
+    controller = AdmissionController(
+        max_concurrency=4, model_concurrency=2, model_limits={"big": {"concurrency": 1}}
+    )
+    in_flight = {"small": 0, "big": 0, "total": 0}
+    peaks = {"small": 0, "big": 0, "total": 0}
+
+    async def call(model):
+        async with controller.admit(model, 10):
+            in_flight[model] += 1
+            in_flight["total"] += 1
+            for name in peaks:
+                peaks[name] = max(peaks[name], in_flight[name])
+            await asyncio.sleep(0.01)
+            in_flight[model] -= 1
+            in_flight["total"] -= 1
+
+    async def run():
+        await asyncio.gather(*[call("small") for _ in range(6)], *[call("big") for _ in range(4)])
+
+    asyncio.run(run())
+    assert peaks == {"small": 2, "big": 1, "total": 3}
+    assert controller.stats()["in_flight"] == 0
+
+def test_waiters_are_served_round_robin_across_keys():
+    controller = AdmissionController(max_concurrency=1)
+    order = []
+
+    async def call(key, index):
+        async with controller.admit("gpt-4-turbo", 10, key=key):
+            order.append(f"{key}{index}")
+            await asyncio.sleep(0.001)
+
+    async def run():
+        tasks = [asyncio.create_task(call("a", i)) for i in range(4)]
+        tasks += [asyncio.create_task(call("b", i)) for i in range(2)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    # The large workflow "a" does not hold the gate until all of its calls are done
+    assert order.index("b1") < order.index("a3")
+
+def test_cancelled_waiter_frees_its_place():
+    controller = AdmissionController(max_concurrency=1)
+
+    async def hold(event):
+        async with controller.admit("gpt-4-turbo", 10):
+            await event.wait()
+
+    async def run():
+        event = asyncio.Event()
+        holder = asyncio.create_task(hold(event))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(asyncio.Event()))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        event.set()
+        await holder
+        async with controller.admit("gpt-4-turbo", 10):
+            pass
+
+    asyncio.run(asyncio.wait_for(run(), timeout=1))
+    assert controller.stats()["in_flight"] == 0
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(60) == 0
+    bucket.consume(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+    # Requests larger than the bucket are clamped rather than waiting forever
+    assert bucket.wait_time(1000) <= 60
@@ -0,0 +1,102 @@
+import asyncio
+import time
+import pytest
+from app.services.latency import LatencyTracker
+from app.services.llm_service import TransientLLMError
+from app.services.resilience import call_with_hedging, call_with_retry, iter_bounded
+
+def is_transient(e):
+    return isinstance(e, TransientLLMError)
+
+def flaky(failures, error=TransientLLMError):
+    calls = {"count": 0}
+
+    async def call():
+        calls["count"] += 1
+        if calls["count"] <= failures:
+            raise error("try again")
+        return "ok"
+
+    return call, calls
+
+def test_retries_transient_errors():
+    call, calls = flaky(2)
+    result = asyncio.run(call_with_retry(call, is_transient, max_attempts=3, initial_backoff=0.001))
+    assert result == "ok"
+    assert calls["count"] == 3
+
+def test_does_not_retry_permanent_errors():
+    call, calls = flaky(1, error=ValueError)
+    with pytest.raises(ValueError):
+        asyncio.run(call_with_retry(call, is_transient, max_attempts=3, initial_backoff=0.001))
+    assert calls["count"] == 1
+
+def test_gives_up_after_max_attempts():
+    call, calls = flaky(5)
+    with pytest.raises(TransientLLMError):
+        asyncio.run(call_with_retry(call, is_transient, max_attempts=2, initial_backoff=0.001))
+    assert calls["count"] == 2
+
+def test_deadline_bounds_total_time():
+    async def slow():
+        await asyncio.sleep(1)
+
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        asyncio.run(call_with_retry(slow, is_transient, deadline=0.05))
+    assert time.perf_counter() - start < 0.5
+
+def test_hedged_request_wins_over_slow_primary():
+    delays = [1.0, 0.01]
+
+    async def call():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    start = time.perf_counter()
+    assert asyncio.run(call_with_hedging(call, delay=0.05)) == 0.01
+    assert time.perf_counter() - start < 0.5
+
+def test_latency_quantile():
+    tracker = LatencyTracker(window=100)
+    for i in range(1, 101):
+        tracker.observe("gpt-4-turbo", i / 100)
+    assert tracker.quantile("gpt-4-turbo", 0.95) == 0.95
+    assert tracker.quantile("gpt-4-turbo", 0.95, min_samples=200) is None
+    assert tracker.quantile("other", 0.95) is None
+
+def test_bounded_iteration_limits_concurrency_and_cancels_on_close():
+    running, peak, cancelled = 0, 0, []
+
+    async def call(index, item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(5 if item == "stuck" else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        finally:
+            running -= 1
+        if item == "bad":
+            raise ValueError("bad item")
+        return item.upper()
+
+    async def run():
+        outcomes = [
+            (index, result, str(error) if error else None)
+            async for index, result, error in iter_bounded(["a", "bad", "c", "d"], call, 2)
+        ]
+        bounded_peak = peak
+        partial = iter_bounded(["a", "stuck", "stuck"], call, 3)
+        first = await partial.__anext__()
+        await partial.aclose()
+        return sorted(outcomes), bounded_peak, first
+
+    outcomes, bounded_peak, first = asyncio.run(run())
+    assert outcomes == [(0, "A", None), (1, None, "bad item"), (2, "C", None), (3, "D", None)]
+    assert bounded_peak == 2 and first == (0, "A", None)
+    # Closing early cancelled the calls still running
+    assert sorted(cancelled) == [1, 2]
@@ -0,0 +1,208 @@
+import asyncio
+import multiprocessing
+import time
+import httpx
+from app.services.llm_service import LLMService
+from app.services.rate_limiter import AdmissionController
+from app.services.shared_state import RELEASE_SCRIPT, MemoryState, RedisState, SQLiteState
+
+class RedisStandIn:
+    """In-process server speaking the subset of the Redis protocol that RedisState uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def _execute(self, command, args):
+        if command in ("AUTH", "SELECT"):
+            return "+OK"
+        if command == "GET":
+            entry = self._live(args[0])
+            return entry[0] if entry else None
+        if command == "SET":
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            if "NX" in options and self._live(key):
+                return None
+            expires = time.time() + int(args[2 + options.index("PX") + 1]) / 1000 if "PX" in options else None
+            self.data[key] = (value, expires)
+            return "+OK"
+        if command == "INCRBY":
+            entry = self._live(args[0]) or ("0", None)
+            value = int(entry[0]) + int(args[1])
+            self.data[args[0]] = (str(value), entry[1])
+            return value
+        if command == "PEXPIRE":
+            entry = self._live(args[0])
+            if entry:
+                self.data[args[0]] = (entry[0], time.time() + int(args[1]) / 1000)
+            return int(bool(entry))
+        if command == "DEL":
+            return int(self.data.pop(args[0], None) is not None)
+        if command == "EVAL" and args[0] == RELEASE_SCRIPT:
+            entry = self._live(args[2])
+            if entry and entry[0] == args[3]:
+                del self.data[args[2]]
+                return 1
+            return 0
+        return f"-ERR unknown command {command}"
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                args = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode())
+                reply = self._execute(args[0].upper(), args[1:])
+                if reply is None:
+                    writer.write(b"$-1\r\n")
+                elif isinstance(reply, int):
+                    writer.write(b":%d\r\n" % reply)
+                elif reply[0] in "+-":
+                    writer.write(reply.encode() + b"\r\n")
+                else:
+                    data = reply.encode()
+                    writer.write(b"$%d\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+        finally:
+            writer.close()
+
+async def exercise(state):
+    assert await state.get("missing") is None
+    assert await state.set("lease", "a", ttl=0.1, only_if_absent=True)
+    assert not await state.set("lease", "b", ttl=0.1, only_if_absent=True)
+    assert not await state.delete("lease", only_if_value="b")
+    assert await state.get("lease") == "a"
+    await asyncio.sleep(0.15)
+    assert await state.get("lease") is None
+    assert await state.set("lease", "b", only_if_absent=True)
+    assert await state.delete("lease", only_if_value="b")
+
+    assert await state.incr("counter", 5, ttl=10) == 5
+    assert await state.incr("counter", -2) == 3
+    assert await state.get("counter") == "3"
+
+def test_memory_state():
+    asyncio.run(exercise(MemoryState()))
+
+def test_sqlite_state(tmp_path):
+    asyncio.run(exercise(SQLiteState(str(tmp_path / "state.db"))))
+
+def test_redis_state_against_stand_in():
+    async def run():
+        stand_in = RedisStandIn()
+        port = await stand_in.start()
+        state = RedisState.from_url(f"redis://:secret@127.0.0.1:{port}/1")
+        try:
+            await exercise(state)
+        finally:
+            await state.close()
+            await stand_in.stop()
+
+    asyncio.run(run())
+
+def _count(path: str, times: int):
+    state = SQLiteState(path)
+
+    async def run():
+        for _ in range(times):
+            await state.incr("hits")
+
+    asyncio.run(run())
+
+def test_sqlite_state_is_atomic_across_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    # Spawned rather than forked: SQLite connections must not be carried across fork()
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_count, args=(path, 50)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+
+    assert asyncio.run(SQLiteState(path).get("hits")) == "200"
+
+def test_identical_calls_are_deduplicated_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(request)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "shared answer"}}]})
+
+    path = str(tmp_path / "state.db")
+    # Two services with their own state connections stand in for two worker processes
+    workers = [
+        LLMService(transport=httpx.MockTransport(handler), shared_state=SQLiteState(path))
+        for _ in range(2)
+    ]
+    workers[1].worker_id = "other-host:1"
+
+    async def run():
+        return await asyncio.gather(*[worker.execute("Hello", "gpt-4-turbo", {}) for worker in workers])
+
+    assert asyncio.run(run()) == ["shared answer", "shared answer"]
+    assert len(calls) == 1
+
+def test_sequential_identical_calls_each_reach_the_provider(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"answer {len(calls)}"}}]})
+
+    path = str(tmp_path / "state.db")
+    workers = [
+        LLMService(transport=httpx.MockTransport(handler), shared_state=SQLiteState(path))
+        for _ in range(2)
+    ]
+    workers[1].worker_id = "other-host:1"
+
+    async def run():
+        # Each call starts after the previous one finished, so there is no flight to join
+        return [await worker.execute("Hello", "gpt-4-turbo", {}) for worker in workers]
+
+    assert asyncio.run(run()) == ["answer 1", "answer 2"]
+    assert len(calls) == 2
+
+def test_rate_limits_are_shared_across_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    # 120 requests per minute in half-second windows allows one call per window
+    controllers = [
+        AdmissionController(rpm=120, shared=SQLiteState(path), shared_window=0.5)
+        for _ in range(2)
+    ]
+
+    async def call(controller):
+        async with controller.admit("gpt-4-turbo", 10):
+            return time.monotonic()
+
+    async def run():
+        started = time.monotonic()
+        admitted = await asyncio.gather(*[call(controllers[i % 2]) for i in range(3)])
+        return sorted(at - started for at in admitted)
+
+    admitted = asyncio.run(run())
+    # The local buckets alone would admit all three at once; shared windows admit one per window
+    assert admitted[2] - admitted[0] >= 0.45
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from unittest.mock import patch
+from app.main import app
+from app.database import Base, get_db
+from app.services.llm_service import LLMService
+
+TEST_DATABASE_URL = "sqlite:///./test_streaming.db"
+
+engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def client(test_db):
+    def override_get_db():
+        try:
+            yield test_db
+        finally:
+            test_db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+async def fake_stream(self, prompt, model="gpt-4-turbo", parameters=None, use_cache=True, cache_ttl=None, **kwargs):
+    for token in prompt.split():
+        yield token + " "
+
+def test_llm_service_stream_parses_provider_chunks(monkeypatch):
+    chunks = [
+        {"choices": [{"delta": {"role": "assistant"}}]},
+        {"choices": [{"delta": {"content": "Hel"}}]},
+        {"choices": [{"delta": {"content": "lo"}}]}
+    ]
+    body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+
+    async def handler(request: httpx.Request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    service = LLMService(transport=httpx.MockTransport(handler))
+
+    async def collect():
+        return [token async for token in service.stream("Hi")]
+
+    assert asyncio.run(collect()) == ["Hel", "lo"]
+
+def test_execute_llm_stream(client):
+    with patch.object(LLMService, "stream", fake_stream):
+        response = client.post("/api/v1/execute-llm/stream", json={"prompt": "one two"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert parse_events(response.text) == [
+        ("token", {"token": "one "}),
+        ("token", {"token": "two "}),
+        ("completed", {"result": "one two "})
+    ]
+
+def test_workflow_stream_reports_each_step(client):
+    workflow_data = {
+        "workflow_name": "Streaming Workflow",
+        "steps": [
+            {"step_name": "Ask", "action": "llm-call", "parameters": {"prompt": "Is it raining?"}},
+            {
+                "step_name": "Umbrella",
+                "action": "llm-call",
+                "parameters": {"prompt": "Pack an umbrella"},
+                "condition": {"type": "equals", "step_name": "Ask", "value": "yes"}
+            },
+            {"step_name": "Broken", "action": "unknown-action", "parameters": {}}
+        ]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.return_value = "no"
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        response = client.post(f"/api/v1/workflows/{workflow_id}/execute/stream")
+
+    events = parse_events(response.text)
+    names = [(event, data.get("step_name")) for event, data in events[:-1]]
+    assert ("step_completed", "Ask") in names
+    assert ("step_skipped", "Umbrella") in names
+    assert ("step_error", "Broken") in names
+    assert names.index(("step_started", "Ask")) < names.index(("step_completed", "Ask"))
+    assert events[-1][0] == "workflow_completed"
+    assert len(events[-1][1]["results"]) == 3
+
+def test_workflow_stream_forwards_tokens(client):
+    workflow_data = {
+        "workflow_name": "Token Workflow",
+        "steps": [{"step_name": "Poem", "action": "llm-call", "parameters": {"prompt": "roses are red"}}]
+    }
+
+    with patch.object(LLMService, "stream", fake_stream):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        response = client.post(f"/api/v1/workflows/{workflow_id}/execute/stream?tokens=true")
+
+    events = parse_events(response.text)
+    tokens = [data["token"] for event, data in events if event == "token"]
+    assert tokens == ["roses ", "are ", "red "]
+    assert events[-1][1]["results"][0]["result"] == "roses are red "
+
+def test_workflow_stream_missing_workflow(client):
+    assert client.post("/api/v1/workflows/999/execute/stream").status_code == 404
+
+def test_execute_llm_batch(client):
+    async def fake_execute(self, prompt, model="gpt-4-turbo", parameters=None, **kwargs):
+        if prompt == "Translate bad":
+            raise ValueError("rejected")
+        return prompt.upper()
+
+    with patch.object(LLMService, "execute", fake_execute):
+        response = client.post("/api/v1/execute-llm/batch", json={
+            "template": "Translate {{word}}",
+            "inputs": [{"word": "one"}, {"word": "bad"}, {"word": "two"}]
+        })
+        streamed = client.post("/api/v1/execute-llm/batch/stream", json={"prompts": ["a", "b"]})
+        invalid = [
+            client.post("/api/v1/execute-llm/batch", json=body)
+            for body in (
+                {"prompts": ["a"], "template": "x", "inputs": []},
+                {"prompts": ["a"], "template": "x"},
+                {"template": "x"}
+            )
+        ]
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"index": 0, "result": "TRANSLATE ONE"},
+        {"index": 1, "error": "rejected"},
+        {"index": 2, "result": "TRANSLATE TWO"}
+    ]
+    events = parse_events(streamed.text)
+    assert sorted(data["index"] for name, data in events if name == "result") == [0, 1]
+    assert events[-1] == ("completed", {"count": 2, "errors": 0})
+    assert [response.status_code for response in invalid] == [422, 422, 422]
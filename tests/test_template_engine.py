@@ -0,0 +1,37 @@
+from app.services.template_engine import CompiledParameters, compile_template
+
+def test_render_replaces_references_in_one_pass():
+    template = compile_template("Summarize {{Step 1}} and {{ Step 2 }}.")
+    assert template.references == ["Step 1", "Step 2"]
+    assert template.render({"Step 1": "alpha", "Step 2": "beta"}) == "Summarize alpha and beta."
+
+def test_step_names_with_regex_characters():
+    template = compile_template("Answer: {{Q (a+b)?}}")
+    assert template.render({"Q (a+b)?": "42"}) == "Answer: 42"
+
+def test_results_are_inserted_literally():
+    template = compile_template("Path: {{Step}}")
+    assert template.render({"Step": r"C:\new\1"}) == r"Path: C:\new\1"
+
+def test_unknown_references_are_left_as_written():
+    template = compile_template("Hello {{ Later Step }}")
+    assert template.render({}) == "Hello {{ Later Step }}"
+
+def test_compiled_parameters_render_only_strings():
+    parameters = CompiledParameters({"prompt": "Use {{A}} then {{B}} and {{A}}", "temperature": 0.2})
+    assert parameters.references == ["A", "B"]
+    assert parameters.render({"A": "x", "B": "y"}) == {"prompt": "Use x then y and x", "temperature": 0.2}
+
+def test_field_references_select_into_structured_results():
+    template = compile_template("{{Plan.title}}: {{Plan.tasks[1].name}} {{Plan.missing}}")
+    assert template.references == ["Plan", "Plan.title", "Plan.tasks[1].name", "Plan.missing"]
+    plan = {"title": "Launch", "tasks": [{"name": "write"}, {"name": "ship"}]}
+    assert template.render({"Plan": plan}) == "Launch: ship {{Plan.missing}}"
+
+def test_whole_structured_results_render_as_json():
+    template = compile_template("Data: {{Plan}} {{Count}}")
+    assert template.render({"Plan": {"a": [1, "é"]}, "Count": 3}) == 'Data: {"a": [1, "é"]} 3'
+
+def test_step_names_containing_dots_still_resolve():
+    template = compile_template("Version {{v1.2}}")
+    assert template.render({"v1.2": "notes"}) == "Version notes"
@@ -1,6 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.database import Base, get_db
@@ -78,3 +78,107 @@ def test_get_workflow(client):
     assert response.status_code == 200
     data = response.json()
     assert data["workflow_name"] == "Test Workflow"
+
+def create_workflows(client, count, steps_per_workflow=3):
+    for i in range(count):
+        client.post("/api/v1/workflows", json={
+            "workflow_name": f"Workflow {i}",
+            "steps": [
+                {"step_name": f"Step {j}", "action": "llm-call", "parameters": {"prompt": "Hi"}}
+                for j in range(steps_per_workflow)
+            ]
+        })
+
+def test_list_workflows_loads_steps_in_bulk(client):
+    create_workflows(client, 5)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/api/v1/workflows")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert all(len(w["steps"]) == 3 for w in response.json())
+    # One query for the workflows and one for all of their steps
+    assert len(statements) == 2
+
+def test_list_workflows_cursor_pagination(client):
+    create_workflows(client, 5, steps_per_workflow=1)
+
+    first_page = client.get("/api/v1/workflows?limit=2")
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get(f"/api/v1/workflows?limit=2&cursor={cursor}")
+    third_page = client.get(f"/api/v1/workflows?limit=2&cursor={second_page.headers['X-Next-Cursor']}")
+
+    names = [w["workflow_name"] for page in (first_page, second_page, third_page) for w in page.json()]
+    assert names == [f"Workflow {i}" for i in range(5)]
+    assert "X-Next-Cursor" not in third_page.headers
+
+def test_list_workflows_summary_mode(client):
+    create_workflows(client, 2)
+
+    response = client.get("/api/v1/workflows?fields=summary")
+    assert response.status_code == 200
+    for workflow in response.json():
+        assert "steps" not in workflow
+        assert set(workflow) == {"id", "workflow_name", "version", "created_at"}
+
+def test_bulk_import_workflows(client):
+    payload = {
+        "workflows": [
+            {
+                "workflow_name": f"Imported {i}",
+                "steps": [
+                    {"step_name": "A", "action": "llm-call", "parameters": {"prompt": "Hi"}},
+                    {"step_name": "B", "action": "llm-call", "parameters": {"prompt": "Use {{A}}"}}
+                ]
+            }
+            for i in range(3)
+        ]
+    }
+
+    response = client.post("/api/v1/workflows/bulk", json=payload)
+    assert response.status_code == 200
+    workflows = response.json()
+    assert [w["workflow_name"] for w in workflows] == ["Imported 0", "Imported 1", "Imported 2"]
+    assert all([s["depends_on"] for s in w["steps"]] == [[], ["A"]] for w in workflows)
+    assert len(client.get("/api/v1/workflows").json()) == 3
+
+def test_update_only_touches_changed_steps(client):
+    original = {
+        "workflow_name": "Diff Workflow",
+        "steps": [
+            {"step_name": "Keep", "action": "llm-call", "parameters": {"prompt": "Same"}},
+            {"step_name": "Edit", "action": "llm-call", "parameters": {"prompt": "Old"}},
+            {"step_name": "Drop", "action": "llm-call", "parameters": {"prompt": "Bye"}}
+        ]
+    }
+    created = client.post("/api/v1/workflows", json=original).json()
+    ids = {s["step_name"]: s["id"] for s in created["steps"]}
+
+    edited = {
+        "workflow_name": "Diff Workflow",
+        "steps": [
+            {"step_name": "Keep", "action": "llm-call", "parameters": {"prompt": "Same"}},
+            {"step_name": "Edit", "action": "llm-call", "parameters": {"prompt": "New"}},
+            {"step_name": "Add", "action": "llm-call", "parameters": {"prompt": "Hello"}}
+        ]
+    }
+    updated = client.put(f"/api/v1/workflows/{created['id']}", json=edited).json()
+
+    steps = {s["step_name"]: s for s in updated["steps"]}
+    assert set(steps) == {"Keep", "Edit", "Add"}
+    assert steps["Keep"]["id"] == ids["Keep"]
+    assert steps["Edit"]["id"] == ids["Edit"]
+    assert steps["Edit"]["parameters"]["prompt"] == "New"
+    assert updated["version"] == 2
+
+    # Saving an identical definition is a no-op and keeps the version
+    unchanged = client.put(f"/api/v1/workflows/{created['id']}", json=edited).json()
+    assert unchanged["version"] == 2
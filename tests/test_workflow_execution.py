@@ -1,9 +1,13 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from unittest.mock import patch
 from app.main import app
 from app.database import Base, get_db
+from app.models.workflow import StepCheckpoint, Workflow, WorkflowStep
+from app.routes.workflow import workflow_service
+from app.services.llm_service import TransientLLMError
 
 TEST_DATABASE_URL = "sqlite:///./test_execution.db"
 
@@ -107,3 +111,287 @@ def test_list_workflows(client):
     listed_names = [w["workflow_name"] for w in workflows]
     for name in workflow_names:
         assert name in listed_names
+
+def test_step_retry_policy(client):
+    workflow_data = {
+        "workflow_name": "Retry Workflow",
+        "steps": [
+            {
+                "step_name": "Flaky Step",
+                "action": "llm-call",
+                "parameters": {"prompt": "Hello", "model": "gpt-4-turbo"},
+                "policy": {"retry": {"max_attempts": 3, "initial_backoff": 0.001}}
+            }
+        ]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = [TransientLLMError("rate limited"), "Recovered"]
+
+        create_response = client.post("/api/v1/workflows", json=workflow_data)
+        assert create_response.status_code == 200
+        assert create_response.json()["steps"][0]["policy"]["retry"]["max_attempts"] == 3
+
+        workflow_id = create_response.json()["id"]
+        execute_response = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    assert execute_response.status_code == 200
+    assert execute_response.json()["results"][0]["result"] == "Recovered"
+    assert mock_execute.call_count == 2
+
+def test_skipped_branch_is_pruned(client):
+    workflow_data = {
+        "workflow_name": "Pruned Workflow",
+        "steps": [
+            {
+                "step_name": "Classify",
+                "action": "llm-call",
+                "parameters": {"prompt": "Score this ticket as JSON", "model": "gpt-4-turbo"}
+            },
+            {
+                "step_name": "Escalate",
+                "action": "llm-call",
+                "parameters": {"prompt": "Draft an escalation", "model": "gpt-4-turbo"},
+                "condition": {
+                    "type": "and",
+                    "conditions": [
+                        {"type": "gte", "step_name": "Classify", "key": "result.score", "value": 8},
+                        {"type": "regex", "step_name": "Classify", "key": "result.team", "value": "^billing$"}
+                    ]
+                }
+            },
+            {
+                "step_name": "Notify",
+                "action": "llm-call",
+                "parameters": {"prompt": "Summarize {{Escalate}}", "model": "gpt-4-turbo"}
+            },
+            {
+                "step_name": "Fallback",
+                "action": "llm-call",
+                "parameters": {"prompt": "Reply directly", "model": "gpt-4-turbo"},
+                "condition": {"type": "equals", "step_name": "Escalate", "key": "skipped", "value": True}
+            }
+        ]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = ['{"score": 3, "team": "billing"}', "Direct reply"]
+
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        execute_response = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    assert execute_response.status_code == 200
+    results = {result["step_name"]: result for result in execute_response.json()["results"]}
+    assert results["Escalate"]["skipped"] is True
+    assert results["Notify"]["skipped"] is True
+    assert results["Fallback"]["result"] == "Direct reply"
+    assert mock_execute.call_count == 2
+
+def test_structured_results_and_field_references(client):
+    workflow_data = {
+        "workflow_name": "Structured Workflow",
+        "steps": [
+            {
+                "step_name": "Extract",
+                "action": "llm-call",
+                "parameters": {"prompt": "Extract the order", "output": "json"}
+            },
+            {
+                "step_name": "Confirm",
+                "action": "llm-call",
+                "parameters": {"prompt": "Confirm {{Extract.items[0].sku}} for {{Extract.customer}}"},
+                "condition": {"type": "gt", "step_name": "Extract", "key": "result.total", "value": 10}
+            }
+        ]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = [
+            '```json\n{"customer": "Ada", "total": 12.5, "items": [{"sku": "A-1"}]}\n```',
+            "Confirmed"
+        ]
+        response = client.post("/api/v1/workflows", json=workflow_data)
+        assert response.json()["steps"][1]["depends_on"] == ["Extract"]
+        execute_response = client.post(f"/api/v1/workflows/{response.json()['id']}/execute")
+
+    results = execute_response.json()["results"]
+    assert results[0]["result"] == {"customer": "Ada", "total": 12.5, "items": [{"sku": "A-1"}]}
+    assert mock_execute.call_args_list[1].args[0] == "Confirm A-1 for Ada"
+    assert results[1]["result"] == "Confirmed"
+
+    invalid = dict(workflow_data, steps=[dict(workflow_data["steps"][0], parameters={"prompt": "x", "output": "xml"})])
+    assert client.post("/api/v1/workflows", json=invalid).status_code == 422
+
+def test_large_results_are_returned_by_handle(client):
+    from app.routes.workflow import workflow_service
+
+    workflow_data = {
+        "workflow_name": "Large Results",
+        "steps": [
+            {"step_name": "Big", "action": "llm-call", "parameters": {"prompt": "Write a lot"}},
+            {"step_name": "Again", "action": "llm-call", "parameters": {"prompt": "Write a lot again"}},
+            {"step_name": "Small", "action": "llm-call", "parameters": {"prompt": "Count {{Big}}"}}
+        ]
+    }
+    payload = "x" * 200
+
+    with patch.object(workflow_service.result_store, "inline_limit", 100), \
+            patch.object(workflow_service.result_store, "get", wraps=workflow_service.result_store.get) as load, \
+            patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = [payload, payload, "short"]
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        execute_response = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    big, again, small = execute_response.json()["results"]
+    assert big["result"] is None and big["result_size"] == 200
+    assert big["result_handle"].startswith("sha256:")
+    assert again["result_handle"] == big["result_handle"]
+    assert small["result"] == "short" and small["result_handle"] is None
+    # Stored as soon as its step finished; the step reading it loaded the full value back
+    assert [call.args[1] for call in load.call_args_list] == [big["result_handle"]]
+    assert mock_execute.call_args_list[2].args[0] == f"Count {payload}"
+
+    stored = client.get(f"/api/v1/results/{big['result_handle']}")
+    assert stored.status_code == 200
+    assert stored.json() == {"handle": big["result_handle"], "size": 200, "value": payload}
+    assert client.get("/api/v1/results/sha256:missing").status_code == 404
+
+def test_result_store_errors_fail_only_the_step(client):
+    from app.routes.workflow import workflow_service
+
+    workflow_data = {
+        "workflow_name": "Result Store Errors",
+        "steps": [
+            {"step_name": "Big", "action": "llm-call", "parameters": {"prompt": "Write a lot"}},
+            {"step_name": "Reader", "action": "llm-call", "parameters": {"prompt": "Count {{Big}}"}},
+            {"step_name": "Other", "action": "llm-call", "parameters": {"prompt": "Hello"}}
+        ]
+    }
+    store = workflow_service.result_store
+
+    with patch.object(store, "inline_limit", 100), patch.object(store, "get", return_value=None), \
+            patch('app.services.workflow_service.LLMService.execute', side_effect=["x" * 200, "short"]):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        missing = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    assert missing.status_code == 200
+    big, reader, other = missing.json()["results"]
+    assert big["result_handle"] is not None and reader["error"].endswith("is missing")
+    assert other["result"] == "short"
+
+    with patch.object(store, "inline_limit", 100), patch.object(store, "put", side_effect=RuntimeError("disk full")), \
+            patch('app.services.workflow_service.LLMService.execute', return_value="x" * 200):
+        unwritable = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+    assert unwritable.status_code == 200
+    assert unwritable.json()["results"][0]["error"] == "disk full"
+
+def test_reuse_recomputes_only_changed_and_failed_steps(client):
+    workflow_data = {
+        "workflow_name": "Incremental Workflow",
+        "steps": [
+            {"step_name": "Draft", "action": "llm-call", "parameters": {"prompt": "Draft a post"}},
+            {"step_name": "Review", "action": "llm-call", "parameters": {"prompt": "Review {{Draft}}"}},
+            {"step_name": "Title", "action": "llm-call", "parameters": {"prompt": "Suggest a title"}}
+        ]
+    }
+
+    async def first_run(prompt, model, parameters, **kwargs):
+        if prompt.startswith("Review"):
+            raise ValueError("provider refused")
+        return prompt.upper()
+
+    with patch.object(workflow_service.checkpoint_store, "enabled", True):
+        with patch('app.services.workflow_service.LLMService.execute', side_effect=first_run):
+            workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+            results = client.post(f"/api/v1/workflows/{workflow_id}/execute").json()["results"]
+        assert results[1]["error"] == "provider refused"
+
+        # Resume: only the failed step runs again
+        with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+            mock_execute.side_effect = ["Looks good"]
+            results = client.post(f"/api/v1/workflows/{workflow_id}/execute?reuse=true").json()["results"]
+        assert [call.args[0] for call in mock_execute.call_args_list] == ["Review DRAFT A POST"]
+        assert [result["reused"] for result in results] == [True, False, True]
+        assert results[0]["result"] == "DRAFT A POST"
+
+        # Edit one prompt: the edited step and the step reading its output are recomputed
+        workflow_data["steps"][0]["parameters"]["prompt"] = "Draft a short post"
+        client.put(f"/api/v1/workflows/{workflow_id}", json=workflow_data)
+        with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+            mock_execute.side_effect = ["Short draft", "Still good"]
+            results = client.post(f"/api/v1/workflows/{workflow_id}/execute?reuse=true").json()["results"]
+        assert [call.args[0] for call in mock_execute.call_args_list] == ["Draft a short post", "Review Short draft"]
+        assert [result["reused"] for result in results] == [False, False, True]
+
+        # Without reuse every step runs
+        with patch('app.services.workflow_service.LLMService.execute', return_value="x") as mock_execute:
+            client.post(f"/api/v1/workflows/{workflow_id}/execute")
+        assert mock_execute.call_count == 3
+
+def test_checkpoints_are_off_by_default(client, test_db):
+    workflow_data = {
+        "workflow_name": "Uncheckpointed Workflow",
+        "steps": [{"step_name": "Draft", "action": "llm-call", "parameters": {"prompt": "Draft a post"}}]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute', return_value="x") as mock_execute:
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        client.post(f"/api/v1/workflows/{workflow_id}/execute")
+        reused = client.post(f"/api/v1/workflows/{workflow_id}/execute?reuse=true")
+        streamed = client.post(f"/api/v1/workflows/{workflow_id}/execute/stream?reuse=true")
+
+    assert mock_execute.call_count == 1
+    assert test_db.query(StepCheckpoint).count() == 0
+    # Reuse is refused instead of silently recomputing every step
+    assert reused.status_code == 409 and "WORKFLOW_CHECKPOINTS" in reused.json()["detail"]
+    assert streamed.status_code == 409
+
+def test_cached_plan_needs_only_a_version_check(client, test_db):
+    workflow_data = {
+        "workflow_name": "Hot Workflow",
+        "steps": [
+            {"step_name": "Ask", "action": "llm-call", "parameters": {"prompt": "Hello"}},
+            {"step_name": "Answer", "action": "llm-call", "parameters": {"prompt": "Reply to {{Ask}}"}}
+        ]
+    }
+    statements, before_first_call = [], []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        if not before_first_call:
+            before_first_call.extend(statements)
+        return "Hi"
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute) as mock_execute:
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        client.post(f"/api/v1/workflows/{workflow_id}/execute")
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.post(f"/api/v1/workflows/{workflow_id}/execute")
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+    assert [result["result"] for result in response.json()["results"]] == ["Hi", "Hi"]
+    assert mock_execute.call_args_list[-1].args[0] == "Reply to Hi"
+    # Steps started after a single query that reads the version
+    assert len(before_first_call) == 1
+    assert "workflows.version" in before_first_call[0] and "workflow_steps" not in before_first_call[0]
+
+    # An update through the API replaces the plan
+    workflow_data["steps"][1]["parameters"]["prompt"] = "Answer {{Ask}}"
+    client.put(f"/api/v1/workflows/{workflow_id}", json=workflow_data)
+    with patch('app.services.workflow_service.LLMService.execute', return_value="Hi") as mock_execute:
+        client.post(f"/api/v1/workflows/{workflow_id}/execute")
+    assert mock_execute.call_args_list[-1].args[0] == "Answer Hi"
+
+    # So does a new version written by another process
+    step = test_db.query(WorkflowStep).filter(WorkflowStep.step_name == "Answer").one()
+    step.parameters = {"prompt": "Summarize {{Ask}}"}
+    test_db.query(Workflow).filter(Workflow.id == workflow_id).update({"version": Workflow.version + 1})
+    test_db.commit()
+    with patch('app.services.workflow_service.LLMService.execute', return_value="Hi") as mock_execute:
+        client.post(f"/api/v1/workflows/{workflow_id}/execute")
+    assert mock_execute.call_args_list[-1].args[0] == "Summarize Hi"
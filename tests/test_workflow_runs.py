@@ -0,0 +1,266 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from unittest.mock import patch
+from app.main import app
+from app.database import Base, get_db
+from app.models.workflow import WorkflowRun
+from app.routes.workflow import run_service, workflow_service
+from datetime import datetime, timedelta
+
+TEST_DATABASE_URL = "sqlite:///./test_runs.db"
+
+engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def client():
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    original_factory = run_service.session_factory
+    original_poll = run_service.poll_interval
+    original_sweep = run_service.sweep_interval
+    run_service.session_factory = TestingSessionLocal
+    run_service.poll_interval = 0.05
+    run_service.sweep_interval = 0.05
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        run_service.session_factory = original_factory
+        run_service.poll_interval = original_poll
+        run_service.sweep_interval = original_sweep
+        app.dependency_overrides.clear()
+        Base.metadata.drop_all(bind=engine)
+
+def wait_for_run(client, run_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        run = client.get(f"/api/v1/runs/{run_id}").json()
+        if run["status"] in ("completed", "failed", "cancelled"):
+            return run
+        time.sleep(0.02)
+    raise AssertionError(f"Run {run_id} did not finish")
+
+def test_background_run_persists_results(client):
+    workflow_data = {
+        "workflow_name": "Background Workflow",
+        "steps": [
+            {"step_name": "Step 1", "action": "llm-call", "parameters": {"prompt": "Hello"}},
+            {"step_name": "Step 2", "action": "llm-call", "parameters": {"prompt": "Reply to {{Step 1}}"}}
+        ]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = ["Hi", "Hi back"]
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+
+        response = client.post(f"/api/v1/workflows/{workflow_id}/runs")
+        assert response.status_code == 202
+        assert response.json()["status"] == "queued"
+
+        run = wait_for_run(client, response.json()["id"])
+
+    assert run["status"] == "completed"
+    assert run["workflow_version"] == 1
+    assert [(s["step_name"], s["result"]) for s in run["steps"]] == [("Step 1", "Hi"), ("Step 2", "Hi back")]
+    assert run["started_at"] is not None and run["finished_at"] is not None
+
+    runs = client.get(f"/api/v1/workflows/{workflow_id}/runs").json()
+    assert [r["id"] for r in runs] == [run["id"]]
+
+def test_run_for_missing_workflow(client):
+    assert client.post("/api/v1/workflows/999/runs").status_code == 404
+    assert client.get("/api/v1/runs/999").status_code == 404
+
+def test_traced_run_stores_trace(client):
+    workflow_data = {
+        "workflow_name": "Traced Background Workflow",
+        "steps": [{"step_name": "Step 1", "action": "llm-call", "parameters": {"prompt": "Hello"}}]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.return_value = "Hi"
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        untraced = client.post(f"/api/v1/workflows/{workflow_id}/runs").json()
+        traced = client.post(f"/api/v1/workflows/{workflow_id}/runs?trace=true").json()
+        wait_for_run(client, untraced["id"])
+        run = wait_for_run(client, traced["id"])
+
+    assert run["traced"] is True
+    trace = client.get(f"/api/v1/runs/{run['id']}/trace").json()
+    assert trace["summary"]["steps"]["Step 1"]["status"] == "completed"
+    assert any(event["name"] == "Step 1" for event in trace["traceEvents"])
+    assert client.get(f"/api/v1/runs/{untraced['id']}/trace").status_code == 404
+
+def test_resume_reuses_completed_steps(client):
+    workflow_data = {
+        "workflow_name": "Resumable Workflow",
+        "steps": [
+            {"step_name": "Step 1", "action": "llm-call", "parameters": {"prompt": "Hello"}},
+            {"step_name": "Step 2", "action": "llm-call", "parameters": {"prompt": "Reply to {{Step 1}}"}}
+        ]
+    }
+
+    checkpoints = patch.object(workflow_service.checkpoint_store, "enabled", True)
+    with checkpoints, patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = ["Hi", ValueError("provider refused")]
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        run_id = client.post(f"/api/v1/workflows/{workflow_id}/runs").json()["id"]
+        run = wait_for_run(client, run_id)
+    assert run["steps"][1]["error"] == "provider refused"
+
+    with checkpoints, patch('app.services.workflow_service.LLMService.execute') as mock_execute:
+        mock_execute.side_effect = ["Hi back"]
+        response = client.post(f"/api/v1/runs/{run_id}/resume")
+        assert response.status_code == 202
+        assert response.json()["reuse"] is True
+        resumed = wait_for_run(client, response.json()["id"])
+
+    assert mock_execute.call_count == 1
+    assert [(step["result"], step["reused"]) for step in resumed["steps"]] == [("Hi", True), ("Hi back", False)]
+    assert client.post("/api/v1/runs/999/resume").status_code == 404
+
+def test_resume_needs_checkpoints(client):
+    workflow_data = {
+        "workflow_name": "Uncheckpointed Runs",
+        "steps": [{"step_name": "Step 1", "action": "llm-call", "parameters": {"prompt": "Hello"}}]
+    }
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=ValueError("provider refused")):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        run = wait_for_run(client, client.post(f"/api/v1/workflows/{workflow_id}/runs").json()["id"])
+
+    resumed = client.post(f"/api/v1/runs/{run['id']}/resume")
+    assert resumed.status_code == 409 and "WORKFLOW_CHECKPOINTS" in resumed.json()["detail"]
+    assert client.post(f"/api/v1/workflows/{workflow_id}/runs?reuse=true").status_code == 409
+    assert client.post("/api/v1/runs/999/resume").status_code == 404
+    assert [r["id"] for r in client.get(f"/api/v1/workflows/{workflow_id}/runs").json()] == [run["id"]]
+
+def test_runs_of_unresponsive_workers_are_requeued(client):
+    workflow_data = {
+        "workflow_name": "Orphaned Workflow",
+        "steps": [{"step_name": "Step 1", "action": "llm-call", "parameters": {"prompt": "Hello"}}]
+    }
+    workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+
+    db = TestingSessionLocal()
+    stale = datetime.utcnow() - timedelta(seconds=run_service.lease * 2)
+    orphan = WorkflowRun(
+        workflow_id=workflow_id, status="running", owner="gone-host:1", started_at=stale, heartbeat_at=stale
+    )
+    db.add(orphan)
+    db.commit()
+    run_id = orphan.id
+
+    with patch('app.services.workflow_service.LLMService.execute', return_value="Hi"):
+        run = wait_for_run(client, run_id)
+
+    assert run["status"] == "completed"
+    assert run["owner"] == run_service.worker_id
+    assert run["steps"][0]["result"] == "Hi"
+
+    # A late write from the previous owner is dropped
+    db.query(WorkflowRun).filter(WorkflowRun.id == run_id).update({"owner": "gone-host:1", "status": "running"})
+    db.commit()
+    run_service._record_failure(db, run_id, "late failure")
+    db.expire_all()
+    assert db.query(WorkflowRun).filter(WorkflowRun.id == run_id).first().status == "running"
+    db.close()
+
+def test_idle_sweep_only_reads(client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = TestingSessionLocal()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        run_service._requeue_stale(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        db.close()
+
+    assert statements and all(statement.lstrip().startswith("SELECT") for statement in statements)
+
+def test_running_run_can_be_cancelled(client):
+    workflow_data = {
+        "workflow_name": "Cancellable Workflow",
+        "steps": [
+            {"step_name": "Step 1", "action": "llm-call", "parameters": {"prompt": "Hello"}},
+            {"step_name": "Step 2", "action": "llm-call", "parameters": {"prompt": "Reply to {{Step 1}}"}}
+        ]
+    }
+    started, interrupted = [], []
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        started.append(prompt)
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            interrupted.append(prompt)
+            raise
+        return "late"
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        run_id = client.post(f"/api/v1/workflows/{workflow_id}/runs").json()["id"]
+        deadline = time.time() + 5
+        while not started and time.time() < deadline:
+            time.sleep(0.02)
+
+        response = client.post(f"/api/v1/runs/{run_id}/cancel")
+        assert response.status_code == 202
+        assert response.json()["cancel_requested"] is True
+        run = wait_for_run(client, run_id)
+
+    assert run["status"] == "cancelled"
+    assert interrupted == ["Hello"]
+    assert [(step["cancelled"], step["error"]) for step in run["steps"]] == [
+        (True, "Cancelled: run was cancelled"), (True, "Cancelled: run was cancelled")
+    ]
+    assert client.post("/api/v1/runs/999/cancel").status_code == 404
+
+def test_fail_fast_run_is_recorded_as_failed(client):
+    workflow_data = {
+        "workflow_name": "Fail Fast Run",
+        "policy": {"fail_fast": True},
+        "steps": [
+            {"step_name": "Broken", "action": "llm-call", "parameters": {"prompt": "fail"}},
+            {"step_name": "Slow", "action": "llm-call", "parameters": {"prompt": "slow"}}
+        ]
+    }
+
+    async def fake_execute(prompt, model, parameters, **kwargs):
+        if prompt == "fail":
+            raise ValueError("provider refused")
+        await asyncio.sleep(5)
+        return "late"
+
+    with patch('app.services.workflow_service.LLMService.execute', side_effect=fake_execute):
+        workflow_id = client.post("/api/v1/workflows", json=workflow_data).json()["id"]
+        run = wait_for_run(client, client.post(f"/api/v1/workflows/{workflow_id}/runs").json()["id"])
+
+    assert run["status"] == "failed"
+    assert run["error"] == "Step Broken failed; unfinished steps were cancelled"
+    assert [(step["step_name"], step["cancelled"]) for step in run["steps"]] == [("Broken", False), ("Slow", True)]
+
+def test_run_of_empty_workflow_completes(client):
+    workflow_id = client.post("/api/v1/workflows", json={"workflow_name": "Empty", "steps": []}).json()["id"]
+
+    run = wait_for_run(client, client.post(f"/api/v1/workflows/{workflow_id}/runs").json()["id"])
+
+    assert run["status"] == "completed"
+    assert run["error"] is None and run["steps"] == []